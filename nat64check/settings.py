@@ -104,6 +104,33 @@ USE_I18N = True
 USE_L10N = True
 USE_TZ = True
 
+# Caches
+# https://docs.djangoproject.com/en/1.10/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rendered pages, shared between the web server processes and the test workers that invalidate them
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'pages'),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+PAGE_CACHE = 'pages'
+
+# How long clients may cache the page of the latest measurement of a URL before revalidating
+LATEST_MEASUREMENT_MAX_AGE = 300
+
+# Progress streams open at the same time, each one keeps a web server process busy. Pages reload themselves when
+# all of them are taken.
+PROGRESS_MAX_STREAMS = 10
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/1.10/howto/static-files/
 
@@ -115,10 +142,61 @@ STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.ManifestStaticFilesSto
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Let the front-end web server send media files: None (Django sends them), 'x-sendfile' (Apache with mod_xsendfile,
+# lighttpd) or 'x-accel-redirect' (nginx). For nginx MEDIA_ACCEL_REDIRECT_URL must be an internal location that
+# points to MEDIA_ROOT.
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_REDIRECT_URL = '/protected-media/'
+
+# Dotted path of a function(request, name) that decides whether a media file may be shown, None allows everything
+MEDIA_ACCESS_CHECK = None
+
 # Defaults
 IMAGE_WIDTH = 1024
 IMAGE_HEIGHT = 1024
 
+# Scaled down versions of the screenshots: name -> (max width, max height)
+SCREENSHOT_RENDITIONS = {
+    'small': (320, 320),
+    'medium': (640, 640),
+}
+
+# A retry only runs the legs that failed when the results of the other legs are no older than this many seconds
+RETRY_REUSE_MAX_AGE = 6 * 60 * 60
+
+# Relative share of the workers for each priority class of tests, as long as there are tests of that class
+QUEUE_WEIGHTS = {
+    'interactive': 64,
+    'monitoring': 16,
+    'bulk': 4,
+    'retry': 1,
+}
+
+# Never run more than this many tests against the same host at the same time
+QUEUE_HOST_CONCURRENCY = 2
+
+# A worker must renew its claim on a test within this many seconds, or the test is given to another worker. Workers
+# renew their claims every third of this time.
+WORKER_LEASE_TIME = 300
+
+# How management commands log: 'console' (human readable) or 'json' (one JSON object per line, with the worker and
+# the measurement that every line belongs to)
+LOG_FORMAT = 'console'
+
+# Addresses that may read the metrics at /v6score/metrics/, for Prometheus
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Workers push their own metrics to this Prometheus Pushgateway after every test, None to disable
+METRICS_PUSHGATEWAY_URL = None
+
+# Screenshots are re-encoded losslessly before they are stored: 'png' (optimized) or 'webp' (denser, not supported
+# by all browsers)
+SCREENSHOT_FORMAT = 'png'
+
+# Screenshots are appended to segment files of about this size
+SCREENSHOT_PACK_ROOT = os.path.join(BASE_DIR, 'packs')
+SCREENSHOT_PACK_SEGMENT_SIZE = 256 * 1024 * 1024
+
 SSH_USERNAME = 'sander'
 SSH_PRIVATE_KEY = os.path.join(BASE_DIR, 'ssh', 'id_rsa')
 SSH_KNOWN_HOSTS = os.path.join(BASE_DIR, 'ssh', 'known_hosts')
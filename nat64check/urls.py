@@ -13,16 +13,18 @@ Including another URL conf
     1. Import the include() function: from django.conf.urls import url, include
     2. Add a URL to urlpatterns:  url(r'^blog/', include('blog.urls'))
 """
+import re
+
 from django.conf import settings
 from django.conf.urls import url, include
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.views.generic.base import RedirectView
 
+from v6score.views import serve_media
+
 urlpatterns = [
     url(r'^$', RedirectView.as_view(permanent=True, url='/v6score/')),
     url(r'^admin/', admin.site.urls),
     url(r'^v6score/', include('v6score.urls')),
+    url(r'^{}(?P<path>.*)$'.format(re.escape(settings.MEDIA_URL.lstrip('/'))), serve_media, name='media'),
 ]
-
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
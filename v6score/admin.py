@@ -1,14 +1,16 @@
 import yaml
 from django.contrib import admin
 from django.utils import timezone
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
 from django.utils.safestring import mark_safe
 from pygments import highlight
 from pygments.formatters.html import HtmlFormatter
 from pygments.lexers.data import YamlLexer
 
-from v6score.filter import RetryFilter, StateFilter, score_filter
-from v6score.models import Measurement
+from v6score.filter import AliveFilter, RetryFilter, StateFilter, score_filter
+from v6score.models import Measurement, ScanRun, TIMING_PHASES, Worker
+from v6score.notifications import notify_workers
+from v6score.renditions import get_rendition_url
 
 
 def show_score(score):
@@ -49,15 +51,16 @@ class InlineMeasurement(admin.TabularInline):
 
 @admin.register(Measurement)
 class MeasurementAdmin(admin.ModelAdmin):
-    list_display = ('url', 'manual', 'admin_is_retry',
+    list_display = ('url', 'manual', 'priority', 'admin_is_retry',
                     'requested', 'started', 'finished',
                     'admin_v6only_image_score', 'admin_nat64_image_score',
                     'admin_v6only_resource_score', 'admin_nat64_resource_score')
     date_hierarchy = 'finished'
-    list_filter = ('manual', RetryFilter, StateFilter,
+    list_filter = ('manual', 'priority', 'prescreen_pending', 'scan_run', RetryFilter, StateFilter,
                    score_filter('v6only_image_score'), score_filter('nat64_image_score'),
                    score_filter('v6only_resource_score'), score_filter('nat64_resource_score'))
-    readonly_fields = ('requested', 'admin_images_inline',
+    readonly_fields = ('requested', 'scan_run', 'phase', 'worker', 'lease_expires', 'retry_legs', 'reused_legs',
+                       'prescreen_pending', 'prescreen_results', 'admin_timings', 'admin_images_inline',
                        'v6only_image_score', 'nat64_image_score',
                        'v6only_resource_score', 'nat64_resource_score',
                        'admin_v4only_resources', 'admin_v6only_resources', 'admin_nat64_resources',
@@ -72,7 +75,12 @@ class MeasurementAdmin(admin.ModelAdmin):
 
     fieldsets = [
         ('Test', {
-            'fields': ('url', 'manual', 'requested', 'started', 'finished')
+            'fields': ('url', 'manual', 'priority', 'scan_run', 'requested', 'started', 'finished', 'phase',
+                       'worker', 'lease_expires', 'retry_legs', 'reused_legs')
+        }),
+        ('Prescreen', {
+            'fields': ('prescreen_pending', 'prescreen_results'),
+            'classes': ['collapse'],
         }),
         ('Results', {
             'fields': (('v6only_image_score', 'nat64_image_score'),
@@ -85,6 +93,10 @@ class MeasurementAdmin(admin.ModelAdmin):
         ('Images', {
             'fields': ('admin_images_inline',)
         }),
+        ('Timings', {
+            'fields': ('admin_timings',),
+            'classes': ['collapse'],
+        }),
         ('Raw IPv4 data', {
             'fields': ('admin_v4only_data', 'v4only_debug'),
             'classes': ['collapse'],
@@ -102,7 +114,7 @@ class MeasurementAdmin(admin.ModelAdmin):
     # noinspection PyMethodMayBeStatic
     def mark_pending_as_manual(self, request, queryset):
         pending = queryset.filter(started=None)
-        pending.update(manual=True)
+        pending.update(manual=True, prescreen_pending=False)
         self.message_user(request, "{} pending measurements marked as manual".format(pending.count()))
 
     # noinspection PyMethodMayBeStatic
@@ -111,10 +123,14 @@ class MeasurementAdmin(admin.ModelAdmin):
         for measurement in queryset:
             new_measurement = Measurement(url=measurement.url,
                                           requested=timezone.now(),
-                                          retry_for=measurement)
+                                          retry_for=measurement,
+                                          priority=Measurement.PRIORITY_INTERACTIVE)
             new_measurement.save()
             count += 1
 
+        if count:
+            notify_workers()
+
         self.message_user(request, "{} measurements rescheduled".format(count))
 
     def admin_is_retry(self, obj):
@@ -123,6 +139,27 @@ class MeasurementAdmin(admin.ModelAdmin):
     admin_is_retry.short_description = 'is retry'
     admin_is_retry.boolean = True
 
+    # noinspection PyMethodMayBeStatic
+    def admin_timings(self, measurement):
+        if not measurement.timings:
+            return '-'
+
+        # Known phases in the order they happen, anything else after that
+        phases = [phase for phase in TIMING_PHASES if phase in measurement.timings]
+        phases += sorted(phase for phase in measurement.timings if phase not in TIMING_PHASES)
+
+        # The browsers render at the same time, only the one that took longest adds to the total
+        renders = [seconds for phase, seconds in measurement.timings.items() if phase.startswith('render_')]
+        total = sum(seconds for phase, seconds in measurement.timings.items() if not phase.startswith('render_'))
+        total += max(renders, default=0)
+
+        rows = format_html_join('', "<tr><th>{}</th><td style='text-align: right'>{}s</td></tr>",
+                                ((phase, '{:.3f}'.format(measurement.timings[phase])) for phase in phases))
+        return format_html("<table>{}<tr><th>total</th><td style='text-align: right'>{}s</td></tr></table>",
+                           rows, '{:.3f}'.format(total))
+
+    admin_timings.short_description = 'timings'
+
     def admin_v6only_image_score(self, obj):
         return show_score(obj.v6only_image_score)
 
@@ -144,7 +181,13 @@ class MeasurementAdmin(admin.ModelAdmin):
     admin_nat64_resource_score.short_description = 'nat64 resource score'
 
     def admin_images_inline(self, measurement):
-        img = """<a href="{1}" target="_blank"><img style="width: 100%" alt="{0}" src="{1}"></a>"""
+        img = """<a href="{1}" target="_blank"><img style="width: 100%" alt="{0}" src="{2}"></a>"""
+
+        def image(alt, field_file):
+            # Show the small rendition, and link to the original
+            if not field_file:
+                return ''
+            return img.format(alt, field_file.url, get_rendition_url(field_file, 'small'))
 
         return mark_safe("""
             <table style="border:0; width: 100%;">
@@ -160,9 +203,9 @@ class MeasurementAdmin(admin.ModelAdmin):
                 </tr>
             </table>
         """.format(
-            v4only_image=img.format("IPv4-only", measurement.v4only_image.url) if measurement.v4only_image else '',
-            v6only_image=img.format("IPv6-only", measurement.v6only_image.url) if measurement.v6only_image else '',
-            nat64_image=img.format("NAT64", measurement.nat64_image.url) if measurement.nat64_image else '',
+            v4only_image=image("IPv4-only", measurement.v4only_image),
+            v6only_image=image("IPv6-only", measurement.v6only_image),
+            nat64_image=image("NAT64", measurement.nat64_image),
         ))
 
     def admin_v4only_resources(self, measurement):
@@ -238,3 +281,79 @@ class MeasurementAdmin(admin.ModelAdmin):
     admin_nat64_data.short_description = 'nat64 data'
 
     admin_images_inline.short_description = 'Images'
+
+
+@admin.register(Worker)
+class WorkerAdmin(admin.ModelAdmin):
+    list_display = ('hostname', 'pid', 'admin_alive', 'started', 'last_heartbeat', 'current_measurement',
+                    'tests_finished', 'admin_tests_per_hour')
+    list_filter = (AliveFilter, 'hostname')
+    list_select_related = ('current_measurement',)
+    readonly_fields = ('hostname', 'pid', 'started', 'last_heartbeat', 'stopped', 'current_measurement',
+                       'tests_finished', 'admin_tests_per_hour')
+    ordering = ('-last_heartbeat',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def admin_alive(self, worker):
+        return worker.alive
+
+    admin_alive.short_description = 'alive'
+    admin_alive.boolean = True
+
+    def admin_tests_per_hour(self, worker):
+        return '{:0.1f}'.format(worker.tests_per_hour)
+
+    admin_tests_per_hour.short_description = 'tests per hour'
+
+
+@admin.register(ScanRun)
+class ScanRunAdmin(admin.ModelAdmin):
+    list_display = ('name', 'state', 'created', 'import_complete', 'admin_progress', 'admin_tests_per_hour',
+                    'admin_eta')
+    list_filter = ('state', 'import_complete')
+    readonly_fields = ('source', 'created', 'state', 'rows_imported', 'import_complete',
+                       'admin_progress', 'admin_tests_per_hour', 'admin_eta')
+    actions = ('pause', 'resume', 'cancel')
+    search_fields = ('name', 'source')
+
+    def has_add_permission(self, request):
+        # Scan runs are created by the import_tests command
+        return False
+
+    # noinspection PyMethodMayBeStatic
+    def pause(self, request, queryset):
+        for scan_run in queryset:
+            scan_run.pause()
+        self.message_user(request, "{} scan runs paused".format(queryset.filter(state=ScanRun.STATE_PAUSED).count()))
+
+    # noinspection PyMethodMayBeStatic
+    def resume(self, request, queryset):
+        for scan_run in queryset:
+            scan_run.resume()
+        self.message_user(request, "{} scan runs running".format(queryset.filter(state=ScanRun.STATE_RUNNING).count()))
+
+    # noinspection PyMethodMayBeStatic
+    def cancel(self, request, queryset):
+        removed = 0
+        for scan_run in queryset:
+            removed += scan_run.cancel()
+        self.message_user(request, "{} scan runs cancelled, {} tests removed from the queue".format(queryset.count(),
+                                                                                                   removed))
+
+    def admin_progress(self, scan_run):
+        counts = scan_run.progress()
+        return '{finished} of {total} finished, {running} running, {pending} pending'.format(**counts)
+
+    admin_progress.short_description = 'progress'
+
+    def admin_tests_per_hour(self, scan_run):
+        return '{:0.1f}'.format(scan_run.tests_per_hour())
+
+    admin_tests_per_hour.short_description = 'tests per hour'
+
+    def admin_eta(self, scan_run):
+        return scan_run.eta() or '-'
+
+    admin_eta.short_description = 'expected to finish'
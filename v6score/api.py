@@ -0,0 +1,260 @@
+"""
+Version 1 of the JSON API. Payloads are compact by default: the summary of a measurement only has its status,
+timestamps and scores, the details are in its results. Every response has an ETag, so clients that poll can send
+If-None-Match and get an empty 304 when nothing changed.
+"""
+import base64
+import binascii
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.urlresolvers import reverse
+from django.db.models.query_utils import Q
+from django.http.response import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_http_methods
+
+from v6score.forms import URLForm
+from v6score.models import IMAGE_FIELDS, LEGS, Measurement, PING_FIELDS
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Maximum number of measurements in one batch lookup
+MAX_BATCH_SIZE = 500
+
+# Only these are needed for a summary, leave the big JSON documents in the database
+SUMMARY_FIELDS = ('id', 'url', 'requested', 'started', 'finished',
+                  'v6only_image_score', 'nat64_image_score',
+                  'v6only_resource_score', 'nat64_resource_score')
+
+
+def api_response(request, data, status=200):
+    """
+    A compact JSON response with an ETag based on the content
+    """
+    content = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')).encode('utf-8')
+    etag = '"{}"'.format(hashlib.sha1(content).hexdigest())
+
+    response = None
+    if status == 200:
+        response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, status=status, content_type='application/json')
+
+    response['ETag'] = etag
+    return response
+
+
+def api_error(message, status=400, **details):
+    data = dict(details, error=message)
+    return HttpResponse(json.dumps(data), status=status, content_type='application/json')
+
+
+def measurement_status(measurement):
+    if measurement.finished:
+        return 'finished'
+    elif measurement.started:
+        return 'running'
+    else:
+        return 'queued'
+
+
+def measurement_summary(request, measurement):
+    return {
+        'id': measurement.pk,
+        'url': measurement.url,
+        'status': measurement_status(measurement),
+        'requested': measurement.requested,
+        'started': measurement.started,
+        'finished': measurement.finished,
+        'scores': {
+            'v6only_image': measurement.v6only_image_score,
+            'nat64_image': measurement.nat64_image_score,
+            'v6only_resource': measurement.v6only_resource_score,
+            'nat64_resource': measurement.nat64_resource_score,
+        },
+        'links': {
+            'self': request.build_absolute_uri(reverse('api_measurement', args=(measurement.pk,))),
+            'results': request.build_absolute_uri(reverse('api_measurement_results', args=(measurement.pk,))),
+            'page': request.build_absolute_uri(measurement.get_absolute_url()),
+        },
+    }
+
+
+def measurement_results(request, measurement):
+    data = measurement_summary(request, measurement)
+    data['dns'] = {
+        'ipv4': [str(address) for address in measurement.ipv4_dns_results],
+        'ipv6': [str(address) for address in measurement.ipv6_dns_results],
+    }
+    data['ping'] = dict((field.replace('_latencies', ''), getattr(measurement, field)) for field in PING_FIELDS)
+
+    data['resources'] = {}
+    for leg, leg_name, host_setting in LEGS:
+        if getattr(measurement, '{}_data'.format(leg_name)) is None:
+            # This leg didn't run
+            data['resources'][leg_name] = None
+            continue
+
+        ok, error = getattr(measurement, '{}_resources'.format(leg_name))
+        data['resources'][leg_name] = {
+            'ok': ok,
+            'error': error,
+        }
+
+    data['images'] = {}
+    for field in IMAGE_FIELDS:
+        image = getattr(measurement, field)
+        data['images'][field.replace('_image', '')] = request.build_absolute_uri(image.url) if image else None
+
+    for leg, leg_name, host_setting in LEGS:
+        data['links']['{}_data'.format(leg_name)] = request.build_absolute_uri(
+            reverse('measurement_data', args=(measurement.pk, leg_name)))
+    data['links']['resources'] = request.build_absolute_uri(
+        reverse('measurement_resources', args=(measurement.pk,)))
+
+    return data
+
+
+def encode_cursor(measurement):
+    position = '{}|{}'.format(measurement.finished.isoformat(), measurement.pk)
+    return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        finished, measurement_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        finished = parse_datetime(finished)
+        measurement_id = int(measurement_id)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+    if finished is None:
+        raise ValueError("Invalid cursor")
+
+    return finished, measurement_id
+
+
+def submit_measurement(request):
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body.decode('utf-8'))
+        except ValueError:
+            return api_error("Invalid JSON")
+        if not isinstance(data, dict):
+            return api_error("Expected a JSON object")
+    else:
+        data = request.POST
+
+    # The same validation and normalisation as the form on the overview page
+    url_form = URLForm(data)
+    if not url_form.is_valid():
+        return api_error("Invalid request", errors=url_form.errors)
+
+    measurement = Measurement.objects.get_measurement_for_url(url_form.cleaned_data['url'],
+                                                              url_form.cleaned_data['force_new'])
+
+    response = api_response(request, measurement_summary(request, measurement),
+                            status=200 if measurement.finished else 202)
+    response['Location'] = request.build_absolute_uri(reverse('api_measurement', args=(measurement.pk,)))
+    return response
+
+
+def lookup_measurements(request, ids):
+    try:
+        ids = [int(measurement_id) for measurement_id in ids.split(',') if measurement_id.strip()]
+    except ValueError:
+        return api_error("Measurement IDs must be numbers")
+
+    if len(ids) > MAX_BATCH_SIZE:
+        return api_error("Too many measurement IDs, the maximum is {}".format(MAX_BATCH_SIZE))
+
+    measurements = Measurement.objects.only(*SUMMARY_FIELDS).in_bulk(ids)
+    return api_response(request, {
+        'results': [measurement_summary(request, measurements[measurement_id])
+                    for measurement_id in ids if measurement_id in measurements],
+        'missing': [measurement_id for measurement_id in ids if measurement_id not in measurements],
+    })
+
+
+def list_measurements(request):
+    try:
+        limit = int(request.GET.get('limit', PAGE_SIZE))
+    except ValueError:
+        return api_error("The limit must be a number")
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        return api_error("The limit must be between 1 and {}".format(MAX_PAGE_SIZE))
+
+    # The same filters as the overview page
+    measurements = (Measurement.objects
+                    .overview(search=request.GET.get('search', '').strip(),
+                              test=request.GET.get('test', '').strip(),
+                              score=request.GET.get('score', '').strip())
+                    .only(*SUMMARY_FIELDS)
+                    .order_by('-finished', '-id'))
+
+    # Continue after the last measurement of the previous page, new measurements don't shift the pages
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            finished, measurement_id = decode_cursor(cursor)
+        except ValueError as e:
+            return api_error(str(e))
+        measurements = measurements.filter(Q(finished__lt=finished) | Q(finished=finished, id__lt=measurement_id))
+
+    # One extra to see whether there is a next page
+    page = list(measurements[:limit + 1])
+
+    next_url = None
+    if len(page) > limit:
+        page = page[:limit]
+        query = request.GET.copy()
+        query['cursor'] = encode_cursor(page[-1])
+        next_url = request.build_absolute_uri('{}?{}'.format(request.path, query.urlencode()))
+
+    return api_response(request, {
+        'results': [measurement_summary(request, measurement) for measurement in page],
+        'next': next_url,
+    })
+
+
+@csrf_exempt
+@gzip_page
+@require_http_methods(['GET', 'HEAD', 'POST'])
+def api_measurements(request):
+    """
+    List the latest results, look up a batch of measurements with ?ids=1,2,3 or request a test with a POST
+    """
+    if request.method == 'POST':
+        return submit_measurement(request)
+
+    ids = request.GET.get('ids')
+    if ids is not None:
+        return lookup_measurements(request, ids)
+
+    return list_measurements(request)
+
+
+@gzip_page
+@require_http_methods(['GET', 'HEAD'])
+def api_measurement(request, measurement_id):
+    measurement = Measurement.objects.only(*SUMMARY_FIELDS).filter(pk=measurement_id).first()
+    if measurement is None:
+        return api_error("Measurement not found", status=404)
+
+    return api_response(request, measurement_summary(request, measurement))
+
+
+@gzip_page
+@require_http_methods(['GET', 'HEAD'])
+def api_measurement_results(request, measurement_id):
+    measurement = Measurement.objects.filter(pk=measurement_id).first()
+    if measurement is None:
+        return api_error("Measurement not found", status=404)
+
+    return api_response(request, measurement_results(request, measurement))
@@ -0,0 +1,85 @@
+import hashlib
+import uuid
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import patch_cache_control
+
+# Finished measurements never change, so let clients and proxies keep them
+CACHE_FOREVER = 365 * 24 * 60 * 60
+
+# Fragments of old generations are never used again, don't let them pile up
+OVERVIEW_FRAGMENT_TIMEOUT = 24 * 60 * 60
+
+OVERVIEW_GENERATION_KEY = 'overview-generation'
+
+
+def get_page_cache():
+    return caches[settings.PAGE_CACHE]
+
+
+def measurement_page_key(measurement_id):
+    return 'measurement-page-{}'.format(measurement_id)
+
+
+def get_measurement_page(measurement_id):
+    return get_page_cache().get(measurement_page_key(measurement_id))
+
+
+def set_measurement_page(measurement, content: bytes):
+    page = {
+        'etag': '"{}"'.format(hashlib.sha1(content).hexdigest()),
+        'last_modified': measurement.finished,
+        'latest': measurement.latest,
+        'content': content,
+    }
+    get_page_cache().set(measurement_page_key(measurement.pk), page, timeout=None)
+    return page
+
+
+def invalidate_measurement_pages(measurement_ids):
+    keys = [measurement_page_key(measurement_id) for measurement_id in measurement_ids]
+    if keys:
+        get_page_cache().delete_many(keys)
+
+
+def get_overview_generation():
+    generation = get_page_cache().get(OVERVIEW_GENERATION_KEY)
+    if generation is None:
+        # Never seen or evicted: start a new generation, we don't know which fragments are still valid
+        generation = invalidate_overview()
+    return generation
+
+
+def invalidate_overview():
+    generation = uuid.uuid4().hex
+    get_page_cache().set(OVERVIEW_GENERATION_KEY, generation, timeout=None)
+    return generation
+
+
+def overview_fragment_key(generation, **filters):
+    filter_key = urlencode(sorted(filters.items()))
+    return 'overview-{}-{}'.format(generation, hashlib.md5(filter_key.encode('utf-8')).hexdigest())
+
+
+def overview_count_key(generation, **filters):
+    filter_key = urlencode(sorted(filters.items()))
+    return 'overview-count-{}-{}'.format(generation, hashlib.md5(filter_key.encode('utf-8')).hexdigest())
+
+
+def get_overview_fragment(key):
+    return get_page_cache().get(key)
+
+
+def set_overview_fragment(key, content):
+    get_page_cache().set(key, content, timeout=OVERVIEW_FRAGMENT_TIMEOUT)
+
+
+def cache_forever(response, private=False):
+    if private:
+        # Only for the eyes of this visitor, but it still never changes
+        patch_cache_control(response, private=True, max_age=CACHE_FOREVER, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=CACHE_FOREVER, immutable=True)
+
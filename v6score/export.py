@@ -0,0 +1,149 @@
+"""
+Export measurement results in bulk. Everything is computed by PostgreSQL, and rows are read through a server-side
+cursor and written out one by one, so memory use doesn't depend on the number of measurements.
+"""
+import csv
+import sys
+import uuid
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+
+from v6score.models import LEGS, Measurement, PING_FIELDS
+
+# Number of rows fetched from the server-side cursor at a time
+CHUNK_SIZE = 2000
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+EXPORT_FIELDS = ('id', 'url', 'requested', 'started', 'finished',
+                 'v6only_image_score', 'nat64_image_score',
+                 'v6only_resource_score', 'nat64_resource_score')
+
+
+def export_expressions():
+    """
+    The computed export columns and the SQL for them
+    """
+    table = connection.ops.quote_name(Measurement._meta.db_table)
+
+    def column(name):
+        return '{}.{}'.format(table, connection.ops.quote_name(name))
+
+    expressions = []
+    for leg, leg_name, host_setting in LEGS:
+        # Like Measurement.v4only_resources and friends
+        resources = "jsonb_each(coalesce({}->'resources', '{{}}'))".format(column('{}_data'.format(leg_name)))
+        # A resource without an error field failed, any falsy one means it loaded, like in Python
+        ok = ("coalesce(value->>'stage' = 'end' AND value ? 'error' "
+              "AND value->'error' IN ('false', 'null', '0', '\"\"', '[]', '{}'), false)")
+        expressions.append(('{}_resources_ok'.format(leg_name),
+                            'SELECT count(*) FROM {} AS resource(key, value) WHERE {}'.format(resources, ok)))
+        expressions.append(('{}_resources_error'.format(leg_name),
+                            'SELECT count(*) FROM {} AS resource(key, value) WHERE NOT {}'.format(resources, ok)))
+
+    for family in (4, 6):
+        expressions.append(('ipv{}_addresses'.format(family),
+                            'SELECT count(*) FROM unnest({}) AS address '
+                            'WHERE family(address) = {}'.format(column('dns_results'), family)))
+
+    for field in PING_FIELDS:
+        # -1 is a lost ping, -2 a filtered one
+        name = field.replace('_latencies', '')
+        expressions.append(('{}_average'.format(name),
+                            'SELECT avg(latency) FROM unnest({}) AS latency '
+                            'WHERE latency >= 0'.format(column(field))))
+        expressions.append(('{}_lost'.format(name),
+                            'SELECT count(*) FROM unnest({}) AS latency '
+                            'WHERE latency < 0'.format(column(field))))
+
+    return expressions
+
+
+def export_queryset(queryset):
+    """
+    Select the export columns of the measurements in the queryset, keeping its filters and ordering. Returns the
+    queryset and the names of the columns.
+    """
+    expressions = export_expressions()
+    queryset = queryset.annotate(**dict((name, RawSQL(sql, ())) for name, sql in expressions))
+    columns = EXPORT_FIELDS + tuple(name for name, sql in expressions)
+    return queryset.values_list(*columns), columns
+
+
+def stream_rows(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Yield the rows of the queryset, reading them through a server-side cursor
+    """
+    sql, params = queryset.query.sql_with_params()
+
+    # A server-side cursor only lives as long as its transaction
+    with transaction.atomic():
+        connection.ensure_connection()
+        cursor = connection.connection.cursor(name='export_{}'.format(uuid.uuid4().hex))
+        cursor.itersize = chunk_size
+        try:
+            cursor.execute(sql, params)
+            for row in cursor:
+                yield row
+        finally:
+            cursor.close()
+
+
+class LineBuffer:
+    """
+    Lets csv.writer hand back the lines it writes instead of storing them
+    """
+
+    @staticmethod
+    def write(value):
+        return value
+
+
+def csv_lines(columns, rows):
+    writer = csv.writer(LineBuffer())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def jsonl_lines(columns, rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(columns, row))) + '\n'
+
+
+def export_lines(queryset, export_format):
+    """
+    The export of the measurements in the queryset in the given format, as a generator of lines
+    """
+    queryset, columns = export_queryset(queryset)
+    rows = stream_rows(queryset)
+
+    if export_format == 'csv':
+        return csv_lines(columns, rows)
+    elif export_format == 'jsonl':
+        return jsonl_lines(columns, rows)
+    else:
+        raise ValueError("Unknown export format {}".format(export_format))
+
+
+def write_export(queryset, export_format, filename):
+    """
+    Write the export of the measurements in the queryset to a file, or to stdout for '-'. Returns the number of lines.
+    """
+    output = sys.stdout if filename == '-' else open(filename, 'w', newline='')
+    try:
+        lines = 0
+        for line in export_lines(queryset, export_format):
+            output.write(line)
+            lines += 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    return lines
@@ -0,0 +1,68 @@
+import json
+
+from django.contrib.postgres.fields import JSONField
+from django.db.models.query_utils import DeferredAttribute
+
+
+class RawJSON(str):
+    """
+    JSON text exactly as it was loaded from the database, not decoded yet
+    """
+
+
+class LazyJSONAttribute(DeferredAttribute):
+    """
+    Decode the raw JSON text the first time the attribute is accessed, and cache the result on the instance
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+
+        value = super().__get__(instance, cls)
+        if isinstance(value, RawJSON):
+            # Plain dicts keep their insertion order, and without an object_pairs_hook the C decoder is used
+            value = json.loads(value)
+            instance.__dict__[self.field_name] = value
+
+        return value
+
+    def __set__(self, instance, value):
+        # Being a data descriptor makes sure __get__ is called even when the value is in the instance dict
+        instance.__dict__[self.field_name] = value
+
+
+class LazyJSONField(JSONField):
+    """
+    A JSONField that is fetched as text and only decoded when the attribute is accessed. Listing pages that load
+    whole rows don't pay for decoding the (big) JSON documents they never look at.
+    """
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        setattr(cls, self.attname, LazyJSONAttribute(self.attname, cls))
+
+    def select_format(self, compiler, sql, params):
+        # Let PostgreSQL give us the text representation so psycopg2 doesn't decode it
+        return '({})::text'.format(sql), params
+
+    # noinspection PyUnusedLocal
+    def from_db_value(self, value, expression, connection, context):
+        if value is None:
+            return value
+
+        return RawJSON(value)
+
+    def pre_save(self, model_instance, add):
+        # Don't decode a value just to encode it again
+        value = model_instance.__dict__.get(self.attname)
+        if isinstance(value, RawJSON):
+            return value
+
+        return super().pre_save(model_instance, add)
+
+    def get_prep_value(self, value):
+        if isinstance(value, RawJSON):
+            return str(value)
+
+        return super().get_prep_value(value)
@@ -1,5 +1,6 @@
 from datetime import timedelta
 
+from django.conf import settings
 from django.contrib import admin
 from django.utils import timezone
 
@@ -78,6 +79,26 @@ class StateFilter(admin.SimpleListFilter):
             return queryset
 
 
+class AliveFilter(admin.SimpleListFilter):
+    title = 'alive'
+    parameter_name = 'alive'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('Y', 'Alive'),
+            ('N', 'Stopped or dead'),
+        )
+
+    def queryset(self, request, queryset):
+        limit = timezone.now() - timedelta(seconds=settings.WORKER_LEASE_TIME)
+        if self.value() == 'Y':
+            return queryset.filter(stopped=None, last_heartbeat__gt=limit)
+        elif self.value() == 'N':
+            return queryset.exclude(stopped=None, last_heartbeat__gt=limit)
+        else:
+            return queryset
+
+
 def score_filter(attribute):
     class ScoreFilter(admin.SimpleListFilter):
         title = attribute.replace('_', ' ')
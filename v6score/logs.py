@@ -0,0 +1,110 @@
+"""
+Logging with context. Every record gets the context of the process (like the worker it belongs to) and of the thread
+(like the measurement it is testing), so the logs of many workers on many machines can be filtered. Records are
+handed to a background thread to be written, a slow terminal or disk never holds up a test.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+_process_context = OrderedDict()
+_thread_context = threading.local()
+
+
+def set_process_context(**values):
+    """
+    Add context to everything this process logs, from every thread
+    """
+    _process_context.update(values)
+
+
+@contextmanager
+def log_context(**values):
+    """
+    Add context to everything this thread logs inside the with block
+    """
+    previous = getattr(_thread_context, 'values', OrderedDict())
+    _thread_context.values = OrderedDict(previous, **values)
+    try:
+        yield
+    finally:
+        _thread_context.values = previous
+
+
+def current_context():
+    context = OrderedDict(_process_context)
+    context.update(getattr(_thread_context, 'values', {}))
+    return context
+
+
+class ContextFilter(logging.Filter):
+    """
+    Attach the current context to records, this must run in the thread that logs
+    """
+
+    def filter(self, record):
+        record.context = current_context()
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per line, with the context as extra keys
+    """
+
+    def format(self, record):
+        data = OrderedDict([
+            ('time', datetime.fromtimestamp(record.created, timezone.utc).isoformat()),
+            ('level', record.levelname),
+            ('logger', record.name),
+            ('message', record.getMessage()),
+        ])
+        data.update(getattr(record, 'context', {}))
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+
+        return json.dumps(data, default=str)
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    Put records on a queue with their message and traceback rendered, but leave the formatting to the handler at the
+    other end
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.addFilter(ContextFilter())
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+def queued_handler(handler):
+    """
+    A handler that passes records to the given handler in a background thread
+    """
+    log_queue = queue.Queue()
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+
+    # Write what is still in the queue before the process exits
+    atexit.register(listener.stop)
+
+    return ContextQueueHandler(log_queue)
@@ -1,24 +1,34 @@
 import logging
 
+from django.conf import settings
+
+from v6score.logs import JSONFormatter, queued_handler
+from v6score.profiling import PROFILE_MODES
+
 
 def init_logging(logger, verbosity):
     if verbosity > 0:
         console = logging.StreamHandler()
-        try:
-            # noinspection PyUnresolvedReferences
-            from colorlog import ColoredFormatter
-            formatter = ColoredFormatter('{yellow}{asctime}{reset} '
-                                         '[{log_color}{levelname}{reset}] '
-                                         '{white}{message}{reset}',
-                                         style='{')
-
-        except ImportError:
-            formatter = logging.Formatter('{asctime} [{levelname}] {message}',
-                                          style='{')
+        if settings.LOG_FORMAT == 'json':
+            formatter = JSONFormatter()
+        else:
+            try:
+                # noinspection PyUnresolvedReferences
+                from colorlog import ColoredFormatter
+                formatter = ColoredFormatter('{yellow}{asctime}{reset} '
+                                             '[{log_color}{levelname}{reset}] '
+                                             '{white}{message}{reset}',
+                                             style='{')
+
+            except ImportError:
+                formatter = logging.Formatter('{asctime} [{levelname}] {message}',
+                                              style='{')
 
         console.setFormatter(formatter)
         console.setLevel(logging.DEBUG)
-        logger.addHandler(console)
+
+        # Writing happens in the background, so logging never blocks a test
+        logger.addHandler(queued_handler(console))
 
         # Stop PIL from excessive logging
         pil_logger = logging.getLogger('PIL')
@@ -32,3 +42,29 @@ def init_logging(logger, verbosity):
 
     if verbosity >= 3:
         logger.setLevel(logging.DEBUG)
+
+
+def add_profile_arguments(parser):
+    parser.add_argument(
+        '--profile',
+        action='store',
+        dest='profile',
+        choices=PROFILE_MODES,
+        default=None,
+        help='Profile every test, deterministic with cProfile or by sampling the stack',
+    )
+    parser.add_argument(
+        '--profile-dir',
+        action='store',
+        dest='profile_dir',
+        default='profiles',
+        help='Directory to write the profiles to (default: profiles)',
+    )
+    parser.add_argument(
+        '--profile-slower-than',
+        action='store',
+        dest='profile_slower_than',
+        type=float,
+        default=0,
+        help='Only keep the profiles of tests that took at least this many seconds',
+    )
@@ -0,0 +1,76 @@
+import json
+import statistics
+import time
+from collections import OrderedDict
+
+from django.core.management.base import BaseCommand
+
+from v6score.fields import LazyJSONField
+from v6score.models import Measurement
+
+
+class Command(BaseCommand):
+    help = 'Compare the time it takes to load a list page of measurements with eager and lazy JSON decoding'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            action='store',
+            dest='rows',
+            type=int,
+            default=100,
+            help='The number of measurements on a list page',
+        )
+        parser.add_argument(
+            '--repeat',
+            action='store',
+            dest='repeat',
+            type=int,
+            default=10,
+            help='How many times to run each benchmark',
+        )
+
+    def handle(self, **options):
+        rows = options['rows']
+        json_fields = [field.attname for field in Measurement._meta.concrete_fields
+                       if isinstance(field, LazyJSONField)]
+
+        def load_page():
+            return list(Measurement.objects.order_by('-finished')[:rows])
+
+        def eager_ordered_dict():
+            # What the global psycopg2 decoder used to do for every row that was loaded
+            for measurement in load_page():
+                for attname in json_fields:
+                    raw = measurement.__dict__[attname]
+                    if raw is not None:
+                        json.loads(raw, object_pairs_hook=OrderedDict)
+
+        def lazy_untouched():
+            load_page()
+
+        def lazy_accessed():
+            for measurement in load_page():
+                for attname in json_fields:
+                    getattr(measurement, attname)
+
+        benchmarks = [
+            ('before: eager OrderedDict decoding', eager_ordered_dict),
+            ('after: lazy, JSON not accessed', lazy_untouched),
+            ('after: lazy, JSON accessed', lazy_accessed),
+        ]
+
+        self.stdout.write("Loading {} measurements, {} runs each".format(rows, options['repeat']))
+        for name, benchmark in benchmarks:
+            # Warm up the database cache
+            benchmark()
+
+            timings = []
+            for run in range(options['repeat']):
+                start = time.perf_counter()
+                benchmark()
+                timings.append((time.perf_counter() - start) * 1000)
+
+            self.stdout.write("{:<40} min {:8.2f} ms, median {:8.2f} ms".format(name + ':',
+                                                                                 min(timings),
+                                                                                 statistics.median(timings)))
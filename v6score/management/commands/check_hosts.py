@@ -47,12 +47,12 @@ class Command(BaseCommand):
             ]
 
             for hostname in hostnames:
-                logger.info("Connecting to {}".format(hostname))
+                logger.info("Connecting to %s", hostname)
                 client.connect(hostname, key_filename=settings.SSH_PRIVATE_KEY, allow_agent=False, look_for_keys=False)
                 stdin, stdout, stderr = client.exec_command('phantomjs --version')
                 stdout_lines = stdout.readlines()
                 if stdout_lines:
-                    logger.info("PhantomJS version: {}".format(stdout_lines[0].strip()))
+                    logger.info("PhantomJS version: %s", stdout_lines[0].strip())
                 else:
                     logger.error(''.join([line.strip() for line in stderr.readlines()][:1]))
                 client.close()
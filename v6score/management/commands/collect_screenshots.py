@@ -0,0 +1,79 @@
+import logging
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from v6score.caching import CACHE_FOREVER
+from v6score.management.commands import init_logging
+from v6score.models import Measurement, ScreenshotAlias
+from v6score.renditions import delete_renditions
+from v6score.storage import screenshot_storage
+
+logger = logging.getLogger()
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Remove stored screenshots that are not used by any measurement anymore'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            dest='dry_run',
+            default=False,
+            help='Only report what would be removed',
+        )
+
+    def handle(self, **options):
+        init_logging(logger, int(options['verbosity']))
+
+        self.dry_run = options['dry_run']
+        self.removed = 0
+        self.freed = 0
+
+        batch = []
+        for name in screenshot_storage.list_stored():
+            batch.append(name)
+            if len(batch) >= BATCH_SIZE:
+                self.collect(batch)
+                batch = []
+
+        if batch:
+            self.collect(batch)
+
+        # Nothing can still have a page that links to these
+        aliases = ScreenshotAlias.objects.filter(created__lt=timezone.now() - timedelta(seconds=CACHE_FOREVER))
+        if self.dry_run:
+            logger.info("%s expired screenshot aliases found", aliases.count())
+        else:
+            logger.info("%s expired screenshot aliases removed", aliases.delete()[0])
+
+        logger.info("Done, %s unused files %s, %.1f MB",
+                    self.removed,
+                    'found' if self.dry_run else 'removed',
+                    self.freed / 1024 / 1024)
+
+    def collect(self, names):
+        referenced = set()
+        for field in ('v4only_image', 'v6only_image', 'nat64_image'):
+            referenced.update(Measurement.objects
+                              .filter(**{field + '__in': names})
+                              .values_list(field, flat=True))
+
+        for name in names:
+            if name in referenced or not screenshot_storage.is_collectable(name):
+                continue
+
+            size = screenshot_storage.size(name)
+            logger.debug("Removing %s", name)
+            if not self.dry_run:
+                screenshot_storage.delete(name)
+                if not os.path.basename(name).startswith('.tmp-'):
+                    delete_renditions(name)
+
+            self.removed += 1
+            self.freed += size
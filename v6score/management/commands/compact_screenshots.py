@@ -0,0 +1,90 @@
+import logging
+import os
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db.models.aggregates import Sum
+
+from v6score.management.commands import init_logging
+from v6score.models import PackedBlob
+from v6score.storage import BlobFile, screenshot_storage
+
+logger = logging.getLogger()
+
+
+class Command(BaseCommand):
+    help = 'Pack loose screenshots and reclaim the space of deleted ones from the segment files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-garbage',
+            action='store',
+            type=float,
+            dest='min_garbage',
+            default=0.25,
+            help='Only compact segments where at least this fraction of the space is unused (default: 0.25)',
+        )
+
+    def handle(self, **options):
+        init_logging(logger, int(options['verbosity']))
+
+        self.pack_loose_files()
+
+        current_segment = screenshot_storage.current_segment()
+        reclaimed = 0
+        for segment in screenshot_storage.list_segments():
+            if segment >= current_segment:
+                # Still being appended to
+                continue
+
+            path = screenshot_storage.segment_path(segment)
+            segment_size = os.path.getsize(path)
+            live_size = PackedBlob.objects.filter(segment=segment).aggregate(size=Sum('length'))['size'] or 0
+            garbage = 1 - live_size / segment_size if segment_size else 1
+            if garbage < options['min_garbage']:
+                logger.debug("Segment %s has %.0f%% garbage, leaving it alone", segment, garbage * 100)
+                continue
+
+            logger.info("Compacting segment %s (%.0f%% garbage)", segment, garbage * 100)
+            self.move_blobs(segment)
+
+            if PackedBlob.objects.filter(segment=segment).exists():
+                logger.error("Segment %s still contains files, not removing it", segment)
+                continue
+
+            os.unlink(path)
+            reclaimed += segment_size - live_size
+
+        logger.info("Done, %.1f MB reclaimed", reclaimed / 1024 / 1024)
+
+    @staticmethod
+    def move_blobs(segment):
+        for blob in PackedBlob.objects.filter(segment=segment).order_by('offset').iterator():
+            view = screenshot_storage.blob_view(blob.name)
+            if view is None:
+                # Deleted in the meantime
+                continue
+
+            new_segment, new_offset, length = screenshot_storage.append(File(BlobFile(view), blob.name))
+            view.release()
+
+            # Only move it if nothing changed in the meantime, otherwise the copy is garbage for the next run
+            (PackedBlob.objects
+             .filter(name=blob.name, segment=blob.segment, offset=blob.offset)
+             .update(segment=new_segment, offset=new_offset, length=length))
+
+    @staticmethod
+    def pack_loose_files():
+        packed = 0
+        for name in screenshot_storage.list_loose():
+            with open(screenshot_storage.path(name), 'rb') as f:
+                screenshot_storage.store_blob(name, File(f, name))
+
+            os.unlink(screenshot_storage.path(name))
+            packed += 1
+
+            if packed % 100 == 0:
+                logger.info("%s loose screenshots packed", packed)
+
+        if packed:
+            logger.info("%s loose screenshots packed", packed)
@@ -0,0 +1,63 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from v6score.export import EXPORT_FORMATS, write_export
+from v6score.management.commands import init_logging
+from v6score.models import Measurement
+
+logger = logging.getLogger()
+
+
+class Command(BaseCommand):
+    help = 'Export the latest results, filtered like the overview page'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            action='store',
+            dest='format',
+            choices=sorted(EXPORT_FORMATS),
+            default='csv',
+            help='Export format (default: csv)',
+        )
+        parser.add_argument(
+            '--search',
+            action='store',
+            dest='search',
+            default='',
+            help='Only export URLs that contain this',
+        )
+        parser.add_argument(
+            '--test',
+            action='store',
+            dest='test',
+            choices=['', 'nat64', 'ipv6'],
+            default='',
+            help='Test that --score applies to (default: both)',
+        )
+        parser.add_argument(
+            '--score',
+            action='store',
+            dest='score',
+            choices=['', 'poor', 'mediocre', 'good'],
+            default='',
+            help='Only export measurements with this score',
+        )
+        parser.add_argument(
+            '--output',
+            action='store',
+            dest='output',
+            default='-',
+            help='File to export to (default: stdout)',
+        )
+
+    def handle(self, **options):
+        init_logging(logger, int(options['verbosity']))
+
+        measurements = Measurement.objects.overview(search=options['search'],
+                                                    test=options['test'],
+                                                    score=options['score'])
+
+        lines = write_export(measurements, options['format'], options['output'])
+        logger.info("Exported %s lines", lines)
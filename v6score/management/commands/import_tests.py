@@ -0,0 +1,265 @@
+import csv
+import io
+import logging
+import sys
+import time
+import zipfile
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.forms.fields import URLField
+from django.utils import timezone
+
+from v6score.management.commands import init_logging
+from v6score.models import Measurement, ScanRun
+from v6score.notifications import notify_workers
+
+logger = logging.getLogger()
+
+
+def open_list(filename):
+    """
+    Open a list of URLs as text: '-' for stdin, and a zip file (like the Cisco top-1m) reads its first member
+    """
+    if filename == '-':
+        return sys.stdin
+
+    if filename.endswith('.zip'):
+        archive = zipfile.ZipFile(filename)
+        return io.TextIOWrapper(archive.open(archive.namelist()[0]), encoding='utf-8', newline='')
+
+    return open(filename, encoding='utf-8', newline='')
+
+
+class Command(BaseCommand):
+    help = 'Add all URLs in a list or CSV file (like the Cisco top-1m) to the test queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('filename', help="File with one URL or hostname per line, or '-' for stdin")
+
+        parser.add_argument(
+            '--column',
+            action='store',
+            type=int,
+            dest='column',
+            default=-1,
+            help='Column of a CSV file that contains the URL, counting from 0 (default: the last column)',
+        )
+        parser.add_argument(
+            '--limit',
+            action='store',
+            type=int,
+            dest='limit',
+            default=None,
+            help='Only import the first this many entries',
+        )
+        parser.add_argument(
+            '--priority',
+            action='store',
+            dest='priority',
+            choices=[name for value, name in Measurement.PRIORITY_CHOICES],
+            default='bulk',
+            help='Priority class of the requests (default: bulk)',
+        )
+        parser.add_argument(
+            '--skip-recent',
+            action='store',
+            type=float,
+            dest='skip_recent',
+            default=24,
+            help="Skip URLs that have been tested in this many hours (default: 24)",
+        )
+        parser.add_argument(
+            '--chunk-size',
+            action='store',
+            type=int,
+            dest='chunk_size',
+            default=5000,
+            help='Number of URLs to check and insert at once (default: 5000)',
+        )
+        parser.add_argument(
+            '--prescreen',
+            action='store_true',
+            dest='prescreen',
+            default=False,
+            help='Let prescreen_tests decide which sites need a browser test',
+        )
+        parser.add_argument(
+            '--scan-run',
+            action='store',
+            dest='scan_run',
+            default=None,
+            help='Group the new requests in a scan run with this name',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store',
+            type=int,
+            dest='resume',
+            default=None,
+            help='Continue an interrupted import of the scan run with this ID',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            dest='dry_run',
+            default=False,
+            help="Don't add anything to the queue",
+        )
+
+    def handle(self, **options):
+        init_logging(logger, int(options['verbosity']))
+
+        self.options = options
+        self.priority = dict((name, value) for value, name in Measurement.PRIORITY_CHOICES)[options['priority']]
+        self.recent = timezone.now() - timedelta(hours=options['skip_recent'])
+        self.url_field = URLField()
+        self.scan_run = self.get_scan_run()
+
+        self.read = 0
+        self.invalid = 0
+        self.duplicate = 0
+        self.existing = 0
+        self.queued = 0
+        self.start = time.monotonic()
+
+        try:
+            list_file = open_list(options['filename'])
+        except (IOError, OSError, zipfile.BadZipFile) as e:
+            raise CommandError("Can't read {}: {}".format(options['filename'], e))
+
+        checkpoint = self.scan_run.rows_imported if self.scan_run else 0
+        if checkpoint:
+            logger.info("Skipping the %s rows that were imported before", checkpoint)
+
+        seen = set()
+        chunk = []
+        with list_file:
+            for row in csv.reader(list_file):
+                if options['limit'] is not None and self.read >= options['limit']:
+                    break
+
+                if not row or row[0].startswith('#'):
+                    continue
+
+                self.read += 1
+                if self.read <= checkpoint:
+                    continue
+
+                url = self.clean_url(row)
+                if not url:
+                    self.invalid += 1
+                    continue
+
+                if url in seen:
+                    self.duplicate += 1
+                    continue
+
+                seen.add(url)
+                chunk.append(url)
+                if len(chunk) >= options['chunk_size']:
+                    self.import_chunk(chunk)
+                    chunk = []
+
+        # Also when the last chunk is empty, to record that we read everything
+        self.import_chunk(chunk)
+
+        if self.scan_run and not options['dry_run']:
+            self.scan_run.import_complete = True
+            self.scan_run.save(update_fields=['import_complete'])
+
+        if self.queued and not options['dry_run']:
+            notify_workers()
+
+        logger.info("Done, %s", self.progress())
+
+    def get_scan_run(self):
+        if self.options['scan_run'] and self.options['resume']:
+            raise CommandError("Use either --scan-run or --resume")
+
+        if self.options['resume']:
+            try:
+                scan_run = ScanRun.objects.get(pk=self.options['resume'])
+            except ScanRun.DoesNotExist:
+                raise CommandError("Scan run {} doesn't exist".format(self.options['resume']))
+
+            if scan_run.state == ScanRun.STATE_CANCELLED:
+                raise CommandError("{} has been cancelled".format(scan_run))
+            if scan_run.import_complete:
+                raise CommandError("{} has already been imported completely".format(scan_run))
+            if scan_run.source != self.options['filename']:
+                logger.warning("%s was imported from %s", scan_run, scan_run.source)
+
+            logger.info("Resuming import of %s", scan_run)
+            return scan_run
+
+        if self.options['scan_run'] and not self.options['dry_run']:
+            scan_run = ScanRun.objects.create(name=self.options['scan_run'], source=self.options['filename'])
+            logger.info("Importing into %s", scan_run)
+            return scan_run
+
+        return None
+
+    def clean_url(self, row):
+        try:
+            value = row[self.options['column']].strip()
+        except IndexError:
+            return None
+
+        # Normalise the same way as URLForm does, so we match the URLs of earlier requests
+        try:
+            return self.url_field.clean(value)
+        except ValidationError:
+            logger.debug("Invalid URL: %s", value)
+            return None
+
+    def import_chunk(self, urls):
+        # Leave URLs alone that are already waiting or have been tested recently
+        existing = set(Measurement.objects
+                       .filter(url__in=urls, finished=None)
+                       .values_list('url', flat=True))
+        existing.update(Measurement.objects
+                        .browser_tested()
+                        .filter(url__in=urls, finished__gt=self.recent)
+                        .values_list('url', flat=True))
+
+        now = timezone.now()
+        measurements = []
+        for url in urls:
+            if url in existing:
+                continue
+
+            measurement = Measurement(url=url, requested=now, priority=self.priority,
+                                      prescreen_pending=self.options['prescreen'], scan_run=self.scan_run)
+
+            # bulk_create doesn't call save(), which normally fills this in
+            measurement.host = measurement.hostname.lower()
+            measurements.append(measurement)
+
+        if not self.options['dry_run']:
+            # The checkpoint is saved together with the chunk, an interrupted import resumes after it
+            with transaction.atomic():
+                # Lock the scan run so it can't be cancelled while we add to it, and stop once it has been
+                if self.scan_run:
+                    state = ScanRun.objects.select_for_update().filter(pk=self.scan_run.pk).values_list(
+                        'state', flat=True).get()
+                    if state == ScanRun.STATE_CANCELLED:
+                        raise CommandError("{} has been cancelled, import stopped after {} rows".format(
+                            self.scan_run, self.scan_run.rows_imported))
+
+                Measurement.objects.bulk_create(measurements)
+                if self.scan_run:
+                    self.scan_run.rows_imported = self.read
+                    self.scan_run.save(update_fields=['rows_imported'])
+
+        self.existing += len(urls) - len(measurements)
+        self.queued += len(measurements)
+        logger.info(self.progress())
+
+    def progress(self):
+        elapsed = time.monotonic() - self.start
+        return ("{} read, {} queued, {} already queued or recently tested, {} duplicates, {} invalid "
+                "({:.0f} rows/s)".format(self.read, self.queued, self.existing, self.duplicate, self.invalid,
+                                         self.read / elapsed if elapsed > 0 else 0))
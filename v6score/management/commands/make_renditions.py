@@ -0,0 +1,56 @@
+import logging
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models.query_utils import Q
+
+from v6score.management.commands import init_logging
+from v6score.models import Measurement
+from v6score.renditions import create_rendition, rendition_name
+
+logger = logging.getLogger()
+
+
+class Command(BaseCommand):
+    help = 'Create the scaled down versions of existing screenshots'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            dest='force',
+            default=False,
+            help='Re-create renditions that already exist',
+        )
+
+    def handle(self, **options):
+        init_logging(logger, int(options['verbosity']))
+
+        measurements = (Measurement.objects
+                        .exclude(Q(v4only_image='') | Q(v4only_image=None),
+                                 Q(v6only_image='') | Q(v6only_image=None),
+                                 Q(nat64_image='') | Q(nat64_image=None))
+                        .only('v4only_image', 'v6only_image', 'nat64_image')
+                        .order_by('pk'))
+
+        created = 0
+        for measurement in measurements.iterator():
+            for image in (measurement.v4only_image, measurement.v6only_image, measurement.nat64_image):
+                if not image:
+                    continue
+
+                for size in settings.SCREENSHOT_RENDITIONS:
+                    if not options['force'] and default_storage.exists(rendition_name(image.name, size)):
+                        continue
+
+                    try:
+                        create_rendition(image, size)
+                        created += 1
+                    except (IOError, OSError) as e:
+                        logger.error("Could not create %s rendition of %s: %s", size, image.name, e)
+
+            if created and created % 100 == 0:
+                logger.info("%s renditions created", created)
+
+        logger.info("Done, %s renditions created", created)
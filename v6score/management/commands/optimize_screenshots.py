@@ -0,0 +1,49 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db.models.query_utils import Q
+
+from v6score.management.commands import init_logging
+from v6score.models import IMAGE_FIELDS, Measurement
+
+logger = logging.getLogger()
+
+
+class Command(BaseCommand):
+    help = 'Re-encode screenshots that were stored before they were encoded losslessly in a denser format'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            dest='force',
+            default=False,
+            help='Also process measurements that have been optimized before, e.g. after changing SCREENSHOT_FORMAT',
+        )
+
+    def handle(self, **options):
+        init_logging(logger, int(options['verbosity']))
+
+        measurements = (Measurement.objects
+                        .exclude(finished=None)
+                        .exclude(Q(v4only_image='') | Q(v4only_image=None),
+                                 Q(v6only_image='') | Q(v6only_image=None),
+                                 Q(nat64_image='') | Q(nat64_image=None))
+                        .only(*IMAGE_FIELDS + ('url', 'images_optimized'))
+                        .order_by('pk'))
+        if not options['force']:
+            measurements = measurements.filter(images_optimized=False)
+
+        processed = 0
+        saved = 0
+        for measurement in measurements.iterator():
+            try:
+                saved += measurement.optimize_images()
+            except (IOError, OSError) as e:
+                logger.error("%s: could not re-encode screenshots: %s", measurement.url, e)
+
+            processed += 1
+            if processed % 100 == 0:
+                logger.info("%s measurements processed, %.1f MB saved", processed, saved / 1024 / 1024)
+
+        logger.info("Done, %s measurements processed, %.1f MB saved", processed, saved / 1024 / 1024)
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import resource
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from v6score.management.commands import init_logging
+from v6score.models import Measurement
+from v6score.notifications import WorkerWakeup, notify_workers
+from v6score.prescreen import needs_browser_test, prescreen
+
+logger = logging.getLogger()
+
+# Check the queue at least this often, in case a notification got lost
+MAX_IDLE_TIME = 60
+
+# Advisory lock that makes sure only one prescreen runs at a time
+PRESCREEN_LOCK = 6464
+
+# Host name lookups block, so they run in threads
+RESOLVER_THREADS = 100
+
+
+class Command(BaseCommand):
+    help = "Fetch requested sites directly over IPv4 and IPv6, and only queue them for the browser tests " \
+           "when the responses differ or are unclear"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            action='store',
+            type=int,
+            dest='batch_size',
+            default=5000,
+            help='Number of sites to take from the queue at once (default: 5000)',
+        )
+        parser.add_argument(
+            '--concurrency',
+            action='store',
+            type=int,
+            dest='concurrency',
+            default=1000,
+            help='Number of sites to fetch at the same time, with two connections each (default: 1000)',
+        )
+        parser.add_argument(
+            '--timeout',
+            action='store',
+            type=float,
+            dest='timeout',
+            default=10,
+            help='Seconds to wait for a response (default: 10)',
+        )
+
+    def handle(self, **options):
+        init_logging(logger, int(options['verbosity']))
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [PRESCREEN_LOCK])
+            if not cursor.fetchone()[0]:
+                raise CommandError("Another prescreen is already running")
+
+        # Every site needs two sockets
+        soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+        wanted = options['concurrency'] * 2 + 100
+        if soft_limit != resource.RLIM_INFINITY and soft_limit < wanted:
+            if hard_limit != resource.RLIM_INFINITY:
+                wanted = min(wanted, hard_limit)
+            resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard_limit))
+            logger.debug("Raised open file limit from %s to %s", soft_limit, wanted)
+
+        stopping = []
+        wakeup = WorkerWakeup()
+
+        # noinspection PyUnusedLocal
+        def stop_me(sig_num, stack):
+            logger.critical("Interrupt received, please wait while we finish the current batch")
+            stopping.append(True)
+            wakeup.interrupt()
+
+        signal.signal(signal.SIGINT, stop_me)
+
+        loop = asyncio.new_event_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=RESOLVER_THREADS))
+        asyncio.set_event_loop(loop)
+
+        while not stopping:
+            batch = list(Measurement.objects
+                         .queued()
+                         .filter(prescreen_pending=True, requested__lte=timezone.now())
+                         .order_by('requested')
+                         .only('id', 'url')[:options['batch_size']])
+
+            if not batch:
+                logger.debug("Nothing to prescreen, waiting at most %s seconds for new requests", MAX_IDLE_TIME)
+                wakeup.wait(MAX_IDLE_TIME)
+                continue
+
+            start = time.monotonic()
+            results = loop.run_until_complete(prescreen([measurement.idna_url for measurement in batch],
+                                                        concurrency=options['concurrency'],
+                                                        timeout=options['timeout']))
+            elapsed = time.monotonic() - start
+
+            promoted = self.save_results(batch, results)
+            if promoted:
+                notify_workers()
+
+            logger.info("Prescreened %s sites in %.1f seconds (%.0f sites/s), %s need a browser test",
+                        len(batch), elapsed, len(batch) / elapsed, promoted)
+
+        loop.close()
+
+    @staticmethod
+    def save_results(batch, results):
+        """
+        Queue the measurements that need a browser test, and finish the others. Returns the number queued.
+        """
+        now = timezone.now()
+        promoted = 0
+        with transaction.atomic():
+            for measurement, result in zip(batch, results):
+                updates = {
+                    'prescreen_pending': False,
+                    'prescreen_results': result,
+                }
+
+                browser_test = needs_browser_test(result)
+                if not browser_test:
+                    updates['started'] = now
+                    updates['finished'] = now
+
+                # Someone might have asked for the full test in the meantime, then it is already queued
+                updated = (Measurement.objects
+                           .filter(pk=measurement.pk, prescreen_pending=True, started=None)
+                           .update(**updates))
+                if browser_test and updated:
+                    promoted += 1
+
+        return promoted
@@ -7,6 +7,7 @@ from django.utils import timezone
 from v6score.forms import URLForm
 from v6score.management.commands import init_logging
 from v6score.models import Measurement
+from v6score.notifications import notify_workers
 
 logger = logging.getLogger()
 
@@ -25,6 +26,14 @@ class Command(LabelCommand):
             default=False,
             help='Mark this request as manual',
         )
+        parser.add_argument(
+            '--priority',
+            action='store',
+            dest='priority',
+            choices=[name for value, name in Measurement.PRIORITY_CHOICES],
+            default=None,
+            help='Priority class of the request (default: interactive for manual requests, bulk otherwise)',
+        )
 
         super().add_arguments(parser)
 
@@ -37,26 +46,44 @@ class Command(LabelCommand):
             'url': label
         })
         if not url_form.is_valid():
-            logger.critical("Invalid URL: {}".format(label))
+            logger.critical("Invalid URL: %s", label)
             return
 
         # Get the cleaned URL from the form
         url = url_form.cleaned_data['url']
 
+        if options['priority']:
+            priority = dict((name, value) for value, name in Measurement.PRIORITY_CHOICES)[options['priority']]
+        elif options['manual']:
+            priority = Measurement.PRIORITY_INTERACTIVE
+        else:
+            priority = Measurement.PRIORITY_BULK
+
         measurement = Measurement.objects.filter(url=url, finished=None).order_by('requested').first()
         if measurement:
-            if options['manual'] and not measurement.manual:
+            if options['manual']:
+                # Someone wants to see the full test, don't let the prescreen decide
                 measurement.manual = True
+                measurement.prescreen_pending = False
 
+            # Never lower the priority of an existing request
+            measurement.priority = min(measurement.priority, priority)
             measurement.requested = timezone.now()
             measurement.save()
-            logger.info("{} existing request marked as manual".format(url))
+            notify_workers()
+            logger.info("%s existing request marked as manual", url)
         else:
             recent = timezone.now() - timedelta(minutes=5)
-            measurement = Measurement.objects.filter(url=url, finished__gt=recent).order_by('-finished').first()
+            measurement = (Measurement.objects
+                           .browser_tested()
+                           .filter(url=url, finished__gt=recent)
+                           .order_by('-finished')
+                           .first())
             if not options['manual'] and measurement:
-                logger.warning("{} has already been tested recently".format(url))
+                logger.warning("%s has already been tested recently", url)
             else:
-                measurement = Measurement(url=url, requested=timezone.now(), manual=options['manual'])
+                measurement = Measurement(url=url, requested=timezone.now(), manual=options['manual'],
+                                          priority=priority)
                 measurement.save()
-                logger.info("{} request added".format(url))
+                notify_workers()
+                logger.info("%s request added", url)
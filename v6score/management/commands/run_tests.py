@@ -1,18 +1,112 @@
 import logging
+import os
 import signal
+import socket
+import threading
 import time
 from datetime import timedelta
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.db import transaction
-from django.db.transaction import TransactionManagementError
+from django.db import DatabaseError, connection
+from django.db.models.aggregates import Min
 from django.utils import timezone
 
-from v6score.management.commands import init_logging
-from v6score.models import Measurement
+from v6score.logs import set_process_context
+from v6score.management.commands import add_profile_arguments, init_logging
+from v6score.metrics import WorkerMetrics
+from v6score.models import ALL_LEGS, Measurement, Worker
+from v6score.notifications import WorkerWakeup
+from v6score.profiling import profile_test
+from v6score.scheduling import FairShareScheduler
 
 logger = logging.getLogger()
 
+# Check the queue at least this often, in case a notification got lost
+MAX_IDLE_TIME = 60
+
+
+def seconds_until_next_request(options):
+    """
+    The number of seconds until the next scheduled test is due, negative when it is overdue, None when nothing is queued
+    """
+    measurements = Measurement.objects.queued().filter(prescreen_pending=False)
+    if options['manual']:
+        measurements = measurements.filter(manual=True)
+    if options['retry']:
+        measurements = measurements.exclude(retry_for=None)
+
+    next_requested = measurements.aggregate(next_requested=Min('requested'))['next_requested']
+    if next_requested is None:
+        return None
+
+    return (next_requested - timezone.now()).total_seconds()
+
+
+class Heartbeat(threading.Thread):
+    """
+    Keep the leases of a worker alive, even while it is busy with a slow test
+    """
+
+    def __init__(self, worker):
+        super().__init__(daemon=True)
+        self.worker = worker
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.wait(settings.WORKER_LEASE_TIME / 3):
+            try:
+                self.worker.heartbeat()
+            except DatabaseError:
+                logger.exception("Heartbeat failed")
+            finally:
+                # This runs in its own thread, with its own database connection
+                connection.close()
+
+    def stop(self):
+        self.stopping.set()
+        self.join()
+
+
+class ClaimStats:
+    """
+    Keep track of how long claiming tests takes, and how often there was work that other workers had locked
+    """
+
+    # Log a summary every this many claims
+    REPORT_INTERVAL = 100
+
+    def __init__(self):
+        self.claims = 0
+        self.claimed = 0
+        self.contended = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def add(self, latency, claimed):
+        self.claims += 1
+        self.claimed += claimed
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+        if claimed:
+            logger.debug("Claimed %s tests in %.1f ms", claimed, latency * 1000)
+
+        if self.claims % self.REPORT_INTERVAL == 0:
+            self.log()
+
+    def add_contended(self):
+        self.contended += 1
+        logger.debug("All pending tests are being claimed by other workers")
+
+    def log(self):
+        if not self.claims:
+            return
+
+        logger.info("%s claims, %s tests claimed, %s contended, latency average %.1f ms, max %.1f ms",
+                    self.claims, self.claimed, self.contended,
+                    self.total_latency / self.claims * 1000, self.max_latency * 1000)
+
 
 class Command(BaseCommand):
     help = "Run tests that haven't been processed yet"
@@ -33,53 +127,78 @@ class Command(BaseCommand):
             default=False,
             help='Only run retry requests',
         )
+        parser.add_argument(
+            '--batch-size',
+            action='store',
+            type=int,
+            dest='batch_size',
+            default=1,
+            help='Number of tests to claim at once (default: 1)',
+        )
+        parser.add_argument(
+            '--push-metrics',
+            action='store',
+            dest='push_metrics',
+            default=settings.METRICS_PUSHGATEWAY_URL,
+            help='Push the metrics of this worker to this Prometheus Pushgateway',
+        )
+        add_profile_arguments(parser)
 
     def handle(self, **options):
         init_logging(logger, int(options['verbosity']))
 
         stopping = []
+        wakeup = WorkerWakeup()
 
         # noinspection PyUnusedLocal
         def stop_me(sig_num, stack):
             logger.critical("Interrupt received, please wait while we finish the current test")
             stopping.append(True)
+            wakeup.interrupt()
 
         signal.signal(signal.SIGINT, stop_me)
 
-        while not stopping:
-            # Take ownership of the next test
-            measurement = None
-            while True:
-                try:
-                    with transaction.atomic():
-                        measurements = Measurement.objects \
-                            .select_for_update() \
-                            .filter(started=None, requested__lte=timezone.now()) \
-                            .order_by('requested')
-
-                        if options['manual']:
-                            measurements = measurements.filter(manual=True)
-                        if options['retry']:
-                            measurements = measurements.exclude(retry_for=None)
-
-                        measurement = measurements.first()
-
-                        if measurement:
-                            # Setting started will let other scripts know this one is being handled
-                            measurement.started = timezone.now()
-                            measurement.save()
-                except TransactionManagementError:
-                    pass
+        worker = Worker.objects.create(hostname=socket.gethostname(), pid=os.getpid())
+        set_process_context(worker_id=worker.pk, hostname=worker.hostname)
+        heartbeat = Heartbeat(worker)
+        heartbeat.start()
+        logger.info("Registered as %s", worker)
 
-                break
+        claim_stats = ClaimStats()
+        metrics = WorkerMetrics()
+        scheduler = FairShareScheduler()
+        batch = []
+        last_push = 0.0
+
+        while not stopping:
+            if not batch:
+                # Tests of workers that died can be claimed again
+                Measurement.objects.requeue_expired()
+
+                # Take ownership of the next tests
+                start = time.monotonic()
+                batch = scheduler.claim(worker,
+                                        batch_size=options['batch_size'],
+                                        manual_only=options['manual'],
+                                        retry_only=options['retry'])
+                latency = time.monotonic() - start
+                claim_stats.add(latency, len(batch))
+                metrics.add_claim(latency, len(batch))
 
             # Run test
             if stopping:
                 break
 
+            measurement = batch.pop(0) if batch else None
             if measurement:
-                logging.info("Running {}".format(measurement))
-                result = measurement.run_test()
+                logging.info("Running %s", measurement)
+                worker.start_test(measurement)
+                start = time.monotonic()
+                with profile_test(measurement, options['profile'], options['profile_dir'],
+                                  options['profile_slower_than']):
+                    result = measurement.run_test()
+                metrics.add_test(measurement, result, time.monotonic() - start)
+                worker.finish_test()
                 if result & 5 != 0:
                     if measurement.retry_for:
                         # Double the previous delta
@@ -93,9 +212,36 @@ class Command(BaseCommand):
                     requested = timezone.now() + delta
 
                     logging.warning("Dubious result, re-scheduling test")
-                    new_measurement = Measurement(url=measurement.url, requested=requested, retry_for=measurement)
+                    # Only the legs that failed need to run again
+                    new_measurement = Measurement(url=measurement.url, requested=requested, retry_for=measurement,
+                                                  priority=Measurement.PRIORITY_RETRY, retry_legs=result & ALL_LEGS)
                     new_measurement.save()
+                    metrics.retries.inc()
 
             else:
-                logger.debug("Nothing to process, sleeping")
-                time.sleep(5)
+                # Nothing was claimed, the same query tells whether there was work that other workers had locked
+                next_request = seconds_until_next_request(options)
+                if next_request is None:
+                    timeout = MAX_IDLE_TIME
+                else:
+                    if next_request <= 0:
+                        claim_stats.add_contended()
+                    timeout = min(max(next_request, 0.1), MAX_IDLE_TIME)
+
+                logger.debug("Nothing to process, waiting at most %.0f seconds for new requests", timeout)
+                if wakeup.wait(timeout):
+                    logger.debug("New request received")
+
+            # After every test, and now and then when there is nothing to do
+            if options['push_metrics'] and (measurement or time.monotonic() - last_push >= MAX_IDLE_TIME):
+                metrics.push(options['push_metrics'], worker)
+                last_push = time.monotonic()
+
+        if batch:
+            logger.info("Giving %s claimed tests back to the queue", len(batch))
+            Measurement.objects.release(batch)
+
+        claim_stats.log()
+
+        heartbeat.stop()
+        worker.stop()
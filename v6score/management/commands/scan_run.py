@@ -0,0 +1,81 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from v6score.export import EXPORT_FORMATS, write_export
+from v6score.management.commands import init_logging
+from v6score.models import ScanRun
+
+logger = logging.getLogger()
+
+
+class Command(BaseCommand):
+    help = 'Show, pause, resume, cancel or export scan runs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['list', 'status', 'pause', 'resume', 'cancel', 'export'])
+        parser.add_argument('scan_run', nargs='?', type=int, help='ID of the scan run')
+
+        parser.add_argument(
+            '--format',
+            action='store',
+            dest='format',
+            choices=sorted(EXPORT_FORMATS),
+            default='csv',
+            help='Export format (default: csv)',
+        )
+        parser.add_argument(
+            '--output',
+            action='store',
+            dest='output',
+            default='-',
+            help="File to export the results to (default: stdout)",
+        )
+
+    def handle(self, **options):
+        init_logging(logger, int(options['verbosity']))
+
+        if options['action'] == 'list':
+            for scan_run in ScanRun.objects.order_by('created'):
+                self.show_status(scan_run)
+            return
+
+        if not options['scan_run']:
+            raise CommandError("Which scan run?")
+
+        try:
+            scan_run = ScanRun.objects.get(pk=options['scan_run'])
+        except ScanRun.DoesNotExist:
+            raise CommandError("Scan run {} doesn't exist".format(options['scan_run']))
+
+        if options['action'] == 'status':
+            self.show_status(scan_run)
+
+        elif options['action'] == 'pause':
+            scan_run.pause()
+            logger.info("%s is %s", scan_run, scan_run.state)
+
+        elif options['action'] == 'resume':
+            scan_run.resume()
+            logger.info("%s is %s", scan_run, scan_run.state)
+
+        elif options['action'] == 'cancel':
+            removed = scan_run.cancel()
+            logger.info("%s cancelled, %s tests removed from the queue", scan_run, removed)
+
+        elif options['action'] == 'export':
+            if not scan_run.completed:
+                logger.warning("%s isn't complete yet", scan_run)
+            lines = write_export(scan_run.measurements.order_by('id'), options['format'], options['output'])
+            logger.info("Exported %s lines of %s", lines, scan_run)
+
+    def show_status(self, scan_run):
+        counts = scan_run.progress()
+        done = counts['finished'] / counts['total'] * 100 if counts['total'] else 0.0
+        eta = scan_run.eta()
+
+        self.stdout.write("{}: {}{}, {} of {} tests finished ({:.1f}%), {} running, {} pending, "
+                          "{:.0f} tests per hour, expected to finish {}".format(
+                              scan_run, scan_run.state, '' if scan_run.import_complete else ' (import incomplete)',
+                              counts['finished'], counts['total'], done, counts['running'], counts['pending'],
+                              scan_run.tests_per_hour(), eta.strftime('%Y-%m-%d %H:%M') if eta else 'unknown'))
@@ -4,8 +4,9 @@ from django.core.management.base import LabelCommand
 from django.utils import timezone
 
 from v6score.forms import URLForm
-from v6score.management.commands import init_logging
+from v6score.management.commands import add_profile_arguments, init_logging
 from v6score.models import Measurement
+from v6score.profiling import profile_test
 
 logger = logging.getLogger()
 
@@ -15,6 +16,10 @@ class Command(LabelCommand):
     label = 'domain'
     missing_args_message = "Enter at least one domain name."
 
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        add_profile_arguments(parser)
+
     def handle(self, *labels, **options):
         init_logging(logger, int(options['verbosity']))
         super(Command, self).handle(*labels, **options)
@@ -24,11 +29,12 @@ class Command(LabelCommand):
             'url': label
         })
         if not url_form.is_valid():
-            logger.critical("Invalid URL: {}".format(label))
+            logger.critical("Invalid URL: %s", label)
             return
 
         # Get the cleaned URL from the form
         url = url_form.cleaned_data['url']
 
         results = Measurement(url=url, requested=timezone.now(), manual=True)
-        results.run_test()
+        with profile_test(results, options['profile'], options['profile_dir'], options['profile_slower_than']):
+            results.run_test()
@@ -0,0 +1,63 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from v6score.models import Measurement, TIMING_PHASES
+
+
+class Command(BaseCommand):
+    help = 'Show the percentiles of the time spent in each phase of the tests that finished recently'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            action='store',
+            dest='days',
+            type=float,
+            default=7,
+            help='Look at the tests that finished in this many days (default: 7)',
+        )
+        parser.add_argument(
+            '--percentiles',
+            action='store',
+            dest='percentiles',
+            default='50,90,99',
+            help='Comma separated list of percentiles to show (default: 50,90,99)',
+        )
+
+    def handle(self, **options):
+        try:
+            percentiles = [float(percentile) for percentile in options['percentiles'].split(',')]
+        except ValueError:
+            raise CommandError("Percentiles must be numbers")
+        if not all(0 <= percentile <= 100 for percentile in percentiles):
+            raise CommandError("Percentiles must be between 0 and 100")
+
+        since = timezone.now() - timedelta(days=options['days'])
+
+        # Let PostgreSQL do the work, there can be a lot of measurements
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT key, count(*), "
+                           "percentile_cont(%s::float[]) WITHIN GROUP (ORDER BY value::float) "
+                           "FROM {}, jsonb_each_text(timings) "
+                           "WHERE finished >= %s "
+                           "GROUP BY key".format(connection.ops.quote_name(Measurement._meta.db_table)),
+                           [[percentile / 100 for percentile in percentiles], since])
+            results = dict((phase, (count, values)) for phase, count, values in cursor.fetchall())
+
+        if not results:
+            self.stdout.write("No timings of tests that finished since {:%Y-%m-%d %H:%M}".format(since))
+            return
+
+        # Known phases in the order they happen, anything else after that
+        phases = [phase for phase in TIMING_PHASES if phase in results]
+        phases += sorted(phase for phase in results if phase not in TIMING_PHASES)
+
+        self.stdout.write("{:<16} {:>8}".format('phase', 'tests') +
+                          ''.join(' {:>9}'.format('p{:g}'.format(percentile)) for percentile in percentiles))
+        for phase in phases:
+            count, values = results[phase]
+            self.stdout.write("{:<16} {:>8}".format(phase, count) +
+                              ''.join(' {:>8.3f}s'.format(value) for value in values))
@@ -0,0 +1,272 @@
+"""
+Metrics in the Prometheus text exposition format. The health of the queue is computed from indexed columns when the
+metrics are scraped, what happens inside a worker is counted by the worker itself and can be pushed to a Pushgateway.
+"""
+import bisect
+import logging
+import math
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.aggregates import Count, Min
+from django.utils import timezone
+
+from v6score.models import LEGS, Measurement, Worker
+
+logger = logging.getLogger(__name__)
+
+EXPOSITION_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# The bits in the result of Measurement.run_test
+FAILURE_REASONS = tuple((leg, leg_name) for leg, leg_name, host_setting in LEGS) + ((8, 'dns'),)
+
+# Tests that started or finished in this many seconds count as recent
+RECENT_WINDOW = 60
+
+# Seconds to wait for the Pushgateway, the worker doesn't run tests in the meantime
+PUSH_TIMEOUT = 2
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"') for value in labels.values())
+    return '{{{}}}'.format(','.join('{}="{}"'.format(name, value) for name, value in zip(labels, escaped)))
+
+
+class Metric:
+    metric_type = None
+
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.values = OrderedDict()
+
+    def key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError("{} needs labels {}".format(self.name, ', '.join(self.label_names)))
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def labels(self, key, **extra):
+        labels = OrderedDict(zip(self.label_names, key))
+        labels.update(extra)
+        return labels
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, self.labels(key), value
+
+    def exposition(self):
+        lines = ['# HELP {} {}'.format(self.name, self.description),
+                 '# TYPE {} {}'.format(self.name, self.metric_type)]
+        for name, labels, value in self.samples():
+            lines.append('{}{} {}'.format(name, format_labels(labels), format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+class Counter(Metric):
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    metric_type = 'gauge'
+
+    def set(self, value, **labels):
+        self.values[self.key(labels)] = value
+
+
+class Histogram(Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name, description, buckets, label_names=()):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        if key not in self.values:
+            self.values[key] = ([0] * len(self.buckets), 0.0)
+
+        counts, total = self.values[key]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.values[key] = (counts, total + value)
+
+    def samples(self):
+        for key, (counts, total) in self.values.items():
+            cumulative = 0
+            for bucket, count in zip(self.buckets, counts):
+                cumulative += count
+                yield self.name + '_bucket', self.labels(key, le=format_value(bucket)), cumulative
+            yield self.name + '_sum', self.labels(key), total
+            yield self.name + '_count', self.labels(key), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def exposition(self):
+        return ''.join(metric.exposition() for metric in self.metrics)
+
+
+def queue_metrics():
+    """
+    The state of the queue and the workers, right now
+    """
+    registry = Registry()
+    now = timezone.now()
+    priorities = dict(Measurement.PRIORITY_CHOICES)
+
+    depth = registry.add(Gauge('v6score_queue_depth', "Tests waiting to be run", ['priority']))
+    oldest = registry.add(Gauge('v6score_queue_oldest_age_seconds', "Age of the oldest waiting test", ['priority']))
+    per_priority = (Measurement.objects.queued()
+                    .filter(requested__lte=now, prescreen_pending=False)
+                    .values('priority')
+                    .annotate(tests=Count('id'), oldest=Min('requested'))
+                    .order_by('priority'))
+    counts = dict((row['priority'], row) for row in per_priority)
+    for priority, name in Measurement.PRIORITY_CHOICES:
+        row = counts.get(priority)
+        depth.set(row['tests'] if row else 0, priority=name)
+        oldest.set((now - row['oldest']).total_seconds() if row else 0, priority=name)
+
+    scheduled = registry.add(Gauge('v6score_queue_scheduled', "Tests that are queued for later, like retries",
+                                   ['priority']))
+    for row in (Measurement.objects.queued()
+                .filter(requested__gt=now)
+                .values('priority')
+                .annotate(tests=Count('id'))
+                .order_by('priority')):
+        scheduled.set(row['tests'], priority=priorities[row['priority']])
+
+    prescreen = registry.add(Gauge('v6score_prescreen_pending', "Tests waiting to be prescreened"))
+    prescreen.set(Measurement.objects.queued().filter(prescreen_pending=True).count())
+
+    running = registry.add(Gauge('v6score_tests_running', "Tests that have been claimed but not finished"))
+    running.set(Measurement.objects.filter(finished=None).exclude(started=None).count())
+
+    expired = registry.add(Gauge('v6score_leases_expired', "Running tests whose worker stopped renewing its lease"))
+    expired.set(Measurement.objects.filter(finished=None, lease_expires__lt=now).count())
+
+    recent = now - timedelta(seconds=RECENT_WINDOW)
+    started = registry.add(Gauge('v6score_tests_started_recently',
+                                 "Tests claimed in the last {} seconds".format(RECENT_WINDOW)))
+    started.set(Measurement.objects.filter(started__gte=recent).count())
+    finished = registry.add(Gauge('v6score_tests_finished_recently',
+                                  "Tests finished in the last {} seconds".format(RECENT_WINDOW)))
+    finished.set(Measurement.objects.filter(finished__gte=recent).count())
+
+    alive = now - timedelta(seconds=settings.WORKER_LEASE_TIME)
+    live_workers = list(Worker.objects.filter(stopped=None, last_heartbeat__gt=alive).order_by('pk'))
+    workers = registry.add(Gauge('v6score_workers_alive', "Workers that sent a heartbeat recently"))
+    workers.set(len(live_workers))
+    tests_finished = registry.add(Counter('v6score_worker_tests_finished_total', "Tests finished by a worker",
+                                          ['worker']))
+    for worker in live_workers:
+        tests_finished.inc(worker.tests_finished, worker='{}:{}'.format(worker.hostname, worker.pid))
+
+    return registry
+
+
+def retry_chain_length(measurement):
+    """
+    How many tests came before this one for the same problem
+    """
+    if not measurement.retry_for_id:
+        return 0
+
+    # Follow the whole chain in one query
+    table = connection.ops.quote_name(Measurement._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "WITH RECURSIVE chain(retry_for_id) AS ("
+            "SELECT retry_for_id FROM {table} WHERE id = %s "
+            "UNION ALL "
+            "SELECT {table}.retry_for_id FROM {table} JOIN chain ON {table}.id = chain.retry_for_id"
+            ") SELECT count(*) FROM chain WHERE retry_for_id IS NOT NULL".format(table=table),
+            [measurement.retry_for_id]
+        )
+        return cursor.fetchone()[0] + 1
+
+
+class WorkerMetrics:
+    """
+    What a run_tests process did since it started
+    """
+
+    def __init__(self):
+        self.registry = Registry()
+        self.claims = self.registry.add(Counter('v6score_worker_claims_total', "Attempts to claim tests"))
+        self.claimed = self.registry.add(Counter('v6score_worker_claimed_total', "Tests claimed"))
+        self.claim_seconds = self.registry.add(Histogram('v6score_worker_claim_seconds', "Time it took to claim tests",
+                                                         [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1]))
+        self.tests = self.registry.add(Counter('v6score_worker_tests_total', "Tests run"))
+        self.failures = self.registry.add(Counter('v6score_worker_test_failures_total', "Tests that failed",
+                                                  ['reason']))
+        self.retries = self.registry.add(Counter('v6score_worker_retries_scheduled_total', "Retries scheduled"))
+        self.chain_length = self.registry.add(Histogram('v6score_worker_retry_chain_length',
+                                                        "Number of earlier tries of the tests that were run",
+                                                        [0, 1, 2, 3, 5, 8]))
+        self.test_seconds = self.registry.add(Histogram('v6score_worker_test_seconds', "Time it took to run a test",
+                                                        [5, 10, 20, 30, 45, 60, 90, 120, 300]))
+        self.render_seconds = self.registry.add(Histogram('v6score_worker_render_seconds',
+                                                          "Time until the browser produced its output",
+                                                          [1, 2, 5, 10, 15, 20, 30, 60], ['leg']))
+
+        # Every reason shows up, even before the first failure
+        for bit, reason in FAILURE_REASONS:
+            self.failures.inc(0, reason=reason)
+
+    def add_claim(self, seconds, claimed):
+        self.claims.inc()
+        self.claimed.inc(claimed)
+        self.claim_seconds.observe(seconds)
+
+    def add_test(self, measurement, result, seconds):
+        self.tests.inc()
+        self.test_seconds.observe(seconds)
+        self.chain_length.observe(retry_chain_length(measurement))
+
+        for bit, reason in FAILURE_REASONS:
+            if result & bit:
+                self.failures.inc(reason=reason)
+
+        for leg, leg_name, host_setting in LEGS:
+            render = (measurement.timings or {}).get('render_{}'.format(leg_name))
+            if render is not None:
+                self.render_seconds.observe(render, leg=leg_name)
+
+    def push(self, url, worker):
+        """
+        Replace the metrics of this worker on a Pushgateway
+        """
+        grouping = '/metrics/job/v6score_worker/instance/{}'.format(
+            urllib.parse.quote('{}:{}'.format(worker.hostname, worker.pid), safe=''))
+        request = urllib.request.Request(url.rstrip('/') + grouping,
+                                         data=self.registry.exposition().encode('utf-8'),
+                                         headers={'Content-Type': EXPOSITION_CONTENT_TYPE},
+                                         method='PUT')
+        try:
+            with urllib.request.urlopen(request, timeout=PUSH_TIMEOUT):
+                pass
+        except OSError as e:
+            logger.warning("Could not push metrics to %s: %s", url, e)
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 22:10
+from __future__ import unicode_literals
+
+from django.db import migrations
+import v6score.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v6score', '0018_measurement_latest'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='measurement',
+            name='nat64_data',
+            field=v6score.fields.LazyJSONField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='measurement',
+            name='v4only_data',
+            field=v6score.fields.LazyJSONField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='measurement',
+            name='v6only_data',
+            field=v6score.fields.LazyJSONField(blank=True, null=True),
+        ),
+    ]
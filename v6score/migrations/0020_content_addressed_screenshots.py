@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 22:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import v6score.models
+import v6score.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v6score', '0019_lazy_json_fields'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='measurement',
+            name='nat64_image',
+            field=models.ImageField(blank=True, db_index=True, null=True, storage=v6score.storage.ContentAddressedStorage(), upload_to=v6score.models.my_basedir),
+        ),
+        migrations.AlterField(
+            model_name='measurement',
+            name='v4only_image',
+            field=models.ImageField(blank=True, db_index=True, null=True, storage=v6score.storage.ContentAddressedStorage(), upload_to=v6score.models.my_basedir),
+        ),
+        migrations.AlterField(
+            model_name='measurement',
+            name='v6only_image',
+            field=models.ImageField(blank=True, db_index=True, null=True, storage=v6score.storage.ContentAddressedStorage(), upload_to=v6score.models.my_basedir),
+        ),
+    ]
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import glob
+import hashlib
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models.query_utils import Q
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FIELDS = ('v4only_image', 'v6only_image', 'nat64_image')
+
+# Where screenshots were stored before content addressing
+OLD_SCREENSHOT_DIR = 'capture'
+
+
+# The storage and renditions modules keep changing, this migration has its own copy of what it needs
+def content_name(name, path):
+    """
+    The name under which the file is stored: the SHA-256 of its content, keeping the extension of the original name
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+
+    hex_digest = digest.hexdigest()
+    extension = os.path.splitext(name)[1].lower()
+    return 'cas/{}/{}/{}{}'.format(hex_digest[:2], hex_digest[2:4], hex_digest, extension)
+
+
+def store_file(path, name):
+    """
+    Copy the file to its content addressed name, without ever leaving a partial file under that name
+    """
+    full_path = os.path.join(settings.MEDIA_ROOT, name)
+    if os.path.exists(full_path):
+        return
+
+    directory = os.path.dirname(full_path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file, open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                temp_file.write(chunk)
+
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, full_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def delete_old_file(name):
+    try:
+        os.remove(os.path.join(settings.MEDIA_ROOT, name))
+    except FileNotFoundError:
+        pass
+
+    # Renditions of every size, whatever sizes there are now
+    base = os.path.splitext(name)[0]
+    for rendition in glob.glob(os.path.join(glob.escape(os.path.join(settings.MEDIA_ROOT, 'renditions')),
+                                            '*', glob.escape(base) + '.jpg')):
+        try:
+            os.remove(rendition)
+        except FileNotFoundError:
+            pass
+
+
+# noinspection PyUnusedLocal
+def dedupe_screenshots(apps, schema_editor):
+    """
+    Move existing screenshots into content addressed storage. Identical screenshots end up as a single file.
+    Every row is committed on its own, and the cleanup looks at what is on disk instead of at what this run moved, so
+    an interrupted run can simply be started again.
+    """
+    Measurement = apps.get_model('v6score', 'Measurement')
+
+    for measurement in Measurement.objects.only(*IMAGE_FIELDS).order_by('pk').iterator():
+        updates = {}
+        for field in IMAGE_FIELDS:
+            name = getattr(measurement, field).name
+            if not name or name.startswith('cas/'):
+                continue
+
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            try:
+                new_name = content_name(name, path)
+                store_file(path, new_name)
+            except FileNotFoundError:
+                logger.warning("Screenshot %s of measurement %s is missing", name, measurement.pk)
+                continue
+
+            updates[field] = new_name
+
+        if updates:
+            Measurement.objects.filter(pk=measurement.pk).update(**updates)
+
+    # Only the rows whose file was missing still refer to old names
+    old_names = Q()
+    for field in IMAGE_FIELDS:
+        old_names |= Q(**{'{}__startswith'.format(field): OLD_SCREENSHOT_DIR + '/'})
+    referenced = set()
+    for row in Measurement.objects.filter(old_names).values_list(*IMAGE_FIELDS):
+        referenced.update(row)
+
+    # Remove every old file that nothing refers to anymore, including the ones an interrupted run left behind
+    root = os.path.join(settings.MEDIA_ROOT, OLD_SCREENSHOT_DIR)
+    for directory, sub_directories, filenames in os.walk(root, topdown=False):
+        for filename in filenames:
+            name = os.path.relpath(os.path.join(directory, filename), settings.MEDIA_ROOT).replace(os.sep, '/')
+            if name not in referenced:
+                delete_old_file(name)
+
+        try:
+            os.rmdir(directory)
+        except OSError:
+            # Not empty
+            pass
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('v6score', '0020_content_addressed_screenshots'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_screenshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 22:23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+import v6score.models
+import v6score.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v6score', '0021_dedupe_screenshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PackedBlob',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('segment', models.PositiveIntegerField(db_index=True)),
+                ('offset', models.BigIntegerField()),
+                ('length', models.PositiveIntegerField()),
+                ('stored', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='measurement',
+            name='nat64_image',
+            field=models.ImageField(blank=True, db_index=True, null=True, storage=v6score.storage.PackfileStorage(), upload_to=v6score.models.my_basedir),
+        ),
+        migrations.AlterField(
+            model_name='measurement',
+            name='v4only_image',
+            field=models.ImageField(blank=True, db_index=True, null=True, storage=v6score.storage.PackfileStorage(), upload_to=v6score.models.my_basedir),
+        ),
+        migrations.AlterField(
+            model_name='measurement',
+            name='v6only_image',
+            field=models.ImageField(blank=True, db_index=True, null=True, storage=v6score.storage.PackfileStorage(), upload_to=v6score.models.my_basedir),
+        ),
+    ]
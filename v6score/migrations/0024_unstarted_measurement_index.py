@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v6score', '0023_measurement_images_optimized'),
+    ]
+
+    operations = [
+        # The queue of pending tests is a small part of the table, keep it in an index of its own
+        migrations.RunSQL(
+            "CREATE INDEX v6score_measurement_unstarted ON v6score_measurement (requested) WHERE started IS NULL",
+            "DROP INDEX v6score_measurement_unstarted",
+        ),
+    ]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 22:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v6score', '0024_unstarted_measurement_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Worker',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hostname', models.CharField(max_length=255)),
+                ('pid', models.PositiveIntegerField()),
+                ('started', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_heartbeat', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('stopped', models.DateTimeField(blank=True, null=True)),
+                ('tests_finished', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='lease_expires',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='worker',
+            name='current_measurement',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='v6score.Measurement'),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='worker',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='measurements', to='v6score.Worker'),
+        ),
+        # Tests that were left behind by crashed workers before there were leases go back to the queue
+        migrations.RunSQL(
+            "UPDATE v6score_measurement SET lease_expires = started + interval '1 hour' "
+            "WHERE started IS NOT NULL AND finished IS NULL",
+            migrations.RunSQL.noop,
+        ),
+    ]
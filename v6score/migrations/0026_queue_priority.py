@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 22:32
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v6score', '0025_worker_leases'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='measurement',
+            name='host',
+            field=models.CharField(blank=True, db_index=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'interactive'), (1, 'monitoring'), (2, 'bulk'), (3, 'retry')], db_index=True, default=2),
+        ),
+        migrations.RunSQL(
+            "UPDATE v6score_measurement "
+            "SET host = lower(substring(url from '^[a-zA-Z][a-zA-Z0-9+.-]*://([^/?#]*)'))",
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            "UPDATE v6score_measurement SET priority = CASE "
+            "WHEN manual THEN 0 "
+            "WHEN retry_for_id IS NOT NULL THEN 3 "
+            "ELSE 2 END "
+            "WHERE finished IS NULL",
+            migrations.RunSQL.noop,
+        ),
+        # Workers claim pending tests per priority class, and count the running tests per host
+        migrations.RunSQL(
+            "DROP INDEX v6score_measurement_unstarted",
+            "CREATE INDEX v6score_measurement_unstarted ON v6score_measurement (requested) WHERE started IS NULL",
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX v6score_measurement_unstarted ON v6score_measurement (priority, requested) "
+            "WHERE started IS NULL",
+            "DROP INDEX v6score_measurement_unstarted",
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX v6score_measurement_running ON v6score_measurement (host) "
+            "WHERE started IS NOT NULL AND finished IS NULL",
+            "DROP INDEX v6score_measurement_running",
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 22:34
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v6score', '0026_queue_priority'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='measurement',
+            name='retry_legs',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='reused_legs',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
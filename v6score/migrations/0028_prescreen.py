@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 22:38
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import v6score.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v6score', '0027_retry_legs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='measurement',
+            name='prescreen_pending',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='prescreen_results',
+            field=v6score.fields.LazyJSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 22:41
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v6score', '0028_prescreen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('source', models.CharField(blank=True, max_length=255)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('state', models.CharField(choices=[('running', 'running'), ('paused', 'paused'), ('cancelled', 'cancelled')], db_index=True, default='running', max_length=10)),
+                ('rows_imported', models.PositiveIntegerField(default=0)),
+                ('import_complete', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='scan_run',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='measurements', to='v6score.ScanRun'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 22:47
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v6score', '0029_scan_runs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='measurement',
+            name='phase',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+    ]
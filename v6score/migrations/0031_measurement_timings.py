@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 22:49
+from __future__ import unicode_literals
+
+from django.db import migrations
+import v6score.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v6score', '0030_measurement_phase'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='measurement',
+            name='timings',
+            field=v6score.fields.LazyJSONField(blank=True, null=True),
+        ),
+    ]
@@ -9,8 +9,9 @@ import shlex
 import signal
 import socket
 import subprocess
+import time
 import warnings
-from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import timedelta
 from ipaddress import IPv4Address, IPv6Address, ip_address
 from typing import Iterable, List, Union
@@ -18,21 +19,60 @@ from urllib.parse import urlparse, urlunparse
 
 import skimage.io
 import yaml
-from django.contrib.postgres.fields import JSONField
 from django.contrib.postgres.fields.array import ArrayField
 from django.core.files.base import ContentFile
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models.expressions import F
+from django.db.models.query_utils import Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.utils import timezone
 from paramiko.client import SSHClient
 from paramiko.rsakey import RSAKey
-from psycopg2.extras import register_default_json, register_default_jsonb
 from skimage.measure import compare_ssim
 
 from nat64check import settings
+from v6score.caching import invalidate_measurement_pages, invalidate_overview
+from v6score.fields import LazyJSONField
+from v6score.logs import log_context
+from v6score.notifications import notify_progress, notify_workers
+from v6score.renditions import copy_renditions, create_renditions, delete_renditions
+from v6score.screenshots import load_screenshot, reencode_image
+from v6score.storage import screenshot_storage
 
 logger = logging.getLogger(__name__)
 
+IMAGE_FIELDS = ('v4only_image', 'v6only_image', 'nat64_image')
+
+PING_FIELDS = ('ping4_latencies', 'ping4_1500_latencies', 'ping4_2000_latencies',
+               'ping6_latencies', 'ping6_1500_latencies', 'ping6_2000_latencies')
+
+# Owned by the queue while a test runs: the worker renews the lease in the database, see Worker.heartbeat
+QUEUE_FIELDS = ('worker', 'started', 'lease_expires')
+
+# The browser tests, as bits in the result of run_test and in retry_legs
+LEG_V4ONLY = 1
+LEG_V6ONLY = 2
+LEG_NAT64 = 4
+ALL_LEGS = LEG_V4ONLY | LEG_V6ONLY | LEG_NAT64
+
+LEGS = (
+    (LEG_V4ONLY, 'v4only', 'V4_HOST'),
+    (LEG_V6ONLY, 'v6only', 'V6_HOST'),
+    (LEG_NAT64, 'nat64', 'NAT64_HOST'),
+)
+
+# The phases of a test that are timed, in the order they happen. Render is the time until the browser produced output,
+# transfer the time it took to read that output.
+TIMING_PHASES = (('dns', 'ping', 'ssh_connect') +
+                 tuple('render_{}'.format(leg_name) for leg, leg_name, host_setting in LEGS) +
+                 tuple('transfer_{}'.format(leg_name) for leg, leg_name, host_setting in LEGS) +
+                 ('png_decode', 'reencode', 'store_images', 'ssim', 'db_save'))
+
+# First key of the advisory locks that serialise claiming tests for the same host
+HOST_LOCK_NAMESPACE = 6464
+
 
 def get_addresses(hostname) -> List[Union[IPv4Address, IPv6Address]]:
     # Get DNS info
@@ -89,6 +129,7 @@ def parse_ping(ping_output: bytes) -> List:
 
 
 def my_basedir(instance, filename):
+    # Screenshots are stored under the hash of their content, this only provides the extension
     return 'capture/{}/{}/{}'.format(instance.idna_hostname,
                                      datetime.datetime.now().strftime('%Y-%m-%d/%H-%M'),
                                      filename)
@@ -101,31 +142,216 @@ def ignore_signals():
 
 
 class MeasurementManager(models.Manager):
+    @staticmethod
+    def overview(search='', test='', score=''):
+        """
+        The latest finished measurements, filtered like the overview page does
+        """
+        measurements = (Measurement.objects
+                        .filter(latest=True)
+                        .exclude(finished=None)
+                        .exclude(v6only_image_score=None, nat64_image_score=None)
+                        .order_by('-finished'))
+
+        if search:
+            measurements = measurements.filter(url__contains=search)
+
+        if test == 'nat64':
+            if score == 'poor':
+                measurements = measurements.filter(nat64_image_score__lt=0.8)
+            elif score == 'mediocre':
+                measurements = measurements.filter(nat64_image_score__gte=0.8, nat64_image_score__lt=0.95)
+            elif score == 'good':
+                measurements = measurements.filter(nat64_image_score__gte=0.95)
+            else:
+                measurements = measurements.exclude(nat64_image_score=None)
+        elif test == 'ipv6':
+            if score == 'poor':
+                measurements = measurements.filter(v6only_image_score__lt=0.8)
+            elif score == 'mediocre':
+                measurements = measurements.filter(v6only_image_score__gte=0.8, v6only_image_score__lt=0.95)
+            elif score == 'good':
+                measurements = measurements.filter(v6only_image_score__gte=0.95)
+            else:
+                measurements = measurements.exclude(v6only_image_score=None)
+        else:
+            if score == 'poor':
+                measurements = measurements.filter(Q(nat64_image_score__lt=0.8) | Q(v6only_image_score__lt=0.8))
+            elif score == 'mediocre':
+                measurements = measurements.filter(Q(nat64_image_score__gte=0.8, nat64_image_score__lt=0.95,
+                                                     v6only_image_score__gte=0.8) |
+                                                   Q(v6only_image_score__gte=0.8, v6only_image_score__lt=0.95,
+                                                     nat64_image_score__gte=0.8))
+            elif score == 'good':
+                measurements = measurements.filter(nat64_image_score__gte=0.95, v6only_image_score__gte=0.95)
+
+        return measurements
+
+    def browser_tested(self):
+        """
+        Leave out the measurements that the prescreen finished by itself, they have no browser data to show
+        """
+        return self.exclude(prescreen_results__isnull=False, v4only_data=None)
+
     @staticmethod
     def get_measurement_for_url(url, force_new=False):
         measurement = Measurement.objects.filter(url=url, started=None).order_by('requested').first()
         if measurement:
             if not measurement.manual:
-                # Mark as manual
+                # Mark as manual, someone wants to see the full test
                 measurement.manual = True
+                measurement.priority = Measurement.PRIORITY_INTERACTIVE
+                measurement.prescreen_pending = False
 
             if not measurement.started or measurement.started < (timezone.now() - timedelta(minutes=5)):
                 # Measurement not started, or measurement started more than 5 minutes ago (broken)
                 measurement.requested = timezone.now()
                 measurement.started = None
                 measurement.save()
+                notify_workers()
         else:
             recent = timezone.now() - timedelta(minutes=10)
-            measurement = Measurement.objects.filter(url=url, finished__gt=recent).order_by('-finished').first()
+            measurement = (Measurement.objects
+                           .browser_tested()
+                           .filter(url=url, finished__gt=recent)
+                           .order_by('-finished')
+                           .first())
             if not measurement or force_new:
-                measurement = Measurement(url=url, requested=timezone.now(), manual=True)
+                measurement = Measurement(url=url, requested=timezone.now(), manual=True,
+                                          priority=Measurement.PRIORITY_INTERACTIVE)
                 measurement.save()
+                notify_workers()
 
         return measurement
 
+    def claim(self, worker, batch_size=1, priority=None, manual_only=False, retry_only=False):
+        """
+        Take ownership of up to batch_size pending measurements, oldest request first. Rows that other workers are
+        claiming at the same moment are skipped instead of waited for. The worker holds a lease on them that it has
+        to renew, see Worker.heartbeat.
+
+        No more than QUEUE_HOST_CONCURRENCY tests run against the same host at the same time.
+        """
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        scan_run_table = connection.ops.quote_name(ScanRun._meta.db_table)
+        conditions = [
+            'started IS NULL',
+            'requested <= %s',
+            'NOT prescreen_pending',
+
+            # Tests of paused scan runs stay in the queue until the run is resumed
+            '(scan_run_id IS NULL OR scan_run_id IN (SELECT id FROM {} WHERE state = %s))'.format(scan_run_table),
+
+            # Skip hosts that are already busy, they are checked properly below
+            'host NOT IN (SELECT host FROM {table} WHERE started IS NOT NULL AND finished IS NULL '
+            'GROUP BY host HAVING count(*) >= %s)'.format(table=table),
+        ]
+        now = timezone.now()
+        params = [now, ScanRun.STATE_RUNNING, settings.QUEUE_HOST_CONCURRENCY]
+        if priority is not None:
+            conditions.append('priority = %s')
+            params.append(priority)
+        if manual_only:
+            conditions.append('manual')
+        if retry_only:
+            conditions.append('retry_for_id IS NOT NULL')
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Look at a few more than we need, some hosts might already be busy
+            cursor.execute(
+                "SELECT id, host FROM {table} WHERE {conditions} "
+                "ORDER BY requested LIMIT %s "
+                "FOR UPDATE SKIP LOCKED".format(table=table, conditions=' AND '.join(conditions)),
+                params + [batch_size * 4]
+            )
+            candidates = cursor.fetchall()
+
+            # Only one worker at a time can claim tests for a host, so the counts below are accurate. Locks are
+            # taken in the same order by everyone to prevent deadlocks.
+            running = {}
+            for host in sorted({host for measurement_id, host in candidates}):
+                cursor.execute("SELECT pg_advisory_xact_lock(%s, hashtext(%s))", [HOST_LOCK_NAMESPACE, host])
+                cursor.execute(
+                    "SELECT count(*) FROM {table} "
+                    "WHERE host = %s AND started IS NOT NULL AND finished IS NULL".format(table=table),
+                    [host]
+                )
+                running[host] = cursor.fetchone()[0]
+
+            claimed_ids = []
+            for measurement_id, host in candidates:
+                if len(claimed_ids) >= batch_size:
+                    break
+                if running[host] >= settings.QUEUE_HOST_CONCURRENCY:
+                    continue
+
+                running[host] += 1
+                claimed_ids.append(measurement_id)
+
+            if not claimed_ids:
+                return []
+
+            cursor.execute(
+                "UPDATE {table} SET started = %s, worker_id = %s, lease_expires = %s "
+                "WHERE id = ANY(%s)".format(table=table),
+                [now, worker.pk, now + timedelta(seconds=settings.WORKER_LEASE_TIME), claimed_ids]
+            )
+
+        return list(self.filter(pk__in=claimed_ids).order_by('requested'))
+
+    def queued(self):
+        """
+        Measurements waiting to be run, except those of scan runs that are paused
+        """
+        return self.filter(Q(scan_run=None) | Q(scan_run__state=ScanRun.STATE_RUNNING), started=None)
+
+    def release(self, measurements):
+        """
+        Give claimed measurements that haven't been run back to the queue
+        """
+        return (self
+                .filter(pk__in=[measurement.pk for measurement in measurements], finished=None)
+                .update(started=None, worker=None, lease_expires=None))
+
+    def requeue_expired(self):
+        """
+        Give measurements back to the queue when the worker that claimed them stopped renewing its lease
+        """
+        requeued = (self
+                    .filter(finished=None, lease_expires__lt=timezone.now())
+                    .update(started=None, worker=None, lease_expires=None))
+
+        if requeued:
+            logger.warning("Requeued %s measurements with an expired lease", requeued)
+            notify_workers()
+
+        return requeued
+
 
 class Measurement(models.Model):
+    PRIORITY_INTERACTIVE = 0
+    PRIORITY_MONITORING = 1
+    PRIORITY_BULK = 2
+    PRIORITY_RETRY = 3
+
+    PRIORITY_CHOICES = (
+        (PRIORITY_INTERACTIVE, 'interactive'),
+        (PRIORITY_MONITORING, 'monitoring'),
+        (PRIORITY_BULK, 'bulk'),
+        (PRIORITY_RETRY, 'retry'),
+    )
+
+    # What run_test is doing, for the progress shown to visitors. After the render phase every leg that finishes
+    # loading is announced with the name of the leg.
+    PHASE_DNS = 'dns'
+    PHASE_PING = 'ping'
+    PHASE_RENDER = 'render'
+    PHASE_SCORING = 'scoring'
+    PHASE_DONE = 'done'
+
     url = models.URLField(db_index=True)
+    host = models.CharField(max_length=255, blank=True, db_index=True)
+    priority = models.PositiveSmallIntegerField(choices=PRIORITY_CHOICES, default=PRIORITY_BULK, db_index=True)
 
     manual = models.BooleanField(default=False, db_index=True)
     retry_for = models.ForeignKey('self', blank=True, null=True, db_index=True)
@@ -135,6 +361,10 @@ class Measurement(models.Model):
     finished = models.DateTimeField(blank=True, null=True, db_index=True)
     latest = models.BooleanField(default=False, db_index=True)
 
+    worker = models.ForeignKey('Worker', blank=True, null=True, on_delete=models.SET_NULL,
+                               related_name='measurements')
+    lease_expires = models.DateTimeField(blank=True, null=True, db_index=True)
+
     dns_results = ArrayField(models.GenericIPAddressField(), blank=True, default=list)
 
     ping4_latencies = ArrayField(models.FloatField(), blank=True, default=list)
@@ -144,17 +374,20 @@ class Measurement(models.Model):
     ping6_1500_latencies = ArrayField(models.FloatField(), blank=True, default=list)
     ping6_2000_latencies = ArrayField(models.FloatField(), blank=True, default=list)
 
-    v4only_image = models.ImageField(upload_to=my_basedir, blank=True, null=True)
-    v6only_image = models.ImageField(upload_to=my_basedir, blank=True, null=True)
-    nat64_image = models.ImageField(upload_to=my_basedir, blank=True, null=True)
+    v4only_image = models.ImageField(upload_to=my_basedir, storage=screenshot_storage,
+                                     blank=True, null=True, db_index=True)
+    v6only_image = models.ImageField(upload_to=my_basedir, storage=screenshot_storage,
+                                     blank=True, null=True, db_index=True)
+    nat64_image = models.ImageField(upload_to=my_basedir, storage=screenshot_storage,
+                                    blank=True, null=True, db_index=True)
 
-    v4only_data = JSONField(blank=True, null=True)
+    v4only_data = LazyJSONField(blank=True, null=True)
     v4only_debug = models.TextField(blank=True)
 
-    v6only_data = JSONField(blank=True, null=True)
+    v6only_data = LazyJSONField(blank=True, null=True)
     v6only_debug = models.TextField(blank=True)
 
-    nat64_data = JSONField(blank=True, null=True)
+    nat64_data = LazyJSONField(blank=True, null=True)
     nat64_debug = models.TextField(blank=True)
 
     v6only_image_score = models.FloatField(blank=True, null=True, db_index=True)
@@ -163,6 +396,24 @@ class Measurement(models.Model):
     v6only_resource_score = models.FloatField(blank=True, null=True, db_index=True)
     nat64_resource_score = models.FloatField(blank=True, null=True, db_index=True)
 
+    images_optimized = models.BooleanField(default=False, db_index=True)
+
+    # Legs to run again when this is a retry, and legs that were copied from the measurement being retried
+    retry_legs = models.PositiveSmallIntegerField(default=0)
+    reused_legs = models.PositiveSmallIntegerField(default=0)
+
+    # Waiting for the prescreen, which decides whether a browser test is needed. Workers leave these alone.
+    prescreen_pending = models.BooleanField(default=False)
+    prescreen_results = LazyJSONField(blank=True, null=True)
+
+    scan_run = models.ForeignKey('ScanRun', blank=True, null=True, on_delete=models.SET_NULL,
+                                 related_name='measurements')
+
+    phase = models.CharField(max_length=10, blank=True)
+
+    # Seconds spent in each phase of the test, see TIMING_PHASES
+    timings = LazyJSONField(blank=True, null=True)
+
     objects = MeasurementManager()
 
     class Meta:
@@ -185,6 +436,43 @@ class Measurement(models.Model):
     def get_absolute_url(self):
         return reverse('measurement', args=(self.pk,))
 
+    def save(self, *args, **kwargs):
+        # Used to limit the number of tests running against the same host
+        self.host = self.hostname.lower()
+        super().save(*args, **kwargs)
+
+    def save_results(self):
+        """
+        Save what the test found so far. The queue fields are left alone, writing back the lease this measurement
+        was loaded with would undo the renewals of the worker.
+        """
+        if self.pk is None:
+            self.save()
+        else:
+            self.save(update_fields=[field.name for field in self._meta.concrete_fields
+                                     if not field.primary_key and field.name not in QUEUE_FIELDS])
+
+    @contextmanager
+    def timed(self, phase):
+        """
+        Add the time spent in the with block to the timings of this phase
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_timing(phase, time.monotonic() - start)
+
+    def add_timing(self, phase, seconds):
+        if self.timings is None:
+            self.timings = {}
+        self.timings[phase] = round(self.timings.get(phase, 0.0) + seconds, 3)
+
+    def set_phase(self, phase):
+        self.phase = phase
+        Measurement.objects.filter(pk=self.pk).update(phase=phase)
+        notify_progress(self.pk, phase)
+
     @property
     def hostname(self):
         url_parts = urlparse(self.url, scheme='http')
@@ -292,33 +580,38 @@ class Measurement(models.Model):
 
     def run_dns_tests(self):
         if self.finished:
-            logger.error("{}: test already finished".format(self.url))
+            logger.error("%s: test already finished", self.url)
             return
 
-        dns_results = get_addresses(self.idna_hostname)
+        with self.timed('dns'):
+            dns_results = get_addresses(self.idna_hostname)
 
         # If no records and no www in URL then try again with www
         if not dns_results and not self.idna_hostname.startswith('www.'):
             try_hostname = 'www.' + self.idna_hostname
-            dns_results = get_addresses(try_hostname)
+            with self.timed('dns'):
+                dns_results = get_addresses(try_hostname)
             if not dns_results:
-                logger.error("Hostname {} doesn't resolve".format(self.idna_hostname))
+                logger.error("Hostname %s doesn't resolve", self.idna_hostname)
             else:
-                logger.warning("Hostname {} didn't resolve, using {}".format(self.idna_hostname, try_hostname))
+                logger.warning("Hostname %s didn't resolve, using %s", self.idna_hostname, try_hostname)
                 self.idna_hostname = try_hostname
 
         if dns_results:
             for address in dns_results:
-                logger.info("Found address for {}: {}".format(self.idna_hostname, address))
+                logger.info("Found address for %s: %s", self.idna_hostname, address)
 
         self.dns_results = dns_results
-        self.save()
+        with self.timed('db_save'):
+            self.save_results()
 
     def run_ping_tests(self):
         if self.finished:
-            logger.error("{}: test already finished".format(self.url))
+            logger.error("%s: test already finished", self.url)
             return
 
+        start = time.monotonic()
+
         # Ping
         if self.ipv4_dns_results:
             ping4_process = start_ping(['ping', '-c5', '-n', self.idna_hostname])
@@ -336,31 +629,101 @@ class Measurement(models.Model):
 
         if ping4_process:
             self.ping4_latencies = parse_ping(ping4_process.communicate()[0])
-            logger.info("Ping IPv4 results: {}".format(self.ping4_latencies))
+            logger.info("Ping IPv4 results: %s", self.ping4_latencies)
 
         if ping4_1500_process:
             self.ping4_1500_latencies = parse_ping(ping4_1500_process.communicate()[0])
-            logger.info("Ping IPv4 (1500) results: {}".format(self.ping4_1500_latencies))
+            logger.info("Ping IPv4 (1500) results: %s", self.ping4_1500_latencies)
 
         if ping4_2000_process:
             self.ping4_2000_latencies = parse_ping(ping4_2000_process.communicate()[0])
-            logger.info("Ping IPv4 (2000) results: {}".format(self.ping4_2000_latencies))
+            logger.info("Ping IPv4 (2000) results: %s", self.ping4_2000_latencies)
 
         if ping6_process:
             self.ping6_latencies = parse_ping(ping6_process.communicate()[0])
-            logger.info("Ping IPv6 results: {}".format(self.ping6_latencies))
+            logger.info("Ping IPv6 results: %s", self.ping6_latencies)
 
         if ping6_1500_process:
             self.ping6_1500_latencies = parse_ping(ping6_1500_process.communicate()[0])
-            logger.info("Ping IPv6 (1500) results: {}".format(self.ping6_1500_latencies))
+            logger.info("Ping IPv6 (1500) results: %s", self.ping6_1500_latencies)
 
         if ping6_2000_process:
             self.ping6_2000_latencies = parse_ping(ping6_2000_process.communicate()[0])
-            logger.info("Ping IPv6 (2000) results: {}".format(self.ping6_2000_latencies))
-
-        self.save()
-
-    def run_browser_tests(self):
+            logger.info("Ping IPv6 (2000) results: %s", self.ping6_2000_latencies)
+
+        self.add_timing('ping', time.monotonic() - start)
+
+        with self.timed('db_save'):
+            self.save_results()
+
+    def start_browser(self, host, browser_command, private_key):
+        client = SSHClient()
+        client.load_host_keys(settings.SSH_KNOWN_HOSTS)
+        client.connect(host,
+                       username=settings.SSH_USERNAME, pkey=private_key,
+                       allow_agent=False, look_for_keys=False)
+
+        logger.debug("Running '%s' on %s", browser_command, host)
+        stdin, stdout, stderr = client.exec_command(browser_command, timeout=120)
+        return client, stdin, stdout, stderr
+
+    def receive_browser_results(self, leg_name, stdout, stderr, render_start):
+        """
+        Store the data of a finished browser run, returns the bytes of the screenshot and the decoded screenshot
+        """
+        img_bytes = None
+        img = None
+
+        # The browser only writes its output when it's done. The legs are read one after the other, so for later
+        # legs this is when we got to them, the rendering may have finished earlier.
+        first_byte = stdout.read(1)
+        self.add_timing('render_{}'.format(leg_name), time.monotonic() - render_start)
+
+        with self.timed('transfer_{}'.format(leg_name)):
+            json_output = first_byte + stdout.read()
+            debug_output = stderr.read()
+            exit_code = stdout.channel.recv_exit_status()
+
+        data = json.loads(json_output.decode('utf-8')) if json_output else {}
+        data['exit_code'] = exit_code
+
+        if 'image' in data:
+            if data['image']:
+                with self.timed('png_decode'):
+                    img_bytes = base64.decodebytes(data['image'].encode('ascii'))
+                    # noinspection PyTypeChecker
+                    img = skimage.io.imread(io.BytesIO(img_bytes))
+            del data['image']
+
+        setattr(self, '{}_data'.format(leg_name), data)
+        setattr(self, '{}_debug'.format(leg_name), debug_output.decode('utf-8'))
+
+        return img_bytes, img
+
+    def reuse_leg(self, leg_name, measurement):
+        """
+        Copy the results of a leg from another measurement, returns the decoded screenshot
+        """
+        logger.info("%s: Reusing %s results of test #%s", self.url, leg_name, measurement.pk)
+
+        for attribute in ('{}_data', '{}_debug'):
+            attribute = attribute.format(leg_name)
+            setattr(self, attribute, getattr(measurement, attribute))
+
+        # Screenshots are stored by content, both measurements can simply use the same file
+        image = getattr(measurement, '{}_image'.format(leg_name))
+        setattr(self, '{}_image'.format(leg_name), image.name or None)
+        if not image:
+            return None
+
+        with self.timed('png_decode'):
+            return load_screenshot(image)
+
+    def run_browser_tests(self, legs=ALL_LEGS, reuse_from=None):
+        """
+        Render the page over the legs in the legs bitmask. The results of the other legs are copied from
+        measurement reuse_from, if given.
+        """
         common_options = [
             'phantomjs',
             '--debug=true',
@@ -376,48 +739,16 @@ class Measurement(models.Model):
         # Read the private key
         private_key = RSAKey.from_private_key_file(settings.SSH_PRIVATE_KEY)
 
-        # Do the v4-only, v6-only and the NAT64 request in parallel
-        v4only_client = SSHClient()
-        v4only_client.load_host_keys(settings.SSH_KNOWN_HOSTS)
-        v4only_client.connect(settings.V4_HOST,
-                              username=settings.SSH_USERNAME, pkey=private_key,
-                              allow_agent=False, look_for_keys=False)
-
-        logger.debug("Running '{}' on {}".format(browser_command, settings.V4_HOST))
-        v4only_stdin, v4only_stdout, v4only_stderr = v4only_client.exec_command(browser_command, timeout=120)
-
-        if self.ipv6_dns_results:
-            v6only_client = SSHClient()
-            v6only_client.load_host_keys(settings.SSH_KNOWN_HOSTS)
-            v6only_client.connect(settings.V6_HOST,
-                                  username=settings.SSH_USERNAME, pkey=private_key,
-                                  allow_agent=False, look_for_keys=False)
-
-            logger.debug("Running '{}' on {}".format(browser_command, settings.V4_HOST))
-            v6only_stdin, v6only_stdout, v6only_stderr = v6only_client.exec_command(browser_command, timeout=120)
-        else:
-            v6only_client = v6only_stdin = v6only_stdout = v6only_stderr = None
-
-        nat64_client = SSHClient()
-        nat64_client.load_host_keys(settings.SSH_KNOWN_HOSTS)
-        nat64_client.connect(settings.NAT64_HOST,
-                             username=settings.SSH_USERNAME, pkey=private_key,
-                             allow_agent=False, look_for_keys=False)
-
-        logger.debug("Running '{}' on {}".format(browser_command, settings.V4_HOST))
-        nat64_stdin, nat64_stdout, nat64_stderr = nat64_client.exec_command(browser_command, timeout=120)
-
-        # Placeholders
-        v4only_img = None
-        v4only_img_bytes = None
-        v6only_img = None
-        v6only_img_bytes = None
-        nat64_img = None
-        nat64_img_bytes = None
+        requested_legs = legs
+        if not self.ipv6_dns_results:
+            legs &= ~LEG_V6ONLY
 
-        self.v4only_data = {}
-        self.v6only_data = {}
-        self.nat64_data = {}
+        # Do the v4-only, v6-only and the NAT64 request in parallel
+        sessions = {}
+        for leg, leg_name, host_setting in LEGS:
+            if legs & leg:
+                with self.timed('ssh_connect'):
+                    sessions[leg] = self.start_browser(getattr(settings, host_setting), browser_command, private_key)
 
         # Push the test script to the workers
         script_filename = os.path.realpath(os.path.join(
@@ -426,197 +757,481 @@ class Measurement(models.Model):
         ))
         script = open(script_filename, 'rb').read()
 
-        v4only_stdin.write(script)
-        v4only_stdin.close()
-        v4only_stdin.channel.shutdown_write()
-
-        if v6only_client:
-            v6only_stdin.write(script)
-            v6only_stdin.close()
-            v6only_stdin.channel.shutdown_write()
+        for client, stdin, stdout, stderr in sessions.values():
+            stdin.write(script)
+            stdin.close()
+            stdin.channel.shutdown_write()
 
-        nat64_stdin.write(script)
-        nat64_stdin.close()
-        nat64_stdin.channel.shutdown_write()
+        render_start = time.monotonic()
+        self.set_phase(self.PHASE_RENDER)
 
         # Wait for tests to finish
-        try:
-            logger.debug("Receiving data from IPv4-only test")
-
-            v4only_json = v4only_stdout.read()
-            v4only_debug = v4only_stderr.read()
-            v4only_exit = v4only_stdout.channel.recv_exit_status()
-
-            self.v4only_data = json.loads(
-                v4only_json.decode('utf-8'),
-                object_pairs_hook=OrderedDict
-            ) if v4only_json else {}
-            self.v4only_debug = v4only_debug.decode('utf-8')
-
-            self.v4only_data['exit_code'] = v4only_exit
-
-            if 'image' in self.v4only_data:
-                if self.v4only_data['image']:
-                    v4only_img_bytes = base64.decodebytes(self.v4only_data['image'].encode('ascii'))
-                    # noinspection PyTypeChecker
-                    v4only_img = skimage.io.imread(io.BytesIO(v4only_img_bytes))
-                del self.v4only_data['image']
-        except socket.timeout:
-            logger.error("{}: IPv4-only load timed out".format(self.url))
-
-        if v6only_client:
-            try:
-                logger.debug("Receiving data from IPv6-only test")
-
-                v6only_json = v6only_stdout.read()
-                v6only_debug = v6only_stderr.read()
-                v6only_exit = v6only_stdout.channel.recv_exit_status()
-
-                self.v6only_data = json.loads(
-                    v6only_json.decode('utf-8'),
-                    object_pairs_hook=OrderedDict
-                ) if v6only_json else {}
-                self.v6only_debug = v6only_debug.decode('utf-8')
-
-                self.v6only_data['exit_code'] = v6only_exit
-
-                if 'image' in self.v6only_data:
-                    if self.v6only_data['image']:
-                        v6only_img_bytes = base64.decodebytes(self.v6only_data['image'].encode('ascii'))
-                        # noinspection PyTypeChecker
-                        v6only_img = skimage.io.imread(io.BytesIO(v6only_img_bytes))
-                    del self.v6only_data['image']
-            except socket.timeout:
-                logger.error("{}: IPv6-only load timed out".format(self.url))
-        else:
-            logger.info("{}: Not running IPv6-only test".format(self.url))
-
-        try:
-            logger.debug("Receiving data from NAT64 test")
-
-            nat64_json = nat64_stdout.read()
-            nat64_debug = nat64_stderr.read()
-            nat64_exit = nat64_stdout.channel.recv_exit_status()
-
-            self.nat64_data = json.loads(
-                nat64_json.decode('utf-8'),
-                object_pairs_hook=OrderedDict
-            ) if nat64_json else {}
-            self.nat64_debug = nat64_debug.decode('utf-8')
-
-            self.nat64_data['exit_code'] = nat64_exit
-
-            if 'image' in self.nat64_data:
-                if self.nat64_data['image']:
-                    nat64_img_bytes = base64.decodebytes(self.nat64_data['image'].encode('ascii'))
-                    # noinspection PyTypeChecker
-                    nat64_img = skimage.io.imread(io.BytesIO(nat64_img_bytes))
-                del self.nat64_data['image']
-        except socket.timeout:
-            logger.error("{}: NAT64 load timed out".format(self.url))
+        img_bytes = {}
+        imgs = {}
+        for leg, leg_name, host_setting in LEGS:
+            if leg in sessions:
+                setattr(self, '{}_data'.format(leg_name), {})
+                client, stdin, stdout, stderr = sessions[leg]
+                try:
+                    logger.debug("Receiving data from %s test", leg_name)
+                    img_bytes[leg], imgs[leg] = self.receive_browser_results(leg_name, stdout, stderr, render_start)
+                except socket.timeout:
+                    logger.error("%s: %s load timed out", self.url, leg_name)
+                self.set_phase(leg_name)
+            elif reuse_from and not requested_legs & leg:
+                imgs[leg] = self.reuse_leg(leg_name, reuse_from)
+            else:
+                logger.info("%s: Not running %s test", self.url, leg_name)
+                setattr(self, '{}_data'.format(leg_name), {})
+                setattr(self, '{}_image'.format(leg_name), None)
 
         # Done talking to workers, close connections
-        if v4only_client:
-            v4only_client.close()
-        if v6only_client:
-            v6only_client.close()
-        if nat64_client:
-            nat64_client.close()
+        for client, stdin, stdout, stderr in sessions.values():
+            client.close()
+
+        self.set_phase(self.PHASE_SCORING)
 
         # Calculate score based on resources
         v4only_resources_ok = self.v4only_resources[0]
         if v4only_resources_ok > 0:
             self.v6only_resource_score = min(self.v6only_resources[0] / v4only_resources_ok, 1)
-            logger.info("{}: IPv6-only Resource Score = {:0.2f}".format(self.url, self.v6only_resource_score))
+            logger.info("%s: IPv6-only Resource Score = %0.2f", self.url, self.v6only_resource_score)
 
             self.nat64_resource_score = min(self.nat64_resources[0] / v4only_resources_ok, 1)
-            logger.info("{}: NAT64 Resource Score = {:0.2f}".format(self.url, self.nat64_resource_score))
+            logger.info("%s: NAT64 Resource Score = %0.2f", self.url, self.nat64_resource_score)
         else:
-            logger.error("{}: did not load over IPv4-only, unable to perform resource test".format(self.url))
+            logger.error("%s: did not load over IPv4-only, unable to perform resource test", self.url)
 
         return_value = 0
-        if v4only_img_bytes:
-            # Store the image
-            self.v4only_image.save('v4.png', ContentFile(v4only_img_bytes), save=False)
-        else:
-            return_value |= 1
-
-        if v6only_img_bytes:
-            # Store the image
-            self.v6only_image.save('v6.png', ContentFile(v6only_img_bytes), save=False)
-        else:
-            return_value |= 2
-
-        if nat64_img_bytes:
-            # Store the image
-            self.nat64_image.save('nat64.png', ContentFile(nat64_img_bytes), save=False)
-        else:
-            return_value |= 4
+        for leg, leg_name, host_setting in LEGS:
+            image = getattr(self, '{}_image'.format(leg_name))
+            if img_bytes.get(leg):
+                # Pages that link to the screenshot are cached forever, so it is stored in its final encoding right
+                # away. The scores are calculated from the same pixels.
+                with self.timed('reencode'):
+                    data, extension = reencode_image(img_bytes[leg]) or (img_bytes[leg], '.png')
+
+                # Store the image, and scaled down versions for the web pages
+                with self.timed('store_images'):
+                    image.save(leg_name + extension, ContentFile(data), save=False)
+                    create_renditions(image)
+            elif leg in sessions or not image:
+                return_value |= leg
+
+        # Screenshots reused from an earlier measurement may still need optimize_screenshots
+        self.images_optimized = not reuse_from or not ALL_LEGS & ~requested_legs
+
+        v4only_img = imgs.get(LEG_V4ONLY)
+        v6only_img = imgs.get(LEG_V6ONLY)
+        nat64_img = imgs.get(LEG_NAT64)
 
         if v4only_img is not None:
-            logger.debug("{}: Loading IPv4-only screenshot".format(self.url))
+            logger.debug("%s: Loading IPv4-only screenshot", self.url)
 
             if v6only_img is not None:
-                logger.debug("{}: Loading IPv6-only screenshot".format(self.url))
+                logger.debug("%s: Loading IPv6-only screenshot", self.url)
 
                 # Suppress stupid warnings
-                with warnings.catch_warnings(record=True):
+                with warnings.catch_warnings(record=True), self.timed('ssim'):
                     self.v6only_image_score = compare_ssim(v4only_img, v6only_img, multichannel=True)
-                    logger.info("{}: IPv6-only Image Score = {:0.2f}".format(self.url, self.v6only_image_score))
+                    logger.info("%s: IPv6-only Image Score = %0.2f", self.url, self.v6only_image_score)
             else:
-                logger.warning("{}: did not load over IPv6-only, 0 score".format(self.url))
+                logger.warning("%s: did not load over IPv6-only, 0 score", self.url)
                 self.v6only_image_score = 0.0
 
             if nat64_img is not None:
-                logger.debug("{}: Loading NAT64 screenshot".format(self.url))
+                logger.debug("%s: Loading NAT64 screenshot", self.url)
 
                 # Suppress stupid warnings
-                with warnings.catch_warnings(record=True):
+                with warnings.catch_warnings(record=True), self.timed('ssim'):
                     self.nat64_image_score = compare_ssim(v4only_img, nat64_img, multichannel=True)
-                    logger.info("{}: NAT64 Image Score = {:0.2f}".format(self.url, self.nat64_image_score))
+                    logger.info("%s: NAT64 Image Score = %0.2f", self.url, self.nat64_image_score)
             else:
-                logger.warning("{}: did not load over NAT64, 0 score".format(self.url))
+                logger.warning("%s: did not load over NAT64, 0 score", self.url)
                 self.nat64_image_score = 0.0
 
         else:
-            logger.error("{}: did not load over IPv4-only, unable to perform image test".format(self.url))
+            logger.error("%s: did not load over IPv4-only, unable to perform image test", self.url)
 
-        self.save()
+        with self.timed('db_save'):
+            self.save_results()
 
         return return_value
 
+    def leg_rendered(self, leg):
+        """
+        When the results of a leg were really collected, following reused legs back to the original test
+        """
+        measurement = self
+        while measurement.reused_legs & leg and measurement.retry_for:
+            measurement = measurement.retry_for
+        return measurement.finished
+
+    def get_reusable_measurement(self):
+        """
+        The measurement this retry can copy the legs that don't need to be retried from, if they are fresh enough
+        """
+        if not self.retry_legs or not self.retry_for or not self.retry_for.finished:
+            return None
+
+        oldest = timezone.now() - timedelta(seconds=settings.RETRY_REUSE_MAX_AGE)
+        for leg, leg_name, host_setting in LEGS:
+            if self.retry_legs & leg:
+                continue
+
+            if not getattr(self.retry_for, '{}_image'.format(leg_name)) or self.retry_for.leg_rendered(leg) < oldest:
+                return None
+
+        return self.retry_for
+
     def run_test(self):
-        if self.finished:
-            logger.error("{}: test already finished".format(self.url))
-            return
+        # Everything logged during the test can be traced back to it
+        with log_context(measurement_id=self.pk, url=self.url):
+            if self.finished:
+                logger.error("%s: test already finished", self.url)
+                return
+
+            # Update started
+            self.started = timezone.now()
+            if self.pk:
+                Measurement.objects.filter(pk=self.pk).update(started=self.started)
+
+            # Run DNS tests
+            self.set_phase(self.PHASE_DNS)
+            self.run_dns_tests()
+
+            # Abort quickly if no DNS
+            if not self.dns_results:
+                logger.error("Aborting test, no addresses found")
+                return_value = 8
+            else:
+                reuse_from = self.get_reusable_measurement()
+                if reuse_from:
+                    # Only retry the legs that failed, the network path hasn't changed since
+                    for attribute in PING_FIELDS:
+                        setattr(self, attribute, getattr(reuse_from, attribute))
+
+                    self.reused_legs = ALL_LEGS & ~self.retry_legs
+                    return_value = self.run_browser_tests(self.retry_legs, reuse_from)
+                else:
+                    self.reused_legs = 0
+                    self.set_phase(self.PHASE_PING)
+                    self.run_ping_tests()
+                    return_value = self.run_browser_tests()
+
+            # Set all other "latest" flags to false
+            previous = Measurement.objects.filter(url=self.url, latest=True).exclude(pk=self.pk)
+            previous_ids = list(previous.values_list('pk', flat=True))
+            previous.update(latest=False)
+
+            self.latest = True
+            self.finished = timezone.now()
+            self.phase = self.PHASE_DONE
+            with self.timed('db_save'):
+                self.save_results()
+
+            # The cached pages of the previous measurements now need to link to this one. Only now, or a visitor in
+            # between could cache them again without that link.
+            invalidate_measurement_pages(previous_ids)
+
+            # The last save can only be counted after it's done
+            Measurement.objects.filter(pk=self.pk).update(timings=self.timings)
+            notify_progress(self.pk, self.PHASE_DONE)
+
+            # The overview listings now show this measurement
+            invalidate_overview()
+
+            return return_value
+
+    def optimize_images(self):
+        """
+        Re-encode the screenshots of a measurement from before screenshots were encoded when storing them, returns the
+        number of bytes saved. The old names keep working, see ScreenshotAlias.
+        """
+        saved = 0
+        replaced = {}
+        for field in IMAGE_FIELDS:
+            image = getattr(self, field)
+            if not image:
+                continue
+
+            if image.name in replaced:
+                # The same screenshot as another leg
+                setattr(self, field, replaced[image.name])
+                continue
 
-        # Update started
-        self.started = timezone.now()
+            try:
+                with image.storage.open(image.name) as f:
+                    data = f.read()
+            except FileNotFoundError:
+                logger.error("%s: screenshot %s is missing", self.url, image.name)
+                continue
+
+            result = reencode_image(data)
+            if result is None:
+                continue
+
+            encoded, extension = result
+            new_name = screenshot_storage.save('screenshot' + extension, ContentFile(encoded))
+            copy_renditions(image.name, new_name)
+            replace_image(image.name, new_name)
+
+            replaced[image.name] = new_name
+            setattr(self, field, new_name)
+            saved += len(data) - len(encoded)
+
+        self.images_optimized = True
+        Measurement.objects.filter(pk=self.pk).update(images_optimized=True)
+
+        return saved
+
+
+class ScanRun(models.Model):
+    """
+    A group of measurements imported together, for example from a top-1m list, that can be paused, resumed and
+    cancelled as a whole
+    """
+    STATE_RUNNING = 'running'
+    STATE_PAUSED = 'paused'
+    STATE_CANCELLED = 'cancelled'
+
+    STATE_CHOICES = (
+        (STATE_RUNNING, 'running'),
+        (STATE_PAUSED, 'paused'),
+        (STATE_CANCELLED, 'cancelled'),
+    )
 
-        # Run DNS tests
-        self.run_dns_tests()
+    # Throughput is measured over at most this much recent time
+    THROUGHPUT_WINDOW = timedelta(hours=1)
 
-        # Abort quickly if no DNS
-        if not self.dns_results:
-            logger.error("Aborting test, no addresses found")
-            return_value = 8
-        else:
-            self.run_ping_tests()
-            return_value = self.run_browser_tests()
+    # Cancelling removes the queued tests this many at a time
+    CANCEL_BATCH_SIZE = 10000
 
-        # Set all other "latest" flags to false
-        Measurement.objects.filter(url=self.url, latest=True).update(latest=False)
+    name = models.CharField(max_length=100)
+    source = models.CharField(max_length=255, blank=True)
+    created = models.DateTimeField(default=timezone.now)
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default=STATE_RUNNING, db_index=True)
 
-        self.latest = True
-        self.finished = timezone.now()
-        self.save()
+    # Checkpoint of the import, so an interrupted import can continue where it stopped
+    rows_imported = models.PositiveIntegerField(default=0)
+    import_complete = models.BooleanField(default=False)
 
-        return return_value
+    def __str__(self):
+        return 'Scan run #{}: {}'.format(self.pk, self.name)
+
+    def progress(self):
+        """
+        Count the measurements of this run: total, finished, running and pending
+        """
+        def count(**conditions):
+            return models.Sum(models.Case(models.When(then=1, **conditions),
+                                          default=0,
+                                          output_field=models.IntegerField()))
+
+        # The names of the aggregates must not shadow the fields they count
+        counts = self.measurements.aggregate(total_count=models.Count('id'),
+                                             finished_count=count(finished__isnull=False),
+                                             running_count=count(started__isnull=False, finished=None))
+        counts = dict((key[:-len('_count')], value or 0) for key, value in counts.items())
+        counts['pending'] = counts['total'] - counts['finished'] - counts['running']
+        return counts
+
+    @property
+    def completed(self):
+        return self.import_complete and not self.measurements.filter(finished=None).exists()
+
+    def tests_per_hour(self):
+        """
+        The recent rate at which the tests of this run finish
+        """
+        first_started = self.measurements.aggregate(first_started=models.Min('started'))['first_started']
+        if first_started is None:
+            return 0.0
+
+        now = timezone.now()
+        window_start = max(first_started, now - self.THROUGHPUT_WINDOW)
+        seconds = (now - window_start).total_seconds()
+        if seconds <= 0:
+            return 0.0
+
+        finished = self.measurements.filter(finished__gt=window_start).count()
+        return finished / seconds * 3600
+
+    def eta(self):
+        """
+        When the last test of this run is expected to finish, or None if we can't tell
+        """
+        if self.state != self.STATE_RUNNING:
+            return None
+
+        rate = self.tests_per_hour()
+        if not rate:
+            return None
+
+        counts = self.progress()
+        return timezone.now() + timedelta(hours=(counts['pending'] + counts['running']) / rate)
+
+    def pause(self):
+        ScanRun.objects.filter(pk=self.pk, state=self.STATE_RUNNING).update(state=self.STATE_PAUSED)
+        self.refresh_from_db(fields=['state'])
+
+    def resume(self):
+        if ScanRun.objects.filter(pk=self.pk, state=self.STATE_PAUSED).update(state=self.STATE_RUNNING):
+            notify_workers()
+        self.refresh_from_db(fields=['state'])
+
+    def cancel(self):
+        """
+        Stop the run for good. Finished results are kept, tests that haven't started are removed from the queue.
+        """
+        # Workers only claim tests of running scan runs, so once this is committed the queued tests are left alone
+        ScanRun.objects.filter(pk=self.pk).update(state=self.STATE_CANCELLED)
+        self.state = self.STATE_CANCELLED
+
+        # Tests that never started have no screenshots and no retries, so there is nothing for Django to collect or
+        # signal. A big run is removed in batches to keep the transactions short.
+        table = connection.ops.quote_name(Measurement._meta.db_table)
+        deleted = 0
+        with connection.cursor() as cursor:
+            while True:
+                cursor.execute(
+                    "DELETE FROM {table} WHERE id IN ("
+                    "SELECT id FROM {table} WHERE scan_run_id = %s AND started IS NULL LIMIT %s"
+                    ")".format(table=table),
+                    [self.pk, self.CANCEL_BATCH_SIZE]
+                )
+                deleted += cursor.rowcount
+                if cursor.rowcount < self.CANCEL_BATCH_SIZE:
+                    return deleted
+
+
+class Worker(models.Model):
+    """
+    A run_tests process, it keeps its leases on the measurements it claimed alive with heartbeats
+    """
+    hostname = models.CharField(max_length=255)
+    pid = models.PositiveIntegerField()
+
+    started = models.DateTimeField(default=timezone.now)
+    last_heartbeat = models.DateTimeField(default=timezone.now, db_index=True)
+    stopped = models.DateTimeField(blank=True, null=True)
+
+    current_measurement = models.ForeignKey(Measurement, blank=True, null=True, on_delete=models.SET_NULL,
+                                            related_name='+')
+    tests_finished = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return 'Worker {} on {}'.format(self.pid, self.hostname)
+
+    @property
+    def alive(self):
+        lease_time = timedelta(seconds=settings.WORKER_LEASE_TIME)
+        return not self.stopped and self.last_heartbeat > timezone.now() - lease_time
+
+    @property
+    def tests_per_hour(self):
+        seconds = ((self.stopped or timezone.now()) - self.started).total_seconds()
+        return self.tests_finished / seconds * 3600 if seconds > 0 else 0.0
+
+    def heartbeat(self):
+        """
+        Let everyone know we're still alive and renew the leases on the measurements we claimed
+        """
+        now = timezone.now()
+        lease_expires = now + timedelta(seconds=settings.WORKER_LEASE_TIME)
+        Worker.objects.filter(pk=self.pk).update(last_heartbeat=now)
+        Measurement.objects.filter(worker=self, finished=None).update(lease_expires=lease_expires)
+
+    def start_test(self, measurement):
+        self.current_measurement = measurement
+        Worker.objects.filter(pk=self.pk).update(current_measurement=measurement)
+
+    def finish_test(self):
+        self.current_measurement = None
+        self.tests_finished += 1
+        Worker.objects.filter(pk=self.pk).update(current_measurement=None, tests_finished=F('tests_finished') + 1)
+
+    def stop(self):
+        self.stopped = timezone.now()
+        Worker.objects.filter(pk=self.pk).update(stopped=self.stopped, current_measurement=None)
+
+
+class PackedBlob(models.Model):
+    """
+    Where a file in v6score.storage.PackfileStorage is stored
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    segment = models.PositiveIntegerField(db_index=True)
+    offset = models.BigIntegerField()
+    length = models.PositiveIntegerField()
+    stored = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return '{} in segment {} at {}'.format(self.name, self.segment, self.offset)
+
+
+class ScreenshotAlias(models.Model):
+    """
+    A screenshot that was replaced by a re-encoded version. Pages that link to it can be cached for a year, so its
+    URLs redirect to the new one until then.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    new_name = models.CharField(max_length=100)
+    created = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return '{} -> {}'.format(self.name, self.new_name)
+
+
+def image_reference_count(name):
+    return Measurement.objects.filter(Q(v4only_image=name) | Q(v6only_image=name) | Q(nat64_image=name)).count()
+
+
+def replace_image(name, new_name):
+    """
+    Let all measurements that use screenshot name use new_name instead, and remove the old one if possible
+    """
+    # Old links keep working, also those to names that were replaced before
+    with transaction.atomic():
+        ScreenshotAlias.objects.filter(new_name=name).update(new_name=new_name)
+        ScreenshotAlias.objects.update_or_create(name=name, defaults={'new_name': new_name,
+                                                                      'created': timezone.now()})
+
+    measurement_ids = set()
+    for field in IMAGE_FIELDS:
+        measurements = Measurement.objects.filter(**{field: name})
+        measurement_ids.update(measurements.values_list('pk', flat=True))
+        measurements.update(**{field: new_name})
+
+    # The cached pages refer to the renditions of the old screenshot
+    invalidate_measurement_pages(measurement_ids)
+
+    delete_image_if_unreferenced(name)
+
+
+def delete_image_if_unreferenced(name):
+    if image_reference_count(name) or not screenshot_storage.is_collectable(name):
+        return False
+
+    screenshot_storage.delete(name)
+    delete_renditions(name)
+    return True
+
+
+# noinspection PyUnusedLocal
+@receiver(post_delete, sender=Measurement)
+def delete_unreferenced_images(sender, instance, **kwargs):
+    names = [image.name for image in (instance.v4only_image, instance.v6only_image, instance.nat64_image) if image]
+
+    def delete_images():
+        for name in names:
+            if delete_image_if_unreferenced(name):
+                logger.debug("Deleted unreferenced image %s", name)
 
+    # Screenshots are shared between measurements, only remove them when the last reference is really gone
+    transaction.on_commit(delete_images)
 
-# Proper representation with OrderedDict
-register_default_json(globally=True, loads=lambda s: json.loads(s, object_pairs_hook=OrderedDict))
-register_default_jsonb(globally=True, loads=lambda s: json.loads(s, object_pairs_hook=OrderedDict))
 
-yaml.add_representer(OrderedDict,
+# Keep the original key order when dumping data as YAML
+yaml.add_representer(dict,
                      lambda self, data: self.represent_mapping('tag:yaml.org,2002:map', data.items()))
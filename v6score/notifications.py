@@ -0,0 +1,171 @@
+"""
+Wake up idle workers when there is something new to test, and tell visitors how a test is progressing, using
+PostgreSQL LISTEN/NOTIFY. On other databases the notifications do nothing and everyone just polls.
+"""
+import logging
+import os
+import select
+import time
+
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'v6score_measurements'
+PROGRESS_CHANNEL = 'v6score_progress'
+
+# Advisory locks on (namespace, slot) limit the number of progress streams over all web server processes
+PROGRESS_LOCK_NAMESPACE = 6465
+
+
+def notify_workers():
+    """
+    Tell the workers that a test has been requested. Inside a transaction the notification is sent on commit.
+    """
+    if connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("NOTIFY {}".format(CHANNEL))
+
+
+def notify_progress(measurement_id, phase):
+    """
+    Tell everyone watching that a measurement entered a new phase
+    """
+    if connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, %s)", [PROGRESS_CHANNEL, '{}:{}'.format(measurement_id, phase)])
+
+
+class WorkerWakeup:
+    """
+    Lets a worker sleep on its database connection until notify_workers is called or the timeout expires
+    """
+
+    def __init__(self):
+        self.listening_on = None
+
+        # Lets a signal handler end the wait early
+        self.interrupt_read, self.interrupt_write = os.pipe()
+        os.set_blocking(self.interrupt_write, False)
+
+    def interrupt(self):
+        """
+        Stop waiting, safe to call from a signal handler
+        """
+        try:
+            os.write(self.interrupt_write, b'.')
+        except BlockingIOError:
+            # Already plenty of interruptions pending
+            pass
+
+    def listen(self):
+        """
+        Make sure the current database connection is subscribed, returns the raw connection or None
+        """
+        if connection.vendor != 'postgresql':
+            return None
+
+        connection.ensure_connection()
+        raw_connection = connection.connection
+        if raw_connection is not self.listening_on:
+            # New connection, subscribe again
+            with connection.cursor() as cursor:
+                cursor.execute("LISTEN {}".format(CHANNEL))
+            self.listening_on = raw_connection
+
+        return raw_connection
+
+    def wait(self, timeout):
+        """
+        Wait until a notification arrives, returns whether one did
+        """
+        raw_connection = self.listen()
+        if raw_connection is None:
+            # No notifications, just sleep
+            select.select([self.interrupt_read], [], [], timeout)
+            return False
+
+        if not raw_connection.notifies:
+            readable, writable, exceptional = select.select([raw_connection, self.interrupt_read], [], [], timeout)
+            if self.interrupt_read in readable:
+                os.read(self.interrupt_read, 1024)
+            if raw_connection in readable:
+                raw_connection.poll()
+
+        notified = bool(raw_connection.notifies)
+        raw_connection.notifies.clear()
+        return notified
+
+
+class ProgressListener:
+    """
+    Receives the progress notifications on a database connection of its own, because a progress stream stays open
+    much longer than a request normally does
+    """
+
+    def __init__(self):
+        self.raw_connection = None
+        if connection.vendor == 'postgresql':
+            self.raw_connection = connection.get_new_connection(connection.get_connection_params())
+            self.raw_connection.autocommit = True
+            with self.raw_connection.cursor() as cursor:
+                cursor.execute("LISTEN {}".format(PROGRESS_CHANNEL))
+
+    @property
+    def listening(self):
+        return self.raw_connection is not None
+
+    def take_slot(self, slots):
+        """
+        Take one of a limited number of slots, returns whether one was free. The slot is given back when the
+        connection is closed, even when the process dies.
+        """
+        if not self.listening:
+            return True
+
+        with self.raw_connection.cursor() as cursor:
+            for slot in range(slots):
+                cursor.execute("SELECT pg_try_advisory_lock(%s, %s)", [PROGRESS_LOCK_NAMESPACE, slot])
+                if cursor.fetchone()[0]:
+                    return True
+
+        return False
+
+    def wait(self, measurement_id, timeout):
+        """
+        Wait at most timeout seconds for progress of this measurement, returns the phases it went through. Progress
+        of other measurements doesn't end the wait.
+        """
+        if not self.listening:
+            time.sleep(timeout)
+            return []
+
+        deadline = time.monotonic() + timeout
+        phases = []
+        while not phases:
+            if not self.raw_connection.notifies:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+
+                readable, writable, exceptional = select.select([self.raw_connection], [], [], remaining)
+                if not readable:
+                    break
+                self.raw_connection.poll()
+
+            for notify in self.raw_connection.notifies:
+                notified_id, phase = notify.payload.split(':', 1)
+                if notified_id == str(measurement_id):
+                    phases.append(phase)
+            self.raw_connection.notifies.clear()
+
+        return phases
+
+    def close(self):
+        if self.raw_connection is not None:
+            self.raw_connection.close()
+            self.raw_connection = None
@@ -0,0 +1,155 @@
+"""
+A cheap first look at a site before the expensive browser tests: fetch the URL directly over IPv4 and over IPv6,
+without rendering anything, and compare the responses. Thousands of sites are fetched concurrently on one event
+loop. Only sites that behave differently over IPv4 and IPv6, or where the outcome isn't clear, need the full
+three-leg browser test.
+"""
+import asyncio
+import socket
+import ssl
+import time
+from urllib.parse import urlsplit
+
+
+def insecure_ssl_context():
+    """
+    Like the old wget sweep we don't check certificates, we only want to know whether the site answers
+    """
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+def url_port(parts):
+    """
+    The port to connect to for a split URL
+    """
+    return parts.port or (443 if parts.scheme == 'https' else 80)
+
+
+async def fetch_response(url, ssl_context, result):
+    """
+    Request the URL from the address in result and read the status line and headers of the response into result
+    """
+    parts = urlsplit(url)
+    https = parts.scheme == 'https'
+    port = url_port(parts)
+
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+
+    reader, writer = await asyncio.open_connection(result['address'], port,
+                                                   ssl=ssl_context if https else None,
+                                                   server_hostname=parts.hostname if https else None)
+    try:
+        writer.write('GET {} HTTP/1.1\r\n'
+                     'Host: {}\r\n'
+                     'User-Agent: nat64check-prescreen\r\n'
+                     'Accept: */*\r\n'
+                     'Connection: close\r\n'
+                     '\r\n'.format(path, parts.netloc).encode('ascii'))
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed without response")
+
+        try:
+            result['status'] = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            raise ValueError("Invalid status line {!r}".format(status_line[:100]))
+
+        while True:
+            line = await reader.readline()
+            if not line.strip():
+                break
+
+            name, separator, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'location':
+                result['location'] = value.strip()
+    finally:
+        writer.close()
+
+
+async def fetch(url, family, timeout, ssl_context):
+    """
+    Fetch the URL over one address family, the outcome is always returned and never raised
+    """
+    result = {
+        'address': None,
+        'status': None,
+        'location': None,
+        'error': None,
+        'time': None,
+    }
+
+    # Lookups block, so they run in the resolver threads and might have to wait for one. Only the time since the
+    # lookup really started counts.
+    started = []
+
+    def lookup(hostname, port):
+        started.append(time.monotonic())
+        return socket.getaddrinfo(hostname, port, family=family, type=socket.SOCK_STREAM)
+
+    try:
+        parts = urlsplit(url)
+        addresses = await asyncio.get_event_loop().run_in_executor(None, lookup, parts.hostname, url_port(parts))
+        result['address'] = addresses[0][4][0]
+
+        # The resolver has its own timeouts, the time the lookup took is taken from the time for the response
+        remaining = timeout - (time.monotonic() - started[0])
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+
+        await asyncio.wait_for(fetch_response(url, ssl_context, result), remaining)
+    except asyncio.TimeoutError:
+        result['error'] = 'timeout'
+    except (OSError, ValueError, UnicodeError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+        result['error'] = str(e) or e.__class__.__name__
+
+    if started:
+        result['time'] = time.monotonic() - started[0]
+    return result
+
+
+async def prescreen_url(url, semaphore, timeout, ssl_context):
+    async with semaphore:
+        v4, v6 = await asyncio.gather(fetch(url, socket.AF_INET, timeout, ssl_context),
+                                      fetch(url, socket.AF_INET6, timeout, ssl_context))
+
+    return {
+        'v4': v4,
+        'v6': v6,
+    }
+
+
+async def prescreen(urls, concurrency=1000, timeout=10):
+    """
+    Fetch all URLs over IPv4 and IPv6, at most concurrency sites at a time. Returns the results in the same order.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    ssl_context = insecure_ssl_context()
+    return await asyncio.gather(*[prescreen_url(url, semaphore, timeout, ssl_context) for url in urls])
+
+
+def needs_browser_test(result):
+    """
+    Whether the browser tests can tell us more than the prescreen did: the site responds differently over IPv4 and
+    IPv6, or we couldn't tell how it responds
+    """
+    v4, v6 = result['v4'], result['v6']
+
+    if v4['error'] == 'timeout' or v6['error'] == 'timeout':
+        # Might be slow, or temporary
+        return True
+
+    if v4['status'] is None and v6['status'] is None:
+        # Not there over either protocol, nothing to compare
+        return False
+
+    if v4['status'] != v6['status'] or v4['location'] != v6['location']:
+        return True
+
+    # Server errors both ways might be temporary
+    return v4['status'] >= 500
@@ -0,0 +1,122 @@
+"""
+Profile single tests. The deterministic profile of cProfile is written as pstats, for snakeviz, gprof2dot or
+pstats itself. The sampling profiler looks at the stack of the main thread at regular wall clock intervals, so time
+spent waiting on the browsers shows up too, and writes collapsed stacks for flamegraph.pl or speedscope.
+"""
+import cProfile
+import logging
+import os
+import signal
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ('cprofile', 'sample')
+
+# Seconds between samples of the sampling profiler
+SAMPLE_INTERVAL = 0.005
+
+
+def import_paths():
+    """
+    The entries of sys.path, longest first so the most specific one matches
+    """
+    return sorted((path for path in sys.path if path), key=len, reverse=True)
+
+
+def short_filename(filename, paths=None):
+    """
+    The filename relative to the entry of sys.path (or paths, from import_paths) it was imported from
+    """
+    for path in paths or import_paths():
+        if filename.startswith(path + os.sep):
+            return filename[len(path) + 1:]
+    return filename
+
+
+class SamplingProfiler:
+    """
+    Count the stacks the main thread is in, every interval seconds
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.previous_handler = None
+
+        # Samples are taken often, the same functions show up in most of them
+        self.paths = import_paths()
+        self.frame_names = {}
+
+    def frame_name(self, code):
+        name = self.frame_names.get(code)
+        if name is None:
+            name = '{} ({}:{})'.format(code.co_name, short_filename(code.co_filename, self.paths), code.co_firstlineno)
+            self.frame_names[code] = name
+        return name
+
+    # noinspection PyUnusedLocal
+    def sample(self, sig_num, frame):
+        stack = []
+        while frame is not None:
+            stack.append(self.frame_name(frame.f_code))
+            frame = frame.f_back
+        self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self.previous_handler = signal.signal(signal.SIGALRM, self.sample)
+        signal.setitimer(signal.ITIMER_REAL, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, self.previous_handler)
+
+    def dump_stats(self, filename):
+        with open(filename, 'w') as output:
+            for stack, count in self.stacks.most_common():
+                output.write('{} {}\n'.format(stack, count))
+
+
+@contextmanager
+def profile_test(measurement, mode, directory, slower_than=0):
+    """
+    Profile the with block that runs the test of this measurement, and keep the profile when it took at least
+    slower_than seconds. Nothing happens when mode is None.
+    """
+    if not mode:
+        yield
+        return
+
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        extension = 'pstats'
+        profiler.enable()
+    elif mode == 'sample':
+        profiler = SamplingProfiler()
+        extension = 'folded'
+        profiler.start()
+    else:
+        raise ValueError("Unknown profile mode {}".format(mode))
+
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        if mode == 'cprofile':
+            profiler.disable()
+        else:
+            profiler.stop()
+
+        duration = time.monotonic() - start
+        if duration >= slower_than:
+            os.makedirs(directory, exist_ok=True)
+            name = '{:%Y%m%d-%H%M%S}-{}-{}.{}'.format(timezone.now(), measurement.pk or 'unsaved',
+                                                     measurement.idna_hostname.replace(':', '_'), extension)
+            filename = os.path.join(directory, name)
+            profiler.dump_stats(filename)
+            logger.info("%s: test took %.1f seconds, profile written to %s", measurement.url, duration, filename)
@@ -0,0 +1,103 @@
+"""
+Stream the progress of a measurement to the visitor that is waiting for it, as server-sent events. The page updates
+itself in place and only reloads once the results are there.
+"""
+import json
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from v6score.models import Measurement
+from v6score.notifications import ProgressListener
+
+# Browsers reconnect by themselves, don't keep a server process busy for long
+STREAM_DURATION = 60
+
+# Send something at least this often, so proxies don't close the connection
+KEEPALIVE_INTERVAL = 15
+
+# How often to look at the database when there are no notifications
+POLL_INTERVAL = 2
+
+PHASE_DESCRIPTIONS = {
+    'queued': "Waiting in the queue",
+    'started': "Starting the test",
+    Measurement.PHASE_DNS: "Looking up the addresses",
+    Measurement.PHASE_PING: "Pinging the server",
+    Measurement.PHASE_RENDER: "Loading the page",
+    'v4only': "Loaded the page over IPv4-only",
+    'v6only': "Loaded the page over IPv6-only",
+    'nat64': "Loaded the page over NAT64",
+    Measurement.PHASE_SCORING: "Comparing the results",
+    Measurement.PHASE_DONE: "Finished",
+}
+
+
+def current_phase(measurement_id):
+    started, finished, phase = (Measurement.objects
+                                .filter(pk=measurement_id)
+                                .values_list('started', 'finished', 'phase')
+                                .get())
+    if finished:
+        return Measurement.PHASE_DONE
+    elif not started:
+        return 'queued'
+    else:
+        return phase or 'started'
+
+
+def phase_event(phase):
+    data = {
+        'phase': phase,
+        'description': PHASE_DESCRIPTIONS.get(phase, phase),
+    }
+    return 'event: phase\ndata: {}\n\n'.format(json.dumps(data))
+
+
+def reload_event():
+    """
+    Tell the page to stop listening and reload itself now and then instead
+    """
+    return 'event: reload\ndata: {}\n\n'
+
+
+def progress_events(measurement_id):
+    """
+    Generate an event for every phase the measurement enters, until it is done or the stream has been open long enough
+    """
+    phase = current_phase(measurement_id)
+    yield phase_event(phase)
+    if phase == Measurement.PHASE_DONE:
+        return
+
+    listener = ProgressListener()
+    try:
+        # Every stream holds a web server process and a database connection
+        if not listener.take_slot(settings.PROGRESS_MAX_STREAMS):
+            yield reload_event()
+            return
+
+        # The listener has a connection of its own, don't hold on to this one while waiting
+        connection.close()
+
+        interval = KEEPALIVE_INTERVAL if listener.listening else POLL_INTERVAL
+        deadline = time.monotonic() + STREAM_DURATION
+        while time.monotonic() < deadline:
+            phases = listener.wait(measurement_id, interval)
+            if not phases:
+                # Nothing heard for a while, make sure we didn't miss anything
+                new_phase = current_phase(measurement_id)
+                phases = [new_phase] if new_phase != phase else []
+                connection.close()
+
+            if not phases:
+                yield ': keepalive\n\n'
+                continue
+
+            for phase in phases:
+                yield phase_event(phase)
+                if phase == Measurement.PHASE_DONE:
+                    return
+    finally:
+        listener.close()
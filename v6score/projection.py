@@ -0,0 +1,110 @@
+"""
+Build SQL that projects a JSONB document down to a selection of fields, so PostgreSQL can do the work and we can
+send the result to the client without decoding it in Python.
+
+The fields specification is a comma separated list of dotted paths, where '*' matches every value of an object or
+array. An item without a dot is a sibling of the last component of the previous item, so
+'success,resources.*.url,status' selects 'success', 'resources.*.url' and 'resources.*.status'.
+"""
+
+# Every level repeats the expressions of the levels above it, keep the SQL a reasonable size
+MAX_DEPTH = 6
+MAX_FIELDS = 100
+
+# jsonb_build_object takes two arguments per key, and PostgreSQL functions take at most 100 arguments
+MAX_FIELDS_PER_LEVEL = 40
+
+
+def parse_fields(fields: str) -> dict:
+    tree = {}
+    prefix = []
+
+    for item in fields.split(','):
+        item = item.strip()
+        if not item:
+            continue
+
+        if '.' in item:
+            path = item.split('.')
+            prefix = path[:-1]
+        else:
+            path = prefix + [item]
+
+        if len(path) > MAX_DEPTH:
+            raise ValueError("Field path {} is too deep".format('.'.join(path)))
+        if not all(path):
+            raise ValueError("Field path {} contains an empty component".format(item))
+
+        node = tree
+        for component in path[:-1]:
+            node = node.setdefault(component, {})
+            if node is None:
+                # A parent has already been selected completely
+                break
+        else:
+            node[path[-1]] = None
+
+    total = 0
+    for node in _walk(tree):
+        if '*' in node and len(node) > 1:
+            raise ValueError("A wildcard can't be combined with other fields on the same level")
+        if len(node) > MAX_FIELDS_PER_LEVEL:
+            raise ValueError("At most {} fields can be selected on the same level".format(MAX_FIELDS_PER_LEVEL))
+        total += len(node)
+
+    if total > MAX_FIELDS:
+        raise ValueError("At most {} fields can be selected".format(MAX_FIELDS))
+
+    return tree
+
+
+def _walk(tree: dict):
+    yield tree
+    for subtree in tree.values():
+        if subtree:
+            yield from _walk(subtree)
+
+
+def projection_sql(expression: str, tree: dict, expression_params: list = (), counter: list = None):
+    """
+    Return the SQL and parameters that select the fields in tree from the JSONB value in expression
+    """
+    expression_params = list(expression_params)
+    counter = counter if counter is not None else [0]
+
+    if '*' in tree:
+        counter[0] += 1
+        alias = 'p{}'.format(counter[0])
+        value_sql, value_params = _value_sql('{}.value'.format(alias), [], tree['*'], counter)
+
+        sql = ("CASE jsonb_typeof({expression}) "
+               "WHEN 'object' THEN "
+               "(SELECT COALESCE(jsonb_object_agg({alias}.key, {value}), '{{}}'::jsonb) "
+               "FROM jsonb_each({expression}) AS {alias}) "
+               "WHEN 'array' THEN "
+               "(SELECT COALESCE(jsonb_agg({value} ORDER BY {alias}.nr), '[]'::jsonb) "
+               "FROM jsonb_array_elements({expression}) WITH ORDINALITY AS {alias}(value, nr)) "
+               "END").format(expression=expression, alias=alias, value=value_sql)
+        params = expression_params + value_params + expression_params + value_params + expression_params
+        return sql, params
+
+    parts = []
+    params = list(expression_params)
+    for key, subtree in sorted(tree.items()):
+        value_sql, value_params = _value_sql('({}) -> %s'.format(expression), expression_params + [key],
+                                             subtree, counter)
+        parts.append('%s, ' + value_sql)
+        params += [key] + value_params
+
+    sql = "CASE jsonb_typeof({expression}) WHEN 'object' THEN jsonb_build_object({parts}) END".format(
+        expression=expression,
+        parts=', '.join(parts),
+    )
+    return sql, params
+
+
+def _value_sql(expression: str, expression_params: list, subtree, counter: list):
+    if subtree is None:
+        return expression, expression_params
+
+    return projection_sql(expression, subtree, expression_params, counter)
@@ -0,0 +1,88 @@
+import io
+import logging
+import os
+
+from PIL import Image
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+
+def rendition_name(name, size):
+    base, ext = os.path.splitext(name)
+    return 'renditions/{}/{}.jpg'.format(size, base)
+
+
+def create_rendition(field_file, size):
+    """
+    Store a scaled down JPEG version of the image in field_file and return its name
+    """
+    storage = default_storage
+    name = rendition_name(field_file.name, size)
+
+    field_file.open('rb')
+    try:
+        image = Image.open(field_file)
+        image = image.convert('RGB')
+        image.thumbnail(settings.SCREENSHOT_RENDITIONS[size], Image.LANCZOS)
+    finally:
+        field_file.close()
+
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=85, optimize=True)
+
+    if storage.exists(name):
+        storage.delete(name)
+    stored_name = storage.save(name, ContentFile(output.getvalue()))
+    if stored_name != name:
+        # Someone else created it at the same time
+        storage.delete(stored_name)
+
+    return name
+
+
+def delete_renditions(name):
+    for size in settings.SCREENSHOT_RENDITIONS:
+        default_storage.delete(rendition_name(name, size))
+
+
+def copy_renditions(name, new_name):
+    """
+    Reuse the renditions of an image for a re-encoded copy with the same pixels
+    """
+    for size in settings.SCREENSHOT_RENDITIONS:
+        source = rendition_name(name, size)
+        target = rendition_name(new_name, size)
+        if default_storage.exists(source) and not default_storage.exists(target):
+            with default_storage.open(source) as f:
+                default_storage.save(target, File(f))
+
+
+def create_renditions(field_file):
+    for size in settings.SCREENSHOT_RENDITIONS:
+        try:
+            create_rendition(field_file, size)
+        except (IOError, OSError) as e:
+            logger.error("Could not create %s rendition of %s: %s", size, field_file.name, e)
+
+
+def get_rendition_url(field_file, size):
+    """
+    The URL of a scaled down version of the image in field_file, which is created the first time it is needed
+    """
+    if not field_file:
+        return ''
+
+    storage = default_storage
+    name = rendition_name(field_file.name, size)
+    if not storage.exists(name):
+        try:
+            create_rendition(field_file, size)
+        except (IOError, OSError) as e:
+            logger.error("Could not create %s rendition of %s: %s", size, field_file.name, e)
+            return field_file.url
+
+    return storage.url(name)
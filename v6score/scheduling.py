@@ -0,0 +1,67 @@
+"""
+Weighted fair sharing of the workers between the priority classes of the queue, using stride scheduling. Every class
+has a pass value that advances by its stride (inversely proportional to its weight) for every test it gets. The
+class with the lowest pass value that has work goes next, so over time every class gets its share, and a class
+that is idle doesn't build up credit to starve the others with later.
+
+Each worker keeps its own passes. Every worker dividing its own time fairly divides the whole fleet fairly.
+"""
+import time
+
+from django.conf import settings
+
+from v6score.models import Measurement
+
+STRIDE_BASE = 1 << 20
+
+# A class that had no work is only tried after the others for this many seconds
+EMPTY_RECHECK_TIME = 5
+
+
+class FairShareScheduler:
+    def __init__(self, weights=None):
+        weights = weights or settings.QUEUE_WEIGHTS
+        priorities = dict((name, priority) for priority, name in Measurement.PRIORITY_CHOICES)
+
+        self.strides = {}
+        for name, weight in weights.items():
+            if name not in priorities:
+                raise ValueError("Unknown priority class {}".format(name))
+            if weight > 0:
+                self.strides[priorities[name]] = STRIDE_BASE / weight
+
+        self.passes = dict.fromkeys(self.strides, 0.0)
+
+        # The pass of the last class that got work, where classes that were idle join again
+        self.current_pass = 0.0
+
+        # When the classes that had no work were last found empty
+        self.empty_since = {}
+
+    def claim(self, worker, batch_size=1, manual_only=False, retry_only=False):
+        """
+        Claim up to batch_size tests from the class that is most behind on its share
+        """
+        now = time.monotonic()
+        recently_empty = set(priority for priority, since in self.empty_since.items()
+                             if now - since < EMPTY_RECHECK_TIME)
+
+        for priority in sorted(self.passes, key=lambda key: (key in recently_empty, self.passes[key], key)):
+            measurements = Measurement.objects.claim(worker,
+                                                     batch_size=batch_size,
+                                                     priority=priority,
+                                                     manual_only=manual_only,
+                                                     retry_only=retry_only)
+            if not measurements:
+                self.empty_since[priority] = now
+                continue
+
+            # Classes without work don't save up credit while they wait
+            if self.empty_since.pop(priority, None) is not None:
+                self.passes[priority] = max(self.passes[priority], self.current_pass)
+
+            self.current_pass = self.passes[priority]
+            self.passes[priority] += self.strides[priority] * len(measurements)
+            return measurements
+
+        return []
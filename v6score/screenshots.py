@@ -0,0 +1,62 @@
+import io
+import logging
+
+import numpy
+import skimage.io
+from PIL import Image
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SCREENSHOT_FORMATS = {
+    'png': ('PNG', '.png', {'optimize': True}),
+    'webp': ('WEBP', '.webp', {'lossless': True, 'quality': 100, 'method': 6, 'exact': True}),
+}
+
+
+def load_screenshot(field_file):
+    """
+    Decode a stored screenshot the same way the browser tests decode fresh ones, whatever format it is stored in
+    """
+    field_file.open('rb')
+    try:
+        data = io.BytesIO(field_file.read())
+    finally:
+        field_file.close()
+
+    if field_file.name.endswith('.webp'):
+        # WebP leaves out an alpha channel that is completely opaque, put it back
+        return numpy.asarray(Image.open(data).convert('RGBA'))
+
+    # noinspection PyTypeChecker
+    return skimage.io.imread(data)
+
+
+def reencode_image(data: bytes):
+    """
+    Encode the image in data losslessly in the SCREENSHOT_FORMAT. Returns the encoded image and its extension, or
+    None if that doesn't make it any smaller.
+    """
+    original = Image.open(io.BytesIO(data))
+    original.load()
+
+    image_format, extension, options = SCREENSHOT_FORMATS[settings.SCREENSHOT_FORMAT]
+    if image_format == 'WEBP' and original.mode != 'RGBA':
+        # WebP screenshots are always decoded as RGBA, other images would not come back the same
+        image_format, extension, options = SCREENSHOT_FORMATS['png']
+
+    output = io.BytesIO()
+    original.save(output, format=image_format, **options)
+    encoded = output.getvalue()
+    if len(encoded) >= len(data):
+        return None
+
+    # The scores are calculated from these pixels, make sure every single one survived
+    check = Image.open(io.BytesIO(encoded))
+    if image_format == 'WEBP':
+        check = check.convert('RGBA')
+    if check.mode != original.mode or check.size != original.size or check.tobytes() != original.tobytes():
+        logger.warning("Re-encoding an image as %s is not lossless, keeping the original", image_format)
+        return None
+
+    return encoded, extension
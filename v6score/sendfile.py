@@ -0,0 +1,35 @@
+import mimetypes
+import os
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http.response import HttpResponse
+from django.utils.module_loading import import_string
+
+
+def media_access_allowed(request, name):
+    """
+    Ask the MEDIA_ACCESS_CHECK function whether this request may see the media file with this name
+    """
+    if not settings.MEDIA_ACCESS_CHECK:
+        return True
+
+    check = import_string(settings.MEDIA_ACCESS_CHECK)
+    return check(request, name)
+
+
+def sendfile_response(name):
+    """
+    A response that lets the front-end web server send the media file with this name, according to MEDIA_SENDFILE
+    """
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    response = HttpResponse(content_type=content_type)
+
+    if settings.MEDIA_SENDFILE == 'x-sendfile':
+        response['X-Sendfile'] = os.path.join(settings.MEDIA_ROOT, name)
+    elif settings.MEDIA_SENDFILE == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_URL + quote(name)
+    else:
+        raise ValueError("Unknown MEDIA_SENDFILE mode {}".format(settings.MEDIA_SENDFILE))
+
+    return response
@@ -0,0 +1,379 @@
+import fcntl
+import hashlib
+import io
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.urlresolvers import reverse
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+
+# Don't remove files that might have just been stored for a measurement that isn't saved yet
+GRACE_PERIOD = timedelta(hours=1)
+
+# Every mapped segment keeps its file alive, even after compaction removed it
+MAX_MAPPED_SEGMENTS = 32
+
+CONTENT_NAME = re.compile(r'^cas/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$')
+
+SEGMENT_FILENAME = re.compile(r'^(\d{8})\.pack$')
+
+
+def content_name(name, content):
+    """
+    The name under which content is stored: the SHA-256 of the content, keeping the extension of the original name
+    """
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+
+    hex_digest = digest.hexdigest()
+    extension = os.path.splitext(name)[1].lower()
+    return 'cas/{}/{}/{}{}'.format(hex_digest[:2], hex_digest[2:4], hex_digest, extension)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Store files under the hash of their content. Storing the same content again costs nothing but the reference to
+    the existing file, so retests of static sites don't fill the disk with identical screenshots. Because a name
+    always refers to the same content there is no need to probe for free names either.
+
+    Files can be shared by multiple measurements, so they must only be deleted when nothing refers to them anymore.
+    See v6score.models.delete_unreferenced_images.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        name = content_name(name, content)
+        if self.exists(name):
+            # Mark the existing file as recently used so garbage collection leaves it alone
+            os.utime(self.path(name))
+            return name
+
+        return self._save(name, content)
+
+    def get_available_name(self, name, max_length=None):
+        # The same name means the same content
+        return name
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+
+        # Write to a temporary file and move it in place, so readers never see a partial file and concurrent
+        # writers of the same content don't get in each other's way
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    temp_file.write(chunk)
+
+            os.chmod(temp_path, self.file_permissions_mode if self.file_permissions_mode is not None else 0o644)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        return name
+
+    def is_collectable(self, name):
+        """
+        Whether an unreferenced file is old enough to be removed
+        """
+        try:
+            return os.path.getmtime(self.path(name)) < time.time() - GRACE_PERIOD.total_seconds()
+        except FileNotFoundError:
+            return False
+
+    def list_stored(self):
+        """
+        Generate the names of all stored files, including temporary files left behind by interrupted writes
+        """
+        root = self.path('cas')
+        for directory, sub_directories, filenames in os.walk(root):
+            for filename in filenames:
+                full_path = os.path.join(directory, filename)
+                yield os.path.relpath(full_path, self.location).replace(os.sep, '/')
+
+
+def packed_blobs():
+    # Imported here because the models module uses this storage
+    from v6score.models import PackedBlob
+    return PackedBlob.objects
+
+
+class BlobFile(io.RawIOBase):
+    """
+    A read-only file object on top of a memoryview, so reading doesn't need a copy of the whole blob
+    """
+
+    def __init__(self, view: memoryview):
+        super().__init__()
+        self.view = view
+        self.size = len(view)
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.view[self.position:self.position + len(buffer)]
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        else:
+            raise ValueError("Invalid whence ({})".format(whence))
+
+        self.position = max(self.position, 0)
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        self.view.release()
+        super().close()
+
+
+class PackedFile(File):
+    """
+    A packed file that can be opened again after closing it, like files on disk
+    """
+
+    def __init__(self, storage, name, view):
+        super().__init__(BlobFile(view), name)
+        self.storage = storage
+
+    def open(self, mode=None):
+        if not self.closed:
+            self.seek(0)
+            return
+
+        view = self.storage.blob_view(self.name)
+        if view is None:
+            raise FileNotFoundError("Packed file {} doesn't exist".format(self.name))
+        self.file = BlobFile(view)
+
+
+@deconstructible
+class PackfileStorage(ContentAddressedStorage):
+    """
+    Content addressed storage that appends files to a few large segment files instead of writing millions of small
+    ones. The PackedBlob model records where each file lives. Segments are only ever appended to, deleting a file
+    just removes its index entry. The compact_screenshots command reclaims the space by copying the remaining files
+    to the current segment and removing the old one.
+
+    Files that were stored before packing was enabled are still read from their own file until they are packed.
+    """
+
+    def __init__(self, pack_location=None, segment_size=None, **kwargs):
+        super().__init__(**kwargs)
+        self._pack_location = pack_location
+        self._segment_size = segment_size
+        self._mapped_segments = OrderedDict()
+
+        # Request threads share the mapped segments
+        self._mapped_segments_lock = threading.Lock()
+
+    @cached_property
+    def pack_location(self):
+        return os.path.abspath(self._pack_location or settings.SCREENSHOT_PACK_ROOT)
+
+    @cached_property
+    def segment_size(self):
+        return self._segment_size or settings.SCREENSHOT_PACK_SEGMENT_SIZE
+
+    def segment_path(self, segment):
+        return os.path.join(self.pack_location, '{:08d}.pack'.format(segment))
+
+    def list_segments(self):
+        try:
+            filenames = os.listdir(self.pack_location)
+        except FileNotFoundError:
+            return []
+
+        return sorted(int(match.group(1)) for match in map(SEGMENT_FILENAME.match, filenames) if match)
+
+    def current_segment(self):
+        """
+        The segment that new files are appended to, older segments never change anymore
+        """
+        segments = self.list_segments()
+        return segments[-1] if segments else 1
+
+    def append(self, content):
+        """
+        Append the content to the current segment and return the segment, offset and length
+        """
+        os.makedirs(self.pack_location, exist_ok=True)
+
+        with open(os.path.join(self.pack_location, 'lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                segment = self.current_segment()
+                path = self.segment_path(segment)
+                if os.path.exists(path) and os.path.getsize(path) >= self.segment_size:
+                    segment += 1
+                    path = self.segment_path(segment)
+
+                with open(path, 'ab') as pack:
+                    offset = pack.seek(0, io.SEEK_END)
+                    for chunk in content.chunks():
+                        pack.write(chunk)
+                    pack.flush()
+                    os.fsync(pack.fileno())
+                    length = pack.tell() - offset
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+        return segment, offset, length
+
+    def store_blob(self, name, content):
+        segment, offset, length = self.append(content)
+        try:
+            # In a savepoint, so the transaction of the caller survives the conflict
+            with transaction.atomic():
+                packed_blobs().create(name=name, segment=segment, offset=offset, length=length)
+        except IntegrityError:
+            # Stored by someone else at the same time, our copy is left for compaction
+            pass
+
+    def _map_segment(self, segment, end):
+        with self._mapped_segments_lock:
+            mapped = self._mapped_segments.get(segment)
+            if mapped is None or len(mapped) < end:
+                # Not mapped yet, or the segment has grown since
+                with open(self.segment_path(segment), 'rb') as pack:
+                    mapped = mmap.mmap(pack.fileno(), 0, access=mmap.ACCESS_READ)
+
+                self._mapped_segments[segment] = mapped
+                while len(self._mapped_segments) > MAX_MAPPED_SEGMENTS:
+                    # Don't close it, someone might still be reading from it. It is unmapped when the last view is
+                    # gone.
+                    self._mapped_segments.popitem(last=False)
+
+            self._mapped_segments.move_to_end(segment)
+            return mapped
+
+    def is_packed(self, name):
+        return packed_blobs().filter(name=name).exists()
+
+    def blob_view(self, name):
+        """
+        A memoryview of a packed file, or None if the file isn't packed
+        """
+        for attempt in range(2):
+            blob = packed_blobs().filter(name=name).first()
+            if blob is None:
+                return None
+
+            if blob.length == 0:
+                return memoryview(b'')
+
+            try:
+                mapped = self._map_segment(blob.segment, blob.offset + blob.length)
+                return memoryview(mapped)[blob.offset:blob.offset + blob.length]
+            except FileNotFoundError:
+                # Moved by compaction after we looked it up, try again
+                continue
+
+        raise FileNotFoundError("Packed file {} disappeared".format(name))
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        name = content_name(name, content)
+        if packed_blobs().filter(name=name).update(stored=timezone.now()):
+            # Mark the existing file as recently used so garbage collection leaves it alone
+            return name
+
+        if super().exists(name):
+            os.utime(self.path(name))
+            return name
+
+        self.store_blob(name, content)
+        return name
+
+    def _open(self, name, mode='rb'):
+        if 'w' in mode or 'a' in mode or '+' in mode:
+            raise ValueError("Packed files can't be modified")
+
+        view = self.blob_view(name)
+        if view is None:
+            return super()._open(name, mode)
+
+        return PackedFile(self, name, view)
+
+    def exists(self, name):
+        return self.is_packed(name) or super().exists(name)
+
+    def delete(self, name):
+        packed_blobs().filter(name=name).delete()
+        super().delete(name)
+
+    def size(self, name):
+        length = packed_blobs().filter(name=name).values_list('length', flat=True).first()
+        if length is None:
+            return super().size(name)
+        return length
+
+    def url(self, name):
+        if not CONTENT_NAME.match(name):
+            # Left over from before content addressing, it can only be a loose file
+            return super().url(name)
+        return reverse('screenshot', args=(name,))
+
+    def is_collectable(self, name):
+        stored = packed_blobs().filter(name=name).values_list('stored', flat=True).first()
+        if stored is None:
+            return super().is_collectable(name)
+        return stored < timezone.now() - GRACE_PERIOD
+
+    def list_loose(self):
+        """
+        Generate the names of stored files that aren't packed yet
+        """
+        for name in super().list_stored():
+            if not os.path.basename(name).startswith('.tmp-'):
+                yield name
+
+    def list_stored(self):
+        yield from packed_blobs().order_by('name').values_list('name', flat=True).iterator()
+        yield from super().list_stored()
+
+
+screenshot_storage = PackfileStorage()
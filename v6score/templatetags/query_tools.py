@@ -3,10 +3,17 @@ from django import template
 register = template.Library()
 
 
+def get_query(context):
+    # Views can limit the query to the parameters that matter to them
+    query = context.get('filter_query')
+    if query is None:
+        query = context['request'].GET
+    return query
+
+
 @register.simple_tag(takes_context=True)
 def append_to_query(context, **kwargs):
-    request = context['request']
-    updated = request.GET.copy()
+    updated = get_query(context).copy()
 
     # The update method appends to the MultiValueDict, it doesn't overwrite
     updated.update(kwargs)
@@ -16,9 +23,7 @@ def append_to_query(context, **kwargs):
 
 @register.simple_tag(takes_context=True)
 def override_in_query(context, **kwargs):
-    request = context['request']
-
-    updated = request.GET.copy()
+    updated = get_query(context).copy()
     # Setting a value overwrites existing values
     for key, value in kwargs.items():
         updated[key] = value
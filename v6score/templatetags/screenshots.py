@@ -0,0 +1,10 @@
+from django import template
+
+from v6score.renditions import get_rendition_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def rendition(field_file, size):
+    return get_rendition_url(field_file, size)
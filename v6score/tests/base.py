@@ -0,0 +1,85 @@
+import io
+import shutil
+import tempfile
+
+from PIL import Image
+from django.core.cache import caches
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from v6score.models import Measurement
+from v6score.storage import screenshot_storage
+
+
+def png_bytes(width=200, height=150, color=(200, 100, 50), compress_level=9):
+    """
+    An image that compresses well, with a gradient so it isn't trivial
+    """
+    image = Image.new('RGB', (width, height), color)
+    for x in range(width):
+        image.putpixel((x, 0), (x % 256, 0, 0))
+
+    output = io.BytesIO()
+    image.save(output, format='PNG', compress_level=compress_level)
+    return output.getvalue()
+
+
+def create_measurement(url='http://www.example.com/', **kwargs):
+    kwargs.setdefault('requested', timezone.now())
+    return Measurement.objects.create(url=url, **kwargs)
+
+
+def create_finished_measurement(url='http://www.example.com/', **kwargs):
+    now = timezone.now()
+    kwargs.setdefault('started', now)
+    kwargs.setdefault('finished', now)
+    kwargs.setdefault('latest', True)
+    for leg_name in ('v4only', 'v6only', 'nat64'):
+        kwargs.setdefault('{}_data'.format(leg_name), {})
+    kwargs.setdefault('v6only_image_score', 1.0)
+    kwargs.setdefault('nat64_image_score', 1.0)
+    return create_measurement(url, **kwargs)
+
+
+class PageCacheMixin:
+    """
+    Cache pages in memory instead of on disk, empty for every test
+    """
+
+    def setUp(self):
+        super().setUp()
+
+        cache_settings = override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'pages': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-pages'},
+        })
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+        caches['pages'].clear()
+
+
+class TemporaryMediaMixin(PageCacheMixin):
+    """
+    Store screenshots, their renditions and packs in a temporary directory
+    """
+
+    def setUp(self):
+        super().setUp()
+
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+        media_settings = override_settings(MEDIA_ROOT=self.media_root,
+                                           SCREENSHOT_PACK_ROOT=self.media_root + '/packs')
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        # The storage remembers where its segments are and how big they get
+        self.forget_packs()
+        self.addCleanup(self.forget_packs)
+
+    @staticmethod
+    def forget_packs():
+        screenshot_storage.__dict__.pop('pack_location', None)
+        screenshot_storage.__dict__.pop('segment_size', None)
+        screenshot_storage._mapped_segments.clear()
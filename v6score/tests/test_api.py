@@ -0,0 +1,194 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils import timezone
+
+from v6score.api import MAX_BATCH_SIZE, decode_cursor, encode_cursor
+from v6score.models import Measurement
+from v6score.tests.base import create_finished_measurement, create_measurement
+
+
+class MeasurementListTests(TestCase):
+    def setUp(self):
+        self.url = reverse('api_measurements')
+
+        # Two finished at the same moment, the cursor has to tell them apart
+        now = timezone.now()
+        finished_times = [now, now - timedelta(minutes=1), now - timedelta(minutes=1), now - timedelta(minutes=2),
+                          now - timedelta(minutes=3)]
+        self.measurements = [create_finished_measurement('http://site{}.example.com/'.format(number),
+                                                         finished=finished)
+                             for number, finished in enumerate(finished_times)]
+
+    def get_ids(self, response):
+        return [result['id'] for result in response.json()['results']]
+
+    def test_pages(self):
+        ids = []
+        next_url = self.url + '?limit=2'
+        while next_url:
+            response = self.client.get(next_url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.json()['results']), 2)
+            ids += self.get_ids(response)
+            next_url = response.json()['next']
+
+        expected = sorted(self.measurements, key=lambda measurement: (measurement.finished, measurement.pk),
+                          reverse=True)
+        self.assertEqual(ids, [measurement.pk for measurement in expected])
+
+    def test_new_results_dont_shift_pages(self):
+        first_page = self.client.get(self.url, {'limit': 2}).json()
+        create_finished_measurement('http://new.example.com/')
+
+        second_page = self.client.get(first_page['next']).json()
+        first_ids = [result['id'] for result in first_page['results']]
+        second_ids = [result['id'] for result in second_page['results']]
+        self.assertFalse(set(first_ids) & set(second_ids))
+        self.assertEqual(len(second_ids), 2)
+
+    def test_filters_are_kept(self):
+        response = self.client.get(self.url, {'limit': 1, 'search': 'site'})
+        self.assertIn('search=site', response.json()['next'])
+
+    def test_summary(self):
+        result = self.client.get(self.url, {'limit': 1}).json()['results'][0]
+        self.assertEqual(result['status'], 'finished')
+        self.assertEqual(result['scores']['nat64_image'], 1.0)
+        self.assertTrue(result['links']['results'].startswith('http://testserver/'))
+        self.assertNotIn('resources', result)
+
+    def test_invalid_parameters(self):
+        for parameters in ({'limit': 'ten'}, {'limit': 0}, {'limit': 10000}, {'cursor': 'nonsense'},
+                           {'cursor': 'bm9uc2Vuc2V8MQ=='}):
+            response = self.client.get(self.url, parameters)
+            self.assertEqual(response.status_code, 400, parameters)
+            self.assertIn('error', response.json())
+
+    def test_cursor(self):
+        measurement = self.measurements[0]
+        self.assertEqual(decode_cursor(encode_cursor(measurement)), (measurement.finished, measurement.pk))
+
+
+class ConditionalRequestTests(TestCase):
+    def setUp(self):
+        self.measurement = create_finished_measurement()
+        self.url = reverse('api_measurement', args=(self.measurement.pk,))
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        # A change shows up as a new ETag
+        Measurement.objects.filter(pk=self.measurement.pk).update(nat64_image_score=0.5)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_compressed(self):
+        url = reverse('api_measurement_results', args=(self.measurement.pk,))
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+        # Compressing makes the ETag weak, and weak ETags match for If-None-Match
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_not_found(self):
+        response = self.client.get(reverse('api_measurement', args=(self.measurement.pk + 1,)))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': "Measurement not found"})
+
+
+class ResultsTests(TestCase):
+    def test_results(self):
+        measurement = create_finished_measurement(dns_results=['192.0.2.1', '2001:db8::1'],
+                                                  ping4_latencies=[10.0],
+                                                  v4only_data={'resources': {'1': {'stage': 'end', 'error': False}}},
+                                                  nat64_data=None)
+
+        data = self.client.get(reverse('api_measurement_results', args=(measurement.pk,))).json()
+        self.assertEqual(data['dns'], {'ipv4': ['192.0.2.1'], 'ipv6': ['2001:db8::1']})
+        self.assertEqual(data['ping']['ping4'], [10.0])
+        self.assertEqual(data['resources']['v4only'], {'ok': 1, 'error': 0})
+        self.assertIsNone(data['resources']['nat64'])
+        self.assertIsNone(data['images']['v4only'])
+        self.assertIn('v4only_data', data['links'])
+
+
+class BatchLookupTests(TestCase):
+    def test_lookup(self):
+        first = create_finished_measurement()
+        second = create_measurement()
+
+        response = self.client.get(reverse('api_measurements'), {'ids': '{},{},{}'.format(second.pk, 0, first.pk)})
+        data = response.json()
+        self.assertEqual([result['id'] for result in data['results']], [second.pk, first.pk])
+        self.assertEqual(data['results'][0]['status'], 'queued')
+        self.assertEqual(data['missing'], [0])
+
+    def test_invalid(self):
+        url = reverse('api_measurements')
+        self.assertEqual(self.client.get(url, {'ids': '1,two'}).status_code, 400)
+
+        too_many = ','.join(str(number) for number in range(MAX_BATCH_SIZE + 1))
+        self.assertEqual(self.client.get(url, {'ids': too_many}).status_code, 400)
+
+
+@mock.patch('v6score.models.notify_workers')
+class SubmitTests(TestCase):
+    def setUp(self):
+        self.url = reverse('api_measurements')
+
+    def test_form(self, notify_workers):
+        response = self.client.post(self.url, {'url': 'www.example.com'})
+
+        self.assertEqual(response.status_code, 202)
+        measurement = Measurement.objects.get()
+        self.assertEqual(measurement.url, 'http://www.example.com')
+        self.assertTrue(measurement.manual)
+        self.assertEqual(response['Location'], 'http://testserver' + reverse('api_measurement',
+                                                                            args=(measurement.pk,)))
+        self.assertEqual(response.json()['status'], 'queued')
+        self.assertTrue(notify_workers.called)
+
+    def test_json(self, notify_workers):
+        response = self.client.post(self.url, json.dumps({'url': 'http://www.example.com/'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+
+        # Asking again gives the same queued test
+        response = self.client.post(self.url, json.dumps({'url': 'http://www.example.com/'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(Measurement.objects.count(), 1)
+
+    def test_recent_result(self, notify_workers):
+        measurement = create_finished_measurement()
+
+        response = self.client.post(self.url, {'url': measurement.url})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['id'], measurement.pk)
+
+        response = self.client.post(self.url, {'url': measurement.url, 'force_new': 'on'})
+        self.assertEqual(response.status_code, 202)
+
+    def test_invalid(self, notify_workers):
+        response = self.client.post(self.url, {'url': 'not a url'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('url', response.json()['errors'])
+
+        response = self.client.post(self.url, '{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(self.url, '[]', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Measurement.objects.exists())
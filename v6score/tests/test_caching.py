@@ -0,0 +1,108 @@
+from unittest import mock
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils import timezone
+
+from v6score.caching import get_measurement_page, invalidate_overview
+from v6score.tests.base import PageCacheMixin, create_finished_measurement, create_measurement
+
+
+class MeasurementPageTests(PageCacheMixin, TestCase):
+    def test_finished_page_is_cached(self):
+        measurement = create_finished_measurement()
+        first = self.client.get(measurement.get_absolute_url())
+        self.assertEqual(first.status_code, 200)
+        self.assertIsNotNone(get_measurement_page(measurement.pk))
+
+        with self.assertNumQueries(0):
+            second = self.client.get(measurement.get_absolute_url())
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_conditional_request(self):
+        measurement = create_finished_measurement()
+        etag = self.client.get(measurement.get_absolute_url())['ETag']
+
+        response = self.client.get(measurement.get_absolute_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_latest_page_is_revalidated(self):
+        measurement = create_finished_measurement()
+        response = self.client.get(measurement.get_absolute_url())
+        self.assertIn('max-age={}'.format(settings.LATEST_MEASUREMENT_MAX_AGE), response['Cache-Control'])
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_older_page_is_cached_forever(self):
+        measurement = create_finished_measurement(latest=False)
+        create_finished_measurement()
+        response = self.client.get(measurement.get_absolute_url())
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_running_page_is_not_cached(self):
+        measurement = create_measurement(started=timezone.now())
+        self.client.get(measurement.get_absolute_url())
+        self.assertIsNone(get_measurement_page(measurement.pk))
+
+
+class InvalidationTests(PageCacheMixin, TestCase):
+    @mock.patch('v6score.models.get_addresses', return_value=[])
+    def test_new_measurement_invalidates_previous_page(self, get_addresses):
+        previous = create_finished_measurement()
+        self.client.get(previous.get_absolute_url())
+        self.assertIsNotNone(get_measurement_page(previous.pk))
+
+        measurement = create_measurement()
+        with self.assertLogs('v6score.models', 'ERROR'):
+            measurement.run_test()
+
+        self.assertIsNone(get_measurement_page(previous.pk))
+        previous.refresh_from_db()
+        self.assertFalse(previous.latest)
+
+        # Shown again, now with a link to the new one
+        response = self.client.get(previous.get_absolute_url())
+        self.assertContains(response, measurement.get_absolute_url())
+
+
+class OverviewTests(PageCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        for number in range(60):
+            create_finished_measurement('http://site{}.example.com/'.format(number))
+
+    def test_cached_listing(self):
+        first = self.client.get(reverse('overview'))
+        self.assertContains(first, 'site59.example.com')
+
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('overview'))
+        self.assertContains(second, 'site59.example.com')
+
+    def test_same_page_shares_fragment(self):
+        self.client.get(reverse('overview'), {'page': 'not-a-number'})
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('overview'), {'page': '1'})
+        self.assertContains(response, 'site59.example.com')
+
+        self.client.get(reverse('overview'), {'page': '9999'})
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('overview'), {'page': '2'})
+        self.assertContains(response, 'site0.example.com')
+        self.assertNotContains(response, 'site59.example.com')
+
+    def test_filters_have_their_own_fragment(self):
+        self.client.get(reverse('overview'))
+        response = self.client.get(reverse('overview'), {'search': 'site7.'})
+        self.assertContains(response, 'site7.example.com')
+        self.assertNotContains(response, 'site8.example.com')
+
+    def test_invalidated_by_new_results(self):
+        self.client.get(reverse('overview'))
+
+        create_finished_measurement('http://new.example.com/')
+        self.assertNotContains(self.client.get(reverse('overview')), 'new.example.com')
+
+        invalidate_overview()
+        self.assertContains(self.client.get(reverse('overview')), 'new.example.com')
@@ -0,0 +1,120 @@
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from v6score.export import export_lines
+from v6score.models import Measurement
+from v6score.tests.base import create_finished_measurement
+
+RESOURCES = {
+    'resources': {
+        '1': {'stage': 'end', 'error': False},
+        '2': {'stage': 'end', 'error': True},
+        '3': {'stage': 'start'},
+    },
+}
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.measurement = create_finished_measurement(
+            'http://www.example.com/',
+            dns_results=['192.0.2.1', '2001:db8::1', '2001:db8::2'],
+            ping4_latencies=[10.0, 20.0, -1],
+            ping6_latencies=[-2, -1],
+            v4only_data=RESOURCES,
+            nat64_image_score=0.5,
+        )
+        create_finished_measurement('http://www.example.org/')
+
+    def export(self, export_format, queryset=None):
+        queryset = queryset or Measurement.objects.filter(pk=self.measurement.pk)
+        return ''.join(export_lines(queryset, export_format))
+
+    def test_csv(self):
+        rows = list(csv.DictReader(io.StringIO(self.export('csv'))))
+
+        self.assertEqual(len(rows), 1)
+        row = rows[0]
+        self.assertEqual(row['id'], str(self.measurement.pk))
+        self.assertEqual(row['url'], 'http://www.example.com/')
+        self.assertEqual(row['nat64_image_score'], '0.5')
+        self.assertEqual(row['v4only_resources_ok'], '1')
+        self.assertEqual(row['v4only_resources_error'], '2')
+        self.assertEqual(row['v6only_resources_ok'], '0')
+        self.assertEqual(row['ipv4_addresses'], '1')
+        self.assertEqual(row['ipv6_addresses'], '2')
+        self.assertEqual(float(row['ping4_average']), 15.0)
+        self.assertEqual(row['ping4_lost'], '1')
+        self.assertEqual(row['ping6_average'], '')
+        self.assertEqual(row['ping6_lost'], '2')
+
+    def test_falsy_errors(self):
+        data = {
+            'resources': {
+                '1': {'stage': 'end', 'error': None},
+                '2': {'stage': 'end', 'error': 0},
+                '3': {'stage': 'end', 'error': ''},
+                '4': {'stage': 'end'},
+                '5': {'stage': 'end', 'error': 'timeout'},
+            },
+        }
+        measurement = create_finished_measurement('http://www.example.net/', v4only_data=data)
+        row = next(csv.DictReader(io.StringIO(self.export('csv', Measurement.objects.filter(pk=measurement.pk)))))
+
+        # Same as the model counts them
+        self.assertEqual(measurement.v4only_resources, (3, 2))
+        self.assertEqual(row['v4only_resources_ok'], '3')
+        self.assertEqual(row['v4only_resources_error'], '2')
+
+    def test_jsonl(self):
+        lines = self.export('jsonl').splitlines()
+
+        self.assertEqual(len(lines), 1)
+        row = json.loads(lines[0])
+        self.assertEqual(row['url'], 'http://www.example.com/')
+        self.assertEqual(row['v4only_resources_ok'], 1)
+        self.assertIsNone(row['ping6_average'])
+        self.assertTrue(row['finished'].startswith(self.measurement.finished.strftime('%Y-%m-%dT%H:%M:%S')))
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            self.export('xml')
+
+    def test_keeps_ordering(self):
+        rows = list(csv.DictReader(io.StringIO(self.export('csv', Measurement.objects.order_by('-url')))))
+        self.assertEqual([row['url'] for row in rows], ['http://www.example.org/', 'http://www.example.com/'])
+
+    def test_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        filename = os.path.join(directory, 'export.jsonl')
+
+        call_command('export_measurements', verbosity=0, format='jsonl', search='example.org', output=filename)
+
+        with open(filename) as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([row['url'] for row in rows], ['http://www.example.org/'])
+
+    def test_view(self):
+        url = reverse('export', args=('csv',))
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+
+        User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        self.client.login(username='staff', password='password')
+        response = self.client.get(url, {'test': 'nat64', 'score': 'poor'})
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('nat64check.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+        self.assertEqual([row['url'] for row in rows], ['http://www.example.com/'])
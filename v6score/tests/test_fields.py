@@ -0,0 +1,37 @@
+from django.test import TestCase
+
+from v6score.fields import RawJSON
+from v6score.models import Measurement
+from v6score.tests.base import create_measurement
+
+
+class LazyJSONFieldTests(TestCase):
+    def test_decoded_on_first_access(self):
+        measurement = create_measurement(v4only_data={'b': 1, 'a': [1, 2]})
+
+        measurement = Measurement.objects.get(pk=measurement.pk)
+        self.assertIsInstance(measurement.__dict__['v4only_data'], RawJSON)
+
+        self.assertEqual(measurement.v4only_data, {'b': 1, 'a': [1, 2]})
+        self.assertNotIsInstance(measurement.__dict__['v4only_data'], RawJSON)
+
+    def test_saved_without_decoding(self):
+        measurement = create_measurement(v4only_data={'resources': {'1': {'url': 'http://www.example.com/'}}})
+
+        measurement = Measurement.objects.get(pk=measurement.pk)
+        measurement.manual = True
+        measurement.save()
+        self.assertIsInstance(measurement.__dict__['v4only_data'], RawJSON)
+
+        measurement = Measurement.objects.get(pk=measurement.pk)
+        self.assertEqual(measurement.v4only_data, {'resources': {'1': {'url': 'http://www.example.com/'}}})
+
+    def test_assigned_value_is_saved(self):
+        measurement = create_measurement()
+
+        measurement = Measurement.objects.get(pk=measurement.pk)
+        self.assertIsNone(measurement.v4only_data)
+        measurement.v4only_data = {'exit_code': 0}
+        measurement.save()
+
+        self.assertEqual(Measurement.objects.get(pk=measurement.pk).v4only_data, {'exit_code': 0})
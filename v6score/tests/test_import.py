@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils import timezone
+
+from v6score.models import Measurement
+from v6score.tests.base import create_finished_measurement, create_measurement
+
+TOP_SITES = '1,example.com\n2,www.Example.org\n3,example.com\n4,not a url\n5,example.net\n'
+
+
+class ImportTestsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        self.filename = os.path.join(directory, 'top-1m.csv')
+        with open(self.filename, 'w') as f:
+            f.write(TOP_SITES)
+
+        self.zip_filename = os.path.join(directory, 'top-1m.csv.zip')
+        with zipfile.ZipFile(self.zip_filename, 'w') as archive:
+            archive.write(self.filename, 'top-1m.csv')
+
+    def queued_urls(self):
+        return sorted(Measurement.objects.values_list('url', flat=True))
+
+    def test_import(self):
+        call_command('import_tests', self.filename, verbosity=0)
+
+        self.assertEqual(self.queued_urls(), ['http://example.com', 'http://example.net', 'http://www.Example.org'])
+        measurement = Measurement.objects.get(url='http://www.Example.org')
+        self.assertEqual(measurement.host, 'www.example.org')
+        self.assertEqual(measurement.priority, Measurement.PRIORITY_BULK)
+        self.assertFalse(measurement.prescreen_pending)
+        self.assertIsNone(measurement.scan_run)
+
+    def test_zip_file(self):
+        call_command('import_tests', self.zip_filename, verbosity=0, chunk_size=1)
+        self.assertEqual(Measurement.objects.count(), 3)
+
+    def test_missing_file(self):
+        with self.assertRaises(CommandError):
+            call_command('import_tests', self.filename + '.missing', verbosity=0)
+
+    def test_options(self):
+        call_command('import_tests', self.filename, verbosity=0, limit=2, priority='monitoring', prescreen=True)
+
+        self.assertEqual(self.queued_urls(), ['http://example.com', 'http://www.Example.org'])
+        for measurement in Measurement.objects.all():
+            self.assertEqual(measurement.priority, Measurement.PRIORITY_MONITORING)
+            self.assertTrue(measurement.prescreen_pending)
+
+    def test_column(self):
+        call_command('import_tests', self.filename, verbosity=0, column=0)
+        self.assertEqual(Measurement.objects.count(), 0)
+
+    def test_dry_run(self):
+        call_command('import_tests', self.filename, verbosity=0, dry_run=True, scan_run='Top sites')
+        self.assertEqual(Measurement.objects.count(), 0)
+
+    def test_skip_queued_and_recent(self):
+        create_measurement('http://example.com')
+        create_finished_measurement('http://example.net', finished=timezone.now() - timedelta(hours=1))
+        create_finished_measurement('http://www.Example.org', finished=timezone.now() - timedelta(days=2))
+
+        call_command('import_tests', self.filename, verbosity=0)
+
+        self.assertEqual(Measurement.objects.filter(url='http://example.com').count(), 1)
+        self.assertEqual(Measurement.objects.filter(url='http://example.net').count(), 1)
+        self.assertEqual(Measurement.objects.filter(url='http://www.Example.org').count(), 2)
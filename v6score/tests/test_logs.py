@@ -0,0 +1,109 @@
+import io
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from v6score.logs import (ContextFilter, ContextQueueHandler, JSONFormatter, current_context, log_context,
+                          set_process_context)
+from v6score.tests.base import create_measurement
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.addFilter(ContextFilter())
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@mock.patch.dict('v6score.logs._process_context', clear=True)
+class ContextTests(SimpleTestCase):
+    def test_log_context(self):
+        with log_context(worker='worker1'):
+            with log_context(measurement_id=1, url='http://www.example.com/'):
+                self.assertEqual(current_context(), {'worker': 'worker1', 'measurement_id': 1,
+                                                     'url': 'http://www.example.com/'})
+            self.assertEqual(current_context(), {'worker': 'worker1'})
+        self.assertEqual(current_context(), {})
+
+    def test_process_context(self):
+        set_process_context(worker_pid=123)
+
+        other_threads_context = []
+        with log_context(measurement_id=1):
+            thread = threading.Thread(target=lambda: other_threads_context.append(current_context()))
+            thread.start()
+            thread.join()
+
+        # Only the process context is shared
+        self.assertEqual(other_threads_context, [{'worker_pid': 123}])
+
+    def test_json_formatter(self):
+        logger = logging.getLogger('v6score.tests.json')
+        handler = RecordingHandler()
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+
+        with log_context(measurement_id=1):
+            try:
+                raise ValueError("broken")
+            except ValueError:
+                logger.error("Test %s failed", 'http://www.example.com/', exc_info=True)
+
+        data = json.loads(JSONFormatter().format(handler.records[0]))
+        self.assertEqual(list(data)[:4], ['time', 'level', 'logger', 'message'])
+        self.assertEqual(data['level'], 'ERROR')
+        self.assertEqual(data['message'], 'Test http://www.example.com/ failed')
+        self.assertEqual(data['measurement_id'], 1)
+        self.assertIn('ValueError: broken', data['exception'])
+
+
+class QueueHandlerTests(SimpleTestCase):
+    def test_queued(self):
+        output = io.StringIO()
+        console = logging.StreamHandler(output)
+        console.setFormatter(JSONFormatter())
+
+        log_queue = queue.Queue()
+        listener = logging.handlers.QueueListener(log_queue, console)
+        listener.start()
+
+        logger = logging.getLogger('v6score.tests.queued')
+        handler = ContextQueueHandler(log_queue)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+
+        with log_context(measurement_id=2):
+            logger.warning("Retrying %s", {'legs': 4})
+        listener.stop()
+
+        # The context is taken from the thread that logged, not the one that wrote
+        data = json.loads(output.getvalue())
+        self.assertEqual(data['message'], "Retrying {'legs': 4}")
+        self.assertEqual(data['measurement_id'], 2)
+
+
+class MeasurementContextTests(TestCase):
+    @mock.patch('v6score.models.get_addresses', return_value=[])
+    def test_run_test(self, get_addresses):
+        measurement = create_measurement()
+
+        # Instead of the usual handlers, like assertLogs does
+        logger = logging.getLogger('v6score.models')
+        handler = RecordingHandler()
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        with mock.patch.object(logger, 'propagate', False):
+            measurement.run_test()
+
+        self.assertTrue(handler.records)
+        for record in handler.records:
+            self.assertEqual(record.context['measurement_id'], measurement.pk)
+            self.assertEqual(record.context['url'], measurement.url)
@@ -0,0 +1,142 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.urlresolvers import reverse
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from v6score.metrics import (Counter, EXPOSITION_CONTENT_TYPE, Gauge, Histogram, WorkerMetrics, queue_metrics,
+                             retry_chain_length)
+from v6score.models import LEG_NAT64, Measurement, Worker
+from v6score.tests.base import create_finished_measurement, create_measurement
+
+
+def parse_samples(exposition):
+    samples = {}
+    for line in exposition.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+class ExpositionTests(SimpleTestCase):
+    def test_counter(self):
+        counter = Counter('tests_total', "Tests run", ['reason'])
+        counter.inc(reason='dns')
+        counter.inc(2, reason='dns')
+        counter.inc(reason='say "hi"\n')
+
+        self.assertEqual(counter.exposition(),
+                         '# HELP tests_total Tests run\n'
+                         '# TYPE tests_total counter\n'
+                         'tests_total{reason="dns"} 3.0\n'
+                         'tests_total{reason="say \\"hi\\"\\n"} 1.0\n')
+
+    def test_labels_must_match(self):
+        gauge = Gauge('depth', "Queue depth", ['priority'])
+        with self.assertRaises(ValueError):
+            gauge.set(1)
+        with self.assertRaises(ValueError):
+            gauge.set(1, priority='bulk', worker='worker1')
+
+    def test_histogram(self):
+        histogram = Histogram('seconds', "Seconds", [1, 5])
+        for value in (0.5, 1, 3, 10):
+            histogram.observe(value)
+
+        self.assertEqual(parse_samples(histogram.exposition()), {
+            'seconds_bucket{le="1.0"}': 2,
+            'seconds_bucket{le="5.0"}': 3,
+            'seconds_bucket{le="+Inf"}': 4,
+            'seconds_sum': 14.5,
+            'seconds_count': 4,
+        })
+
+
+class QueueMetricsTests(TestCase):
+    def test_queue(self):
+        now = timezone.now()
+        create_measurement(requested=now - timedelta(seconds=30), priority=Measurement.PRIORITY_INTERACTIVE)
+        create_measurement(priority=Measurement.PRIORITY_BULK)
+        create_measurement(priority=Measurement.PRIORITY_BULK)
+        create_measurement(requested=now + timedelta(minutes=5), priority=Measurement.PRIORITY_RETRY)
+        create_measurement(prescreen_pending=True)
+        create_measurement(started=now, lease_expires=now - timedelta(seconds=1))
+        create_finished_measurement()
+
+        worker = Worker.objects.create(hostname='worker1', pid=1, tests_finished=7)
+        Worker.objects.create(hostname='worker2', pid=2, stopped=now)
+
+        samples = parse_samples(queue_metrics().exposition())
+        self.assertEqual(samples['v6score_queue_depth{priority="interactive"}'], 1)
+        self.assertEqual(samples['v6score_queue_depth{priority="bulk"}'], 2)
+        self.assertEqual(samples['v6score_queue_depth{priority="retry"}'], 0)
+        self.assertGreaterEqual(samples['v6score_queue_oldest_age_seconds{priority="interactive"}'], 30)
+        self.assertEqual(samples['v6score_queue_scheduled{priority="retry"}'], 1)
+        self.assertEqual(samples['v6score_prescreen_pending'], 1)
+        self.assertEqual(samples['v6score_tests_running'], 1)
+        self.assertEqual(samples['v6score_leases_expired'], 1)
+        self.assertEqual(samples['v6score_tests_finished_recently'], 1)
+        self.assertEqual(samples['v6score_workers_alive'], 1)
+        self.assertEqual(samples['v6score_worker_tests_finished_total{worker="worker1:1"}'], worker.tests_finished)
+
+    def test_view(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], EXPOSITION_CONTENT_TYPE)
+        self.assertIn(b'v6score_queue_depth', response.content)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='192.0.2.1')
+        self.assertEqual(response.status_code, 403)
+
+
+class RetryChainLengthTests(TestCase):
+    def test_chain(self):
+        first = create_finished_measurement()
+        self.assertEqual(retry_chain_length(first), 0)
+
+        retry = first
+        for _ in range(3):
+            retry = create_finished_measurement(retry_for=retry)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(retry_chain_length(retry), 3)
+
+    def test_not_a_retry(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(retry_chain_length(Measurement()), 0)
+
+
+class WorkerMetricsTests(TestCase):
+    def setUp(self):
+        self.metrics = WorkerMetrics()
+
+    def test_add_test(self):
+        measurement = create_finished_measurement(timings={'render_v4only': 3.0, 'dns': 0.1})
+        self.metrics.add_claim(0.002, 1)
+        self.metrics.add_test(measurement, LEG_NAT64, 12.0)
+
+        samples = parse_samples(self.metrics.registry.exposition())
+        self.assertEqual(samples['v6score_worker_claimed_total'], 1)
+        self.assertEqual(samples['v6score_worker_tests_total'], 1)
+        self.assertEqual(samples['v6score_worker_test_failures_total{reason="nat64"}'], 1)
+        self.assertEqual(samples['v6score_worker_test_failures_total{reason="dns"}'], 0)
+        self.assertEqual(samples['v6score_worker_render_seconds_sum{leg="v4only"}'], 3.0)
+        self.assertNotIn('v6score_worker_render_seconds_sum{leg="nat64"}', samples)
+        self.assertEqual(samples['v6score_worker_retry_chain_length_bucket{le="0.0"}'], 1)
+
+    @mock.patch('urllib.request.urlopen')
+    def test_push(self, urlopen):
+        worker = Worker(hostname='worker1', pid=123)
+        self.metrics.push('http://pushgateway:9091/', worker)
+
+        request = urlopen.call_args[0][0]
+        self.assertEqual(request.full_url, 'http://pushgateway:9091/metrics/job/v6score_worker/instance/worker1%3A123')
+        self.assertEqual(request.get_method(), 'PUT')
+        self.assertIn(b'v6score_worker_claims_total', request.data)
+
+    @mock.patch('urllib.request.urlopen', side_effect=OSError("Connection refused"))
+    def test_push_failure(self, urlopen):
+        with self.assertLogs('v6score.metrics', 'WARNING'):
+            self.metrics.push('http://pushgateway:9091', Worker(hostname='worker1', pid=123))
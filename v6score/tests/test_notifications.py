@@ -0,0 +1,65 @@
+import threading
+import time
+
+from django.db import connection
+from django.test import TransactionTestCase
+
+from v6score.models import Measurement
+from v6score.notifications import WorkerWakeup, notify_workers
+
+
+class WorkerWakeupTests(TransactionTestCase):
+    """
+    Notifications are only delivered when the transaction that sent them commits, so these tests don't run in one
+    """
+
+    def setUp(self):
+        self.wakeup = WorkerWakeup()
+        self.wakeup.listen()
+
+    def test_timeout(self):
+        start = time.monotonic()
+        self.assertFalse(self.wakeup.wait(0.1))
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_notified(self):
+        notify_workers()
+        self.assertTrue(self.wakeup.wait(5))
+
+        # The notification has been used up
+        self.assertFalse(self.wakeup.wait(0))
+
+    def test_notified_by_other_connection(self):
+        def notify():
+            try:
+                notify_workers()
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=notify)
+        thread.start()
+        thread.join()
+
+        self.assertTrue(self.wakeup.wait(5))
+
+    def test_requested_test(self):
+        Measurement.objects.get_measurement_for_url('http://www.example.com/')
+        self.assertTrue(self.wakeup.wait(5))
+
+    def test_interrupt(self):
+        self.wakeup.interrupt()
+
+        start = time.monotonic()
+        self.assertFalse(self.wakeup.wait(5))
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_new_connection(self):
+        old_connection = self.wakeup.listening_on
+        connection.close()
+
+        # Subscribes on the new connection
+        self.assertFalse(self.wakeup.wait(0))
+        self.assertIsNot(self.wakeup.listening_on, old_connection)
+
+        notify_workers()
+        self.assertTrue(self.wakeup.wait(5))
@@ -0,0 +1,170 @@
+import asyncio
+import io
+import socket
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from v6score.management.commands.prescreen_tests import Command
+from v6score.models import Measurement
+from v6score.prescreen import fetch, insecure_ssl_context, needs_browser_test
+from v6score.tests.base import create_finished_measurement, create_measurement
+
+
+def response(status=200, location=None, error=None):
+    return {'address': '192.0.2.1', 'status': status, 'location': location, 'error': error, 'time': 0.1}
+
+
+SAME = {'v4': response(), 'v6': response()}
+DIFFERENT = {'v4': response(), 'v6': response(status=None, error='Connection refused')}
+
+
+class NeedsBrowserTestTests(SimpleTestCase):
+    def test_same_response(self):
+        self.assertFalse(needs_browser_test(SAME))
+        self.assertFalse(needs_browser_test({'v4': response(301, 'https://www.example.com/'),
+                                             'v6': response(301, 'https://www.example.com/')}))
+
+    def test_different_response(self):
+        self.assertTrue(needs_browser_test(DIFFERENT))
+        self.assertTrue(needs_browser_test({'v4': response(301, 'https://www.example.com/'),
+                                            'v6': response(301, 'https://v4.example.com/')}))
+
+    def test_unclear(self):
+        self.assertTrue(needs_browser_test({'v4': response(), 'v6': response(status=None, error='timeout')}))
+        self.assertTrue(needs_browser_test({'v4': response(503), 'v6': response(503)}))
+
+    def test_not_there(self):
+        self.assertFalse(needs_browser_test({'v4': response(status=None, error='Name or service not known'),
+                                             'v6': response(status=None, error='Name or service not known')}))
+
+
+class FetchTests(SimpleTestCase):
+    """
+    Fetch from a server on the IPv4 loopback address
+    """
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.requests = []
+
+    def serve(self, handler):
+        server = self.loop.run_until_complete(asyncio.start_server(handler, '127.0.0.1', 0))
+        self.addCleanup(self.loop.run_until_complete, server.wait_closed())
+        self.addCleanup(server.close)
+        return server.sockets[0].getsockname()[1]
+
+    def fetch(self, url, timeout=5):
+        return self.loop.run_until_complete(fetch(url, socket.AF_INET, timeout, insecure_ssl_context()))
+
+    def test_response(self):
+        async def redirect(reader, writer):
+            self.requests.append(await reader.readuntil(b'\r\n\r\n'))
+            writer.write(b'HTTP/1.1 302 Found\r\nLocation: http://www.example.com/\r\nContent-Length: 0\r\n\r\n')
+            await writer.drain()
+            writer.close()
+
+        port = self.serve(redirect)
+        result = self.fetch('http://127.0.0.1:{}/page?q=1'.format(port))
+
+        self.assertIsNone(result['error'])
+        self.assertEqual(result['address'], '127.0.0.1')
+        self.assertEqual(result['status'], 302)
+        self.assertEqual(result['location'], 'http://www.example.com/')
+        self.assertIsNotNone(result['time'])
+        self.assertTrue(self.requests[0].startswith(b'GET /page?q=1 HTTP/1.1\r\n'))
+        self.assertIn('Host: 127.0.0.1:{}\r\n'.format(port).encode('ascii'), self.requests[0])
+
+    def test_invalid_response(self):
+        async def garbage(reader, writer):
+            writer.write(b'SSH-2.0-OpenSSH\r\n')
+            await writer.drain()
+            writer.close()
+
+        port = self.serve(garbage)
+        result = self.fetch('http://127.0.0.1:{}/'.format(port))
+        self.assertIsNone(result['status'])
+        self.assertIn('Invalid status line', result['error'])
+
+    def test_timeout(self):
+        async def silent(reader, writer):
+            # Until the client gives up
+            await reader.read()
+            writer.close()
+
+        port = self.serve(silent)
+        result = self.fetch('http://127.0.0.1:{}/'.format(port), timeout=0.2)
+        self.assertEqual(result['error'], 'timeout')
+        self.assertLess(result['time'], 2)
+
+    def test_connection_refused(self):
+        with socket.socket() as unused:
+            unused.bind(('127.0.0.1', 0))
+            port = unused.getsockname()[1]
+
+        result = self.fetch('http://127.0.0.1:{}/'.format(port))
+        self.assertIsNone(result['status'])
+        self.assertIsNotNone(result['error'])
+        self.assertNotEqual(result['error'], 'timeout')
+
+
+class PromotionTests(TestCase):
+    def test_save_results(self):
+        same = create_measurement('http://same.example.com/', prescreen_pending=True)
+        different = create_measurement('http://different.example.com/', prescreen_pending=True)
+
+        self.assertEqual(Command.save_results([same, different], [SAME, DIFFERENT]), 1)
+
+        same.refresh_from_db()
+        self.assertFalse(same.prescreen_pending)
+        self.assertIsNotNone(same.finished)
+        self.assertEqual(same.prescreen_results, SAME)
+
+        different.refresh_from_db()
+        self.assertFalse(different.prescreen_pending)
+        self.assertIsNone(different.started)
+        self.assertEqual(different.prescreen_results, DIFFERENT)
+
+    def test_requested_in_the_meantime(self):
+        measurement = create_measurement(prescreen_pending=True)
+        Measurement.objects.get_measurement_for_url(measurement.url)
+
+        measurement.refresh_from_db()
+        self.assertFalse(measurement.prescreen_pending)
+        self.assertTrue(measurement.manual)
+        self.assertEqual(measurement.priority, Measurement.PRIORITY_INTERACTIVE)
+
+        # The visitor wants to see the browser test, whatever the prescreen says
+        self.assertEqual(Command.save_results([measurement], [DIFFERENT]), 0)
+        Command.save_results([measurement], [SAME])
+        measurement.refresh_from_db()
+        self.assertIsNone(measurement.finished)
+        self.assertIsNone(measurement.prescreen_results)
+
+    def test_requested_manually(self):
+        measurement = create_measurement(prescreen_pending=True)
+        call_command('request_test', measurement.url, manual=True, verbosity=0)
+
+        measurement.refresh_from_db()
+        self.assertTrue(measurement.manual)
+        self.assertFalse(measurement.prescreen_pending)
+
+    def test_prescreened_results_are_not_shown(self):
+        prescreened = create_finished_measurement(prescreen_results=SAME, v4only_data=None)
+        self.assertFalse(Measurement.objects.browser_tested().filter(pk=prescreened.pk).exists())
+
+        measurement = Measurement.objects.get_measurement_for_url(prescreened.url)
+        self.assertNotEqual(measurement, prescreened)
+        self.assertIsNone(measurement.started)
+
+    def test_prescreened_results_are_not_recent(self):
+        create_finished_measurement('http://example.net', prescreen_results=SAME, v4only_data=None,
+                                    finished=timezone.now() - timedelta(hours=1))
+
+        with mock.patch('sys.stdin', io.StringIO('example.net\n')):
+            call_command('import_tests', '-', verbosity=0)
+        self.assertEqual(Measurement.objects.filter(url='http://example.net').count(), 2)
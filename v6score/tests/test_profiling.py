@@ -0,0 +1,110 @@
+import os
+import pstats
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+from django.test import SimpleTestCase
+
+from v6score.models import Measurement
+from v6score.profiling import SamplingProfiler, import_paths, profile_test, short_filename
+
+
+def busy(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+class ShortFilenameTests(SimpleTestCase):
+    def test_short_filename(self):
+        paths = ['/srv/app/lib', '/srv/app']
+        self.assertEqual(short_filename('/srv/app/lib/module.py', paths), 'module.py')
+        self.assertEqual(short_filename('/srv/app/v6score/models.py', paths), 'v6score/models.py')
+        self.assertEqual(short_filename('/usr/lib/other.py', paths), '/usr/lib/other.py')
+
+    def test_import_paths(self):
+        paths = import_paths()
+        self.assertNotIn('', paths)
+        self.assertEqual(paths, sorted(paths, key=len, reverse=True))
+        self.assertEqual(short_filename(__file__), 'v6score/tests/test_profiling.py')
+
+
+class SamplingProfilerTests(SimpleTestCase):
+    def test_sample(self):
+        profiler = SamplingProfiler()
+        profiler.sample(signal.SIGALRM, sys._getframe())
+        profiler.sample(signal.SIGALRM, sys._getframe())
+
+        (stack, count), = profiler.stacks.items()
+        self.assertEqual(count, 2)
+
+        # The outermost frame first
+        self.assertIn('test_sample (v6score/tests/test_profiling.py:', stack.split(';')[-1])
+
+        # Every code object is only formatted once
+        code = sys._getframe().f_code
+        self.assertIs(profiler.frame_name(code), profiler.frame_name(code))
+
+    def test_start_and_stop(self):
+        previous_handler = signal.getsignal(signal.SIGALRM)
+
+        profiler = SamplingProfiler(interval=0.001)
+        profiler.start()
+        try:
+            busy(0.1)
+        finally:
+            profiler.stop()
+
+        self.assertGreater(sum(profiler.stacks.values()), 0)
+        self.assertTrue(any('busy (' in stack for stack in profiler.stacks))
+        self.assertEqual(signal.getsignal(signal.SIGALRM), previous_handler)
+
+
+class ProfileTestTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.measurement = Measurement(url='http://www.example.com:8080/')
+
+    def profiles(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_off(self):
+        with profile_test(self.measurement, None, self.directory):
+            busy(0.01)
+        self.assertEqual(self.profiles(), [])
+
+    def test_cprofile(self):
+        with self.assertLogs('v6score.profiling', 'INFO'):
+            with profile_test(self.measurement, 'cprofile', self.directory):
+                busy(0.01)
+
+        filename, = self.profiles()
+        self.assertTrue(filename.endswith('-unsaved-www.example.com_8080.pstats'))
+        stats = pstats.Stats(os.path.join(self.directory, filename))
+        self.assertTrue(any(function_name == 'busy' for path, line, function_name in stats.stats))
+
+    def test_sample(self):
+        with self.assertLogs('v6score.profiling', 'INFO'):
+            with profile_test(self.measurement, 'sample', self.directory):
+                busy(0.05)
+
+        filename, = self.profiles()
+        self.assertTrue(filename.endswith('.folded'))
+        with open(os.path.join(self.directory, filename)) as f:
+            for line in f:
+                stack, count = line.rsplit(' ', 1)
+                self.assertGreater(int(count), 0)
+
+    def test_fast_tests_are_not_kept(self):
+        with profile_test(self.measurement, 'cprofile', self.directory, slower_than=60):
+            pass
+        self.assertEqual(self.profiles(), [])
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            with profile_test(self.measurement, 'perf', self.directory):
+                pass
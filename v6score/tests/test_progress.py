@@ -0,0 +1,119 @@
+import json
+import time
+from unittest import mock
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from v6score.models import Measurement
+from v6score.notifications import ProgressListener, notify_progress
+from v6score.progress import current_phase, progress_events
+from v6score.tests.base import create_finished_measurement, create_measurement
+
+
+def event_phases(events):
+    phases = []
+    for event in events:
+        if event.startswith('event: phase\n'):
+            phases.append(json.loads(event.split('data: ', 1)[1])['phase'])
+        elif event.startswith('event: reload\n'):
+            phases.append('reload')
+    return phases
+
+
+class CurrentPhaseTests(TestCase):
+    def test_phases(self):
+        measurement = create_measurement()
+        self.assertEqual(current_phase(measurement.pk), 'queued')
+
+        Measurement.objects.filter(pk=measurement.pk).update(started=timezone.now())
+        self.assertEqual(current_phase(measurement.pk), 'started')
+
+        measurement.set_phase(Measurement.PHASE_PING)
+        self.assertEqual(current_phase(measurement.pk), Measurement.PHASE_PING)
+
+        Measurement.objects.filter(pk=measurement.pk).update(finished=timezone.now())
+        self.assertEqual(current_phase(measurement.pk), Measurement.PHASE_DONE)
+
+    def test_finished(self):
+        measurement = create_finished_measurement()
+        self.assertEqual(event_phases(progress_events(measurement.pk)), [Measurement.PHASE_DONE])
+
+    def test_view(self):
+        measurement = create_finished_measurement()
+
+        response = self.client.get(reverse('measurement_progress', args=(measurement.pk,)))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertIn(b'"Finished"', b''.join(response.streaming_content))
+
+        response = self.client.get(reverse('measurement_progress', args=(measurement.pk + 1,)))
+        self.assertEqual(response.status_code, 404)
+
+
+class ProgressListenerTests(TransactionTestCase):
+    """
+    The listener has a connection of its own, it only sees what has been committed
+    """
+
+    def setUp(self):
+        self.listener = ProgressListener()
+        self.addCleanup(self.listener.close)
+
+    def test_wait(self):
+        notify_progress(2, Measurement.PHASE_DNS)
+        notify_progress(1, Measurement.PHASE_DNS)
+        notify_progress(1, Measurement.PHASE_PING)
+
+        self.assertEqual(self.listener.wait(1, 5), [Measurement.PHASE_DNS, Measurement.PHASE_PING])
+
+    def test_other_measurements_dont_end_the_wait(self):
+        notify_progress(2, Measurement.PHASE_DNS)
+
+        start = time.monotonic()
+        self.assertEqual(self.listener.wait(1, 0.2), [])
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+    def test_slots(self):
+        other = ProgressListener()
+        self.addCleanup(other.close)
+
+        self.assertTrue(self.listener.take_slot(1))
+        self.assertFalse(other.take_slot(1))
+        self.assertTrue(other.take_slot(2))
+
+        # Closing the connection gives the slot back
+        self.listener.close()
+        third = ProgressListener()
+        self.addCleanup(third.close)
+        self.assertTrue(third.take_slot(1))
+
+
+class ProgressStreamTests(TransactionTestCase):
+    def setUp(self):
+        self.measurement = create_measurement()
+
+    def test_stream(self):
+        take_slot = ProgressListener.take_slot
+
+        def take_slot_and_run(listener, slots):
+            # The test runs while the stream is listening
+            result = take_slot(listener, slots)
+            notify_progress(self.measurement.pk + 1, Measurement.PHASE_DNS)
+            notify_progress(self.measurement.pk, Measurement.PHASE_DNS)
+            notify_progress(self.measurement.pk, Measurement.PHASE_DONE)
+            return result
+
+        with mock.patch.object(ProgressListener, 'take_slot', autospec=True, side_effect=take_slot_and_run):
+            phases = event_phases(progress_events(self.measurement.pk))
+
+        self.assertEqual(phases, ['queued', Measurement.PHASE_DNS, Measurement.PHASE_DONE])
+
+    def test_no_free_slot(self):
+        listener = ProgressListener()
+        self.addCleanup(listener.close)
+        listener.take_slot(1)
+
+        with self.settings(PROGRESS_MAX_STREAMS=1):
+            self.assertEqual(event_phases(progress_events(self.measurement.pk)), ['queued', 'reload'])
@@ -0,0 +1,137 @@
+import json
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from v6score.projection import MAX_DEPTH, MAX_FIELDS_PER_LEVEL, parse_fields
+from v6score.tests.base import create_measurement
+
+DATA = {
+    'success': True,
+    'status': 'ok',
+    'resources': {
+        '1': {'url': 'http://www.example.com/', 'status': 200, 'size': 1000},
+        '2': {'url': 'http://www.example.com/style.css', 'status': 404, 'size': 10},
+    },
+    'console': [
+        {'level': 'error', 'message': 'first'},
+        {'level': 'info', 'message': 'second'},
+    ],
+}
+
+
+class ParseFieldsTests(TestCase):
+    def test_siblings_share_the_prefix(self):
+        self.assertEqual(parse_fields('success,resources.*.url,status'),
+                         {'success': None, 'resources': {'*': {'url': None, 'status': None}}})
+
+    def test_whole_parent_wins(self):
+        self.assertEqual(parse_fields('resources,resources.*.url'), {'resources': None})
+
+    def test_wildcard_with_other_fields(self):
+        with self.assertRaises(ValueError):
+            parse_fields('resources.*.url,resources.1.url')
+
+    def test_empty_component(self):
+        with self.assertRaises(ValueError):
+            parse_fields('resources..url')
+
+    def test_too_deep(self):
+        parse_fields('.'.join('a' * MAX_DEPTH))
+        with self.assertRaises(ValueError):
+            parse_fields('.'.join('a' * (MAX_DEPTH + 1)))
+
+    def test_too_many_fields(self):
+        parse_fields(','.join('k{}'.format(number) for number in range(MAX_FIELDS_PER_LEVEL)))
+        with self.assertRaises(ValueError):
+            parse_fields(','.join('k{}'.format(number) for number in range(MAX_FIELDS_PER_LEVEL + 1)))
+
+        # Spread over levels
+        fields = ','.join('a{0}.b{1}'.format(parent, child) for parent in range(5) for child in range(20))
+        with self.assertRaises(ValueError):
+            parse_fields(fields)
+
+
+class MeasurementDataTests(TestCase):
+    def setUp(self):
+        self.measurement = create_measurement(v4only_data=DATA)
+
+    def get(self, fields=None, **headers):
+        url = reverse('measurement_data', args=(self.measurement.pk, 'v4only'))
+        return self.client.get(url, {'fields': fields} if fields else {}, **headers)
+
+    def test_whole_document(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content.decode('utf-8')), DATA)
+
+    def test_projection_of_object_values(self):
+        response = self.get('success,resources.*.url')
+        self.assertEqual(json.loads(response.content.decode('utf-8')), {
+            'success': True,
+            'resources': {
+                '1': {'url': 'http://www.example.com/'},
+                '2': {'url': 'http://www.example.com/style.css'},
+            },
+        })
+
+    def test_projection_of_array_keeps_order(self):
+        response = self.get('console.*.message')
+        self.assertEqual(json.loads(response.content.decode('utf-8')),
+                         {'console': [{'message': 'first'}, {'message': 'second'}]})
+
+    def test_missing_fields_are_null(self):
+        response = self.get('missing,status.nested')
+        self.assertEqual(json.loads(response.content.decode('utf-8')), {'missing': None, 'status': None})
+
+    def test_invalid_fields(self):
+        response = self.get('resources.*.url,resources.1')
+        self.assertEqual(response.status_code, 400)
+
+    def test_field_limit(self):
+        response = self.get(','.join('k{}'.format(number) for number in range(MAX_FIELDS_PER_LEVEL)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content.decode('utf-8'))), MAX_FIELDS_PER_LEVEL)
+
+        response = self.get(','.join('k{}'.format(number) for number in range(60)))
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_measurement(self):
+        response = self.client.get(reverse('measurement_data', args=(self.measurement.pk + 1, 'v4only')))
+        self.assertEqual(response.status_code, 404)
+
+    def test_running_measurement_is_not_cached(self):
+        response = self.get()
+        self.assertFalse(response.has_header('ETag'))
+        self.assertNotIn('max-age', response.get('Cache-Control', ''))
+
+
+class FinishedMeasurementDataTests(TestCase):
+    def setUp(self):
+        self.measurement = create_measurement(v4only_data=DATA, started='2017-01-01T12:00:00Z',
+                                              finished='2017-01-01T12:01:00Z')
+        self.url = reverse('measurement_data', args=(self.measurement.pk, 'v4only'))
+
+    def test_cached_forever(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_conditional_request(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_projections_have_their_own_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, {'fields': 'success'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_request_for_gzipped_response(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+        # Compressing makes the ETag weak, and weak ETags match for If-None-Match
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
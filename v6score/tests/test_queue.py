@@ -0,0 +1,130 @@
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from v6score.models import Measurement, ScanRun, Worker
+from v6score.tests.base import create_measurement
+
+
+class ClaimTests(TestCase):
+    def setUp(self):
+        self.worker = Worker.objects.create(hostname='worker1', pid=1)
+        self.earlier = timezone.now() - timedelta(minutes=1)
+
+    def test_oldest_first(self):
+        newer = create_measurement('http://one.example.com/')
+        older = create_measurement('http://two.example.com/', requested=self.earlier)
+
+        claimed = Measurement.objects.claim(self.worker)
+        self.assertEqual(claimed, [older])
+        self.assertEqual(claimed[0].worker, self.worker)
+        self.assertIsNotNone(claimed[0].started)
+        self.assertIsNotNone(claimed[0].lease_expires)
+
+        self.assertEqual(Measurement.objects.claim(self.worker), [newer])
+        self.assertEqual(Measurement.objects.claim(self.worker), [])
+
+    def test_batch(self):
+        for number in range(5):
+            create_measurement('http://host{}.example.com/'.format(number))
+
+        self.assertEqual(len(Measurement.objects.claim(self.worker, batch_size=3)), 3)
+        self.assertEqual(len(Measurement.objects.claim(self.worker, batch_size=3)), 2)
+        self.assertEqual(Measurement.objects.filter(worker=self.worker).count(), 5)
+
+    def test_not_yet_requested(self):
+        create_measurement(requested=timezone.now() + timedelta(minutes=5))
+        create_measurement(prescreen_pending=True)
+        self.assertEqual(Measurement.objects.claim(self.worker), [])
+
+    @mock.patch('nat64check.settings.QUEUE_HOST_CONCURRENCY', 2)
+    def test_host_concurrency(self):
+        for number in range(3):
+            create_measurement('http://www.example.com/{}'.format(number))
+        other = create_measurement('http://other.example.com/')
+
+        claimed = Measurement.objects.claim(self.worker, batch_size=4)
+        self.assertEqual(len(claimed), 3)
+        self.assertIn(other, claimed)
+        self.assertEqual(Measurement.objects.claim(self.worker), [])
+
+        # A finished test makes room for the next one
+        Measurement.objects.filter(pk=claimed[0].pk).update(finished=timezone.now())
+        self.assertEqual(len(Measurement.objects.claim(self.worker)), 1)
+
+    @mock.patch('nat64check.settings.QUEUE_HOST_CONCURRENCY', 1)
+    def test_host_is_case_insensitive(self):
+        create_measurement('http://WWW.Example.com/')
+        create_measurement('http://www.example.com/')
+
+        self.assertEqual(len(Measurement.objects.claim(self.worker, batch_size=2)), 1)
+
+    def test_filters(self):
+        bulk = create_measurement('http://bulk.example.com/', requested=self.earlier)
+        manual = create_measurement('http://manual.example.com/', manual=True,
+                                    priority=Measurement.PRIORITY_INTERACTIVE)
+        retry = create_measurement('http://retry.example.com/', retry_for=bulk, priority=Measurement.PRIORITY_RETRY)
+
+        self.assertEqual(Measurement.objects.claim(self.worker, manual_only=True), [manual])
+        self.assertEqual(Measurement.objects.claim(self.worker, retry_only=True), [retry])
+        self.assertEqual(Measurement.objects.claim(self.worker, priority=Measurement.PRIORITY_BULK), [bulk])
+
+    def test_paused_scan_run(self):
+        scan_run = ScanRun.objects.create(name='scan', state=ScanRun.STATE_PAUSED)
+        create_measurement(scan_run=scan_run)
+        self.assertEqual(Measurement.objects.claim(self.worker), [])
+
+        scan_run.resume()
+        self.assertEqual(len(Measurement.objects.claim(self.worker)), 1)
+
+    def test_release(self):
+        create_measurement()
+        claimed = Measurement.objects.claim(self.worker)
+
+        self.assertEqual(Measurement.objects.release(claimed), 1)
+        released = Measurement.objects.get()
+        self.assertIsNone(released.started)
+        self.assertIsNone(released.worker)
+        self.assertIsNone(released.lease_expires)
+
+    def test_release_keeps_finished(self):
+        create_measurement()
+        claimed = Measurement.objects.claim(self.worker)
+        Measurement.objects.filter(pk=claimed[0].pk).update(finished=timezone.now())
+
+        self.assertEqual(Measurement.objects.release(claimed), 0)
+
+
+class ConcurrentClaimTests(TransactionTestCase):
+    def test_skip_locked(self):
+        worker = Worker.objects.create(hostname='worker1', pid=1)
+        locked = create_measurement('http://one.example.com/', requested=timezone.now() - timedelta(minutes=1))
+        free = create_measurement('http://two.example.com/')
+
+        row_locked = threading.Event()
+        done = threading.Event()
+
+        def lock_row():
+            # Another worker in the middle of claiming this row
+            try:
+                with transaction.atomic():
+                    Measurement.objects.select_for_update().get(pk=locked.pk)
+                    row_locked.set()
+                    done.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=lock_row)
+        thread.start()
+        try:
+            self.assertTrue(row_locked.wait(10))
+            self.assertEqual(Measurement.objects.claim(worker, batch_size=2), [free])
+        finally:
+            done.set()
+            thread.join()
+
+        self.assertEqual(Measurement.objects.claim(worker), [locked])
@@ -0,0 +1,51 @@
+import os
+
+from PIL import Image
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase
+
+from v6score.renditions import create_renditions, delete_renditions, get_rendition_url, rendition_name
+from v6score.tests.base import TemporaryMediaMixin, create_finished_measurement, png_bytes
+
+
+class RenditionTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.measurement = create_finished_measurement()
+        self.measurement.v4only_image.save('v4only.png', ContentFile(png_bytes(1000, 800)))
+        self.image = self.measurement.v4only_image
+
+    def test_name(self):
+        self.assertEqual(rendition_name('cas/ab/cd/abcd.png', 'small'), 'renditions/small/cas/ab/cd/abcd.jpg')
+
+    def test_scaled_down(self):
+        with self.settings(SCREENSHOT_RENDITIONS={'small': (320, 320), 'medium': (640, 640)}):
+            create_renditions(self.image)
+
+            for size, bounds in (('small', (320, 256)), ('medium', (640, 512))):
+                with default_storage.open(rendition_name(self.image.name, size)) as f:
+                    rendition = Image.open(f)
+                    self.assertEqual(rendition.format, 'JPEG')
+                    self.assertEqual(rendition.size, bounds)
+
+    def test_created_on_demand(self):
+        name = rendition_name(self.image.name, 'small')
+        self.assertFalse(default_storage.exists(name))
+
+        self.assertEqual(get_rendition_url(self.image, 'small'), default_storage.url(name))
+        self.assertTrue(default_storage.exists(name))
+
+    def test_broken_image_falls_back_to_original(self):
+        self.measurement.v6only_image.save('v6only.png', ContentFile(b'not an image'))
+        with self.assertLogs('v6score.renditions', 'ERROR'):
+            url = get_rendition_url(self.measurement.v6only_image, 'small')
+        self.assertEqual(url, self.measurement.v6only_image.url)
+
+    def test_no_image(self):
+        self.assertEqual(get_rendition_url(self.measurement.nat64_image, 'small'), '')
+
+    def test_deleted(self):
+        create_renditions(self.image)
+        delete_renditions(self.image.name)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, rendition_name(self.image.name, 'small'))))
@@ -0,0 +1,60 @@
+import json
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from v6score.tests.base import create_finished_measurement
+from v6score.views import RESOURCES_PER_PAGE
+
+
+def resources(count, status=200):
+    return {'resources': dict((str(number), {'method': 'GET',
+                                             'url': 'http://www.example.com/{}.png'.format(number),
+                                             'stage': 'end',
+                                             'status': status})
+                              for number in range(count))}
+
+
+class MeasurementResourcesTests(TestCase):
+    def setUp(self):
+        count = RESOURCES_PER_PAGE + 10
+        self.measurement = create_finished_measurement(v4only_data=resources(count),
+                                                       v6only_data=resources(5),
+                                                       nat64_data=resources(count))
+        self.url = reverse('measurement_resources', args=(self.measurement.pk,))
+
+    def get(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_pages(self):
+        data = self.get()
+        self.assertEqual(data['count'], RESOURCES_PER_PAGE + 10)
+        self.assertEqual(data['num_pages'], 2)
+        self.assertEqual(len(data['resources']), RESOURCES_PER_PAGE)
+
+        data = self.get(page=2)
+        self.assertEqual(len(data['resources']), 10)
+
+    def test_invalid_page(self):
+        self.assertEqual(self.get(page='first')['page'], 1)
+        self.assertEqual(self.get(page=99)['page'], 2)
+
+    def test_legs_are_combined(self):
+        resource = self.get()['resources'][0]
+        self.assertEqual(resource['url'], 'http://www.example.com/0.png')
+        for leg_name in ('v4only', 'v6only', 'nat64'):
+            self.assertEqual(resource[leg_name]['status_code'], 'HTTP 200')
+
+    def test_only_differences(self):
+        data = self.get(differs='v6only')
+        self.assertEqual(data['count'], RESOURCES_PER_PAGE + 5)
+        self.assertNotIn('v6only', data['resources'][0])
+
+        self.assertEqual(self.get(differs='nat64')['count'], 0)
+
+    def test_cached_forever(self):
+        response = self.client.get(self.url)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
@@ -0,0 +1,109 @@
+import base64
+import io
+import json
+from datetime import timedelta
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.test import TestCase
+from django.utils import timezone
+
+from nat64check import settings
+from v6score.models import LEG_NAT64, LEG_V4ONLY, LEG_V6ONLY, Measurement
+from v6score.storage import screenshot_storage
+from v6score.tests.base import TemporaryMediaMixin, create_finished_measurement, create_measurement, png_bytes
+
+
+class FakeOutput(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.channel = mock.Mock(**{'recv_exit_status.return_value': 0})
+
+
+def browser_session(host, browser_command, private_key):
+    """
+    What the browser on a proxy host returns: a screenshot and one resource that loaded
+    """
+    output = json.dumps({
+        'image': base64.encodebytes(png_bytes()).decode('ascii'),
+        'resources': {'1': {'stage': 'end', 'error': False}},
+    }).encode('utf-8')
+    return mock.Mock(), mock.Mock(), FakeOutput(output), FakeOutput(b'')
+
+
+@mock.patch('v6score.models.RSAKey')
+@mock.patch('v6score.models.get_addresses', return_value=['192.0.2.1', '2001:db8::1'])
+@mock.patch.object(Measurement, 'run_ping_tests')
+@mock.patch.object(Measurement, 'start_browser', side_effect=browser_session)
+class RetryLegsTests(TemporaryMediaMixin, TestCase):
+    def create_original(self, finished=None):
+        """
+        A finished test where NAT64 didn't produce a screenshot
+        """
+        screenshot = screenshot_storage.save('screenshot.png', ContentFile(png_bytes(color=(0, 100, 200))))
+        return create_finished_measurement(finished=finished or timezone.now(),
+                                           ping4_latencies=[10.0], ping6_latencies=[12.0],
+                                           v4only_image=screenshot, v6only_image=screenshot,
+                                           v4only_data={'resources': {}}, nat64_data={})
+
+    def browser_hosts(self, start_browser):
+        return [call[0][0] for call in start_browser.call_args_list]
+
+    def test_full_test(self, start_browser, run_ping_tests, get_addresses, rsa_key):
+        measurement = create_measurement()
+
+        self.assertEqual(measurement.run_test(), 0)
+        self.assertEqual(self.browser_hosts(start_browser), [settings.V4_HOST, settings.V6_HOST, settings.NAT64_HOST])
+        self.assertTrue(run_ping_tests.called)
+
+        measurement.refresh_from_db()
+        self.assertEqual(measurement.reused_legs, 0)
+        self.assertTrue(measurement.v4only_image)
+        self.assertAlmostEqual(measurement.nat64_image_score, 1.0)
+        self.assertEqual(measurement.nat64_resource_score, 1.0)
+
+    def test_retry_failed_leg(self, start_browser, run_ping_tests, get_addresses, rsa_key):
+        original = self.create_original()
+        retry = create_measurement(retry_for=original, retry_legs=LEG_NAT64, priority=Measurement.PRIORITY_RETRY)
+
+        self.assertEqual(retry.run_test(), 0)
+        self.assertEqual(self.browser_hosts(start_browser), [settings.NAT64_HOST])
+        self.assertFalse(run_ping_tests.called)
+
+        retry.refresh_from_db()
+        self.assertEqual(retry.reused_legs, LEG_V4ONLY | LEG_V6ONLY)
+        self.assertEqual(retry.v4only_image.name, original.v4only_image.name)
+        self.assertEqual(retry.v6only_image.name, original.v6only_image.name)
+        self.assertTrue(retry.nat64_image)
+        self.assertEqual(retry.ping6_latencies, [12.0])
+
+        # Scored against the reused IPv4-only screenshot, which looks different
+        self.assertLess(retry.nat64_image_score, 1.0)
+        self.assertFalse(retry.images_optimized)
+
+    def test_stale_legs(self, start_browser, run_ping_tests, get_addresses, rsa_key):
+        max_age = timedelta(seconds=settings.RETRY_REUSE_MAX_AGE)
+        original = self.create_original(finished=timezone.now() - max_age - timedelta(minutes=1))
+        retry = create_measurement(retry_for=original, retry_legs=LEG_NAT64, priority=Measurement.PRIORITY_RETRY)
+
+        self.assertIsNone(retry.get_reusable_measurement())
+        retry.run_test()
+        self.assertEqual(len(start_browser.call_args_list), 3)
+        self.assertTrue(run_ping_tests.called)
+        self.assertEqual(retry.reused_legs, 0)
+
+    def test_reused_leg_without_screenshot(self, start_browser, run_ping_tests, get_addresses, rsa_key):
+        original = self.create_original()
+        retry = create_measurement(retry_for=original, retry_legs=LEG_V6ONLY, priority=Measurement.PRIORITY_RETRY)
+
+        # NAT64 failed as well, it can't be copied
+        self.assertIsNone(retry.get_reusable_measurement())
+
+    def test_leg_rendered_follows_retries(self, start_browser, run_ping_tests, get_addresses, rsa_key):
+        first_finished = timezone.now() - timedelta(hours=2)
+        original = self.create_original(finished=first_finished)
+        retry = create_finished_measurement(retry_for=original, retry_legs=LEG_NAT64,
+                                            reused_legs=LEG_V4ONLY | LEG_V6ONLY)
+
+        self.assertEqual(retry.leg_rendered(LEG_V4ONLY), first_finished)
+        self.assertEqual(retry.leg_rendered(LEG_NAT64), retry.finished)
@@ -0,0 +1,148 @@
+import io
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils import timezone
+
+from v6score.management.commands import import_tests
+from v6score.models import Measurement, ScanRun, Worker
+from v6score.tests.base import create_finished_measurement, create_measurement
+
+
+class ScanRunTests(TestCase):
+    def setUp(self):
+        self.scan_run = ScanRun.objects.create(name='Top sites', import_complete=True)
+        self.started = timezone.now() - timedelta(minutes=30)
+
+        self.finished = [create_finished_measurement('http://finished{}.example.com/'.format(number),
+                                                     started=self.started, scan_run=self.scan_run)
+                         for number in range(3)]
+        self.running = create_measurement('http://running.example.com/', started=timezone.now(),
+                                          scan_run=self.scan_run)
+        self.pending = [create_measurement('http://pending{}.example.com/'.format(number), scan_run=self.scan_run)
+                        for number in range(5)]
+
+    def test_progress(self):
+        self.assertEqual(self.scan_run.progress(), {'total': 9, 'finished': 3, 'running': 1, 'pending': 5})
+        self.assertFalse(self.scan_run.completed)
+
+    def test_eta(self):
+        # Three tests in the half hour since the first one started
+        self.assertAlmostEqual(self.scan_run.tests_per_hour(), 6, places=1)
+        self.assertAlmostEqual((self.scan_run.eta() - timezone.now()).total_seconds(), 3600, delta=5)
+
+        self.scan_run.pause()
+        self.assertIsNone(self.scan_run.eta())
+
+    def test_pause_and_resume(self):
+        worker = Worker.objects.create(hostname='worker1', pid=1)
+
+        self.scan_run.pause()
+        self.assertEqual(self.scan_run.state, ScanRun.STATE_PAUSED)
+        self.assertEqual(Measurement.objects.claim(worker), [])
+        self.assertFalse(Measurement.objects.queued().exists())
+
+        self.scan_run.resume()
+        self.assertEqual(self.scan_run.state, ScanRun.STATE_RUNNING)
+        self.assertEqual(Measurement.objects.queued().count(), 5)
+        self.assertEqual(len(Measurement.objects.claim(worker)), 1)
+
+    @mock.patch.object(ScanRun, 'CANCEL_BATCH_SIZE', 2)
+    def test_cancel(self):
+        self.assertEqual(self.scan_run.cancel(), 5)
+        self.assertEqual(ScanRun.objects.get().state, ScanRun.STATE_CANCELLED)
+
+        # Results and running tests stay
+        self.assertEqual(set(self.scan_run.measurements.all()), set(self.finished + [self.running]))
+
+        # There is no way back
+        self.scan_run.resume()
+        self.assertEqual(self.scan_run.state, ScanRun.STATE_CANCELLED)
+
+    def test_cancel_leaves_other_tests_alone(self):
+        other = create_measurement('http://other.example.com/')
+        self.scan_run.cancel()
+        self.assertTrue(Measurement.objects.filter(pk=other.pk).exists())
+
+    def test_completed(self):
+        Measurement.objects.filter(finished=None).update(started=self.started, finished=timezone.now())
+        self.assertTrue(self.scan_run.completed)
+
+        self.scan_run.import_complete = False
+        self.assertFalse(self.scan_run.completed)
+
+    def test_command(self):
+        output = io.StringIO()
+        call_command('scan_run', 'status', self.scan_run.pk, verbosity=0, stdout=output)
+        self.assertIn('3 of 9 tests finished (33.3%), 1 running, 5 pending', output.getvalue())
+
+        call_command('scan_run', 'pause', self.scan_run.pk, verbosity=0)
+        self.assertEqual(ScanRun.objects.get().state, ScanRun.STATE_PAUSED)
+
+        with self.assertRaises(CommandError):
+            call_command('scan_run', 'cancel', self.scan_run.pk + 1, verbosity=0)
+
+
+class ResumableImportTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        self.filename = os.path.join(directory, 'sites.txt')
+        with open(self.filename, 'w') as f:
+            f.write(''.join('site{}.example.com\n'.format(number) for number in range(10)))
+
+    def test_scan_run(self):
+        call_command('import_tests', self.filename, verbosity=0, scan_run='Top sites', chunk_size=3)
+
+        scan_run = ScanRun.objects.get()
+        self.assertEqual(scan_run.name, 'Top sites')
+        self.assertEqual(scan_run.source, self.filename)
+        self.assertEqual(scan_run.rows_imported, 10)
+        self.assertTrue(scan_run.import_complete)
+        self.assertEqual(scan_run.measurements.count(), 10)
+
+    def test_resume(self):
+        # Interrupted after the first chunk
+        scan_run = ScanRun.objects.create(name='Top sites', source=self.filename, rows_imported=4)
+        call_command('import_tests', self.filename, verbosity=0, resume=scan_run.pk)
+
+        self.assertEqual(sorted(scan_run.measurements.values_list('url', flat=True)),
+                         ['http://site{}.example.com'.format(number) for number in range(4, 10)])
+        scan_run.refresh_from_db()
+        self.assertTrue(scan_run.import_complete)
+
+        with self.assertRaises(CommandError):
+            call_command('import_tests', self.filename, verbosity=0, resume=scan_run.pk)
+
+    def test_resume_cancelled(self):
+        scan_run = ScanRun.objects.create(name='Top sites', state=ScanRun.STATE_CANCELLED)
+        with self.assertRaises(CommandError):
+            call_command('import_tests', self.filename, verbosity=0, resume=scan_run.pk)
+
+    def test_cancelled_while_importing(self):
+        import_chunk = import_tests.Command.import_chunk
+
+        def import_and_cancel(command, urls):
+            import_chunk(command, urls)
+            ScanRun.objects.filter(pk=command.scan_run.pk).update(state=ScanRun.STATE_CANCELLED)
+
+        with mock.patch.object(import_tests.Command, 'import_chunk', import_and_cancel):
+            with self.assertRaises(CommandError):
+                call_command('import_tests', self.filename, verbosity=0, scan_run='Top sites', chunk_size=3)
+
+        # Only the first chunk made it in
+        scan_run = ScanRun.objects.get()
+        self.assertEqual(scan_run.measurements.count(), 3)
+        self.assertEqual(scan_run.rows_imported, 3)
+        self.assertFalse(scan_run.import_complete)
+
+    def test_resume_or_new(self):
+        with self.assertRaises(CommandError):
+            call_command('import_tests', self.filename, verbosity=0, resume=1, scan_run='Top sites')
@@ -0,0 +1,82 @@
+from collections import Counter
+from unittest import mock
+
+from django.test import TestCase
+
+from v6score.models import Measurement, Worker
+from v6score.scheduling import FairShareScheduler
+from v6score.tests.base import create_measurement
+
+
+def queue_tests(priority, count):
+    for number in range(count):
+        create_measurement('http://{}-{}.example.com/'.format(priority, number), priority=priority)
+
+
+class FairShareSchedulerTests(TestCase):
+    def setUp(self):
+        self.worker = Worker.objects.create(hostname='worker1', pid=1)
+
+    def claim_priorities(self, scheduler, count):
+        priorities = []
+        for _ in range(count):
+            measurements = scheduler.claim(self.worker)
+            priorities.extend(measurement.priority for measurement in measurements)
+        return priorities
+
+    def test_unknown_class(self):
+        with self.assertRaises(ValueError):
+            FairShareScheduler({'urgent': 1})
+
+    def test_shares(self):
+        queue_tests(Measurement.PRIORITY_INTERACTIVE, 10)
+        queue_tests(Measurement.PRIORITY_BULK, 10)
+        scheduler = FairShareScheduler({'interactive': 3, 'bulk': 1})
+
+        shares = Counter(self.claim_priorities(scheduler, 8))
+        self.assertEqual(shares[Measurement.PRIORITY_INTERACTIVE], 6)
+        self.assertEqual(shares[Measurement.PRIORITY_BULK], 2)
+
+    def test_batches_count_every_test(self):
+        queue_tests(Measurement.PRIORITY_INTERACTIVE, 10)
+        queue_tests(Measurement.PRIORITY_BULK, 10)
+        scheduler = FairShareScheduler({'interactive': 1, 'bulk': 1})
+
+        first = scheduler.claim(self.worker, batch_size=3)
+        self.assertEqual([measurement.priority for measurement in first], [Measurement.PRIORITY_INTERACTIVE] * 3)
+
+        # Bulk gets its three before interactive goes again
+        shares = Counter(self.claim_priorities(scheduler, 3))
+        self.assertEqual(shares[Measurement.PRIORITY_BULK], 3)
+
+    def test_class_without_weight(self):
+        queue_tests(Measurement.PRIORITY_RETRY, 1)
+        scheduler = FairShareScheduler({'interactive': 1, 'retry': 0})
+
+        self.assertEqual(scheduler.claim(self.worker), [])
+
+    def test_idle_class_gets_no_credit(self):
+        queue_tests(Measurement.PRIORITY_BULK, 20)
+        scheduler = FairShareScheduler({'interactive': 1, 'bulk': 1})
+        self.assertEqual(self.claim_priorities(scheduler, 10), [Measurement.PRIORITY_BULK] * 10)
+
+        # After being idle interactive joins where bulk was, and shares equally instead of making up for lost time
+        queue_tests(Measurement.PRIORITY_INTERACTIVE, 10)
+        with mock.patch('v6score.scheduling.EMPTY_RECHECK_TIME', 0):
+            shares = Counter(self.claim_priorities(scheduler, 7))
+        self.assertEqual(shares[Measurement.PRIORITY_INTERACTIVE], 4)
+        self.assertEqual(shares[Measurement.PRIORITY_BULK], 3)
+
+    def test_empty_class_tried_last(self):
+        queue_tests(Measurement.PRIORITY_BULK, 5)
+        scheduler = FairShareScheduler({'interactive': 1, 'bulk': 1})
+
+        with mock.patch.object(Measurement.objects, 'claim', wraps=Measurement.objects.claim) as claim:
+            scheduler.claim(self.worker)
+            self.assertEqual([call[1]['priority'] for call in claim.call_args_list],
+                             [Measurement.PRIORITY_INTERACTIVE, Measurement.PRIORITY_BULK])
+
+            # Interactive was just found empty, bulk is asked first now
+            claim.reset_mock()
+            scheduler.claim(self.worker)
+            self.assertEqual([call[1]['priority'] for call in claim.call_args_list], [Measurement.PRIORITY_BULK])
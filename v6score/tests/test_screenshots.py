@@ -0,0 +1,113 @@
+import io
+from datetime import timedelta
+from unittest import mock
+
+from PIL import Image
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from v6score.caching import CACHE_FOREVER
+from v6score.models import Measurement, ScreenshotAlias, replace_image
+from v6score.renditions import create_renditions, delete_renditions, get_rendition_url, rendition_name
+from v6score.screenshots import reencode_image
+from v6score.storage import screenshot_storage
+from v6score.tests.base import TemporaryMediaMixin, create_finished_measurement, png_bytes
+
+
+def pixels(data):
+    return Image.open(io.BytesIO(data)).convert('RGBA').tobytes()
+
+
+class ReencodeImageTests(TestCase):
+    def test_smaller_and_lossless(self):
+        data = png_bytes(compress_level=0)
+        encoded, extension = reencode_image(data)
+
+        self.assertEqual(extension, '.png')
+        self.assertLess(len(encoded), len(data))
+        self.assertEqual(pixels(encoded), pixels(data))
+
+    def test_already_small(self):
+        self.assertIsNone(reencode_image(png_bytes()))
+
+    def test_webp(self):
+        image = Image.new('RGBA', (200, 150), (200, 100, 50, 255))
+        output = io.BytesIO()
+        image.save(output, format='PNG', compress_level=0)
+
+        with self.settings(SCREENSHOT_FORMAT='webp'):
+            encoded, extension = reencode_image(output.getvalue())
+
+        self.assertEqual(extension, '.webp')
+        self.assertEqual(pixels(encoded), pixels(output.getvalue()))
+
+    def test_webp_only_for_rgba(self):
+        with self.settings(SCREENSHOT_FORMAT='webp'):
+            encoded, extension = reencode_image(png_bytes(compress_level=0))
+        self.assertEqual(extension, '.png')
+
+
+@mock.patch('v6score.storage.GRACE_PERIOD', timedelta(0))
+class OptimizeImagesTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.measurement = create_finished_measurement()
+        self.measurement.v4only_image.save('v4only.png', ContentFile(png_bytes(compress_level=0)))
+        self.measurement.v6only_image = self.measurement.v4only_image.name
+        self.measurement.save()
+        create_renditions(self.measurement.v4only_image)
+        self.old_name = self.measurement.v4only_image.name
+
+    def test_replaced_everywhere(self):
+        self.assertGreater(self.measurement.optimize_images(), 0)
+
+        measurement = Measurement.objects.get(pk=self.measurement.pk)
+        self.assertTrue(measurement.images_optimized)
+        self.assertNotEqual(measurement.v4only_image.name, self.old_name)
+        self.assertEqual(measurement.v6only_image.name, measurement.v4only_image.name)
+        self.assertFalse(screenshot_storage.exists(self.old_name))
+
+        # The renditions have the same pixels, they are reused
+        self.assertTrue(default_storage.exists(rendition_name(measurement.v4only_image.name, 'small')))
+
+    def test_old_urls_redirect(self):
+        old_url = self.measurement.v4only_image.url
+        old_rendition_url = get_rendition_url(self.measurement.v4only_image, 'small')
+        self.measurement.optimize_images()
+        delete_renditions(self.old_name)
+
+        measurement = Measurement.objects.get(pk=self.measurement.pk)
+        response = self.client.get(old_url)
+        self.assertEqual(response.status_code, 301)
+        self.assertTrue(response['Location'].endswith(measurement.v4only_image.url))
+
+        response = self.client.get(old_rendition_url)
+        self.assertEqual(response.status_code, 301)
+        self.assertTrue(response['Location'].endswith(get_rendition_url(measurement.v4only_image, 'small')))
+
+    def test_replaced_again(self):
+        self.measurement.optimize_images()
+        first_name = Measurement.objects.get(pk=self.measurement.pk).v4only_image.name
+
+        second_name = screenshot_storage.save('screenshot.png', ContentFile(png_bytes(color=(0, 0, 0))))
+        replace_image(first_name, second_name)
+
+        # The oldest name leads straight to the current screenshot
+        self.assertEqual(ScreenshotAlias.objects.get(name=self.old_name).new_name, second_name)
+        self.assertEqual(ScreenshotAlias.objects.get(name=first_name).new_name, second_name)
+        self.assertEqual(Measurement.objects.get(pk=self.measurement.pk).v4only_image.name, second_name)
+
+    def test_optimize_screenshots_command(self):
+        call_command('optimize_screenshots', verbosity=0)
+        self.assertTrue(Measurement.objects.get(pk=self.measurement.pk).images_optimized)
+        self.assertTrue(ScreenshotAlias.objects.filter(name=self.old_name).exists())
+
+    def test_expired_aliases_are_removed(self):
+        self.measurement.optimize_images()
+        ScreenshotAlias.objects.update(created=timezone.now() - timedelta(seconds=CACHE_FOREVER + 60))
+
+        call_command('collect_screenshots', verbosity=0)
+        self.assertFalse(ScreenshotAlias.objects.exists())
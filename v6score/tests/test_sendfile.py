@@ -0,0 +1,70 @@
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from v6score.storage import ContentAddressedStorage
+from v6score.tests.base import TemporaryMediaMixin, png_bytes
+
+
+# noinspection PyUnusedLocal
+def only_renditions(request, name):
+    return name.startswith('renditions/')
+
+
+class ServeMediaTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.data = b'rendition'
+        self.name = default_storage.save('renditions/small/cas/ab/cd/abcd.jpg', ContentFile(self.data))
+        self.url = default_storage.url(self.name)
+
+    def test_served_by_django(self):
+        response = self.client.get(self.url)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_x_sendfile(self):
+        with self.settings(MEDIA_SENDFILE='x-sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.media_root, self.name))
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response.content, b'')
+
+    def test_x_accel_redirect(self):
+        with self.settings(MEDIA_SENDFILE='x-accel-redirect', MEDIA_ACCEL_REDIRECT_URL='/protected/'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/' + self.name)
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_hidden_and_missing_files(self):
+        default_storage.save('renditions/small/.tmp-abcd', ContentFile(self.data))
+        self.assertEqual(self.client.get('/media/renditions/small/.tmp-abcd').status_code, 404)
+        self.assertEqual(self.client.get('/media/renditions/small/missing.jpg').status_code, 404)
+
+    def test_outside_media_root(self):
+        self.assertEqual(self.client.get('/media/../settings.py').status_code, 404)
+
+    def test_access_check(self):
+        screenshot = ContentAddressedStorage(location=self.media_root).save('screenshot.png', ContentFile(png_bytes()))
+
+        with self.settings(MEDIA_ACCESS_CHECK='v6score.tests.test_sendfile.only_renditions'):
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('private', response['Cache-Control'])
+
+            response = self.client.get(reverse('screenshot', args=(screenshot,)))
+            self.assertEqual(response.status_code, 403)
+
+
+class SendScreenshotTests(TemporaryMediaMixin, TestCase):
+    def test_loose_screenshot(self):
+        name = ContentAddressedStorage(location=self.media_root).save('screenshot.png', ContentFile(png_bytes()))
+
+        with self.settings(MEDIA_SENDFILE='x-sendfile'):
+            response = self.client.get(reverse('screenshot', args=(name,)))
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.media_root, name))
+        self.assertEqual(response['ETag'], '"{}"'.format(os.path.basename(name)))
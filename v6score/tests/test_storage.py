@@ -0,0 +1,270 @@
+import hashlib
+import importlib
+import os
+from datetime import timedelta
+from unittest import mock
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.test import TestCase
+
+from v6score.models import Measurement, PackedBlob, delete_image_if_unreferenced
+from v6score.renditions import create_renditions, rendition_name
+from v6score.storage import ContentAddressedStorage, PackfileStorage, screenshot_storage
+from v6score.tests.base import TemporaryMediaMixin, create_finished_measurement, png_bytes
+
+dedupe_migration = importlib.import_module('v6score.migrations.0021_dedupe_screenshots')
+
+
+def expected_name(data, extension='.png'):
+    digest = hashlib.sha256(data).hexdigest()
+    return 'cas/{}/{}/{}{}'.format(digest[:2], digest[2:4], digest, extension)
+
+
+class ContentAddressedStorageTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = ContentAddressedStorage(location=self.media_root)
+
+    def test_named_after_content(self):
+        data = png_bytes()
+        self.assertEqual(self.storage.save('screenshot.PNG', ContentFile(data)), expected_name(data))
+
+    def test_same_content_stored_once(self):
+        data = png_bytes()
+        first = self.storage.save('v4only.png', ContentFile(data))
+        second = self.storage.save('v6only.png', ContentFile(data))
+        self.assertEqual(first, second)
+        self.assertEqual(list(self.storage.list_stored()), [first])
+
+    def test_recently_stored_is_not_collectable(self):
+        name = self.storage.save('screenshot.png', ContentFile(png_bytes()))
+        self.assertFalse(self.storage.is_collectable(name))
+
+        old = os.path.getmtime(self.storage.path(name)) - timedelta(hours=2).total_seconds()
+        os.utime(self.storage.path(name), (old, old))
+        self.assertTrue(self.storage.is_collectable(name))
+
+        # Storing it again makes it recent
+        self.storage.save('screenshot.png', ContentFile(png_bytes()))
+        self.assertFalse(self.storage.is_collectable(name))
+
+
+@mock.patch('v6score.storage.GRACE_PERIOD', timedelta(0))
+class SharedScreenshotTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.first = create_finished_measurement()
+        self.second = create_finished_measurement()
+        for measurement in (self.first, self.second):
+            measurement.v4only_image.save('v4only.png', ContentFile(png_bytes()))
+
+    def test_measurements_share_the_file(self):
+        self.assertEqual(self.first.v4only_image.name, self.second.v4only_image.name)
+
+    def test_only_deleted_when_unreferenced(self):
+        name = self.first.v4only_image.name
+        self.first.delete()
+        self.assertFalse(delete_image_if_unreferenced(name))
+        self.assertTrue(screenshot_storage.exists(name))
+
+        self.second.delete()
+        self.assertTrue(delete_image_if_unreferenced(name))
+        self.assertFalse(screenshot_storage.exists(name))
+
+    def test_collect_screenshots(self):
+        unused = screenshot_storage.save('unused.png', ContentFile(png_bytes(color=(0, 0, 0))))
+        create_renditions(Measurement.objects.get(pk=self.first.pk).v4only_image)
+
+        call_command('collect_screenshots', verbosity=0, dry_run=True)
+        self.assertTrue(screenshot_storage.exists(unused))
+
+        call_command('collect_screenshots', verbosity=0)
+        self.assertFalse(screenshot_storage.exists(unused))
+        self.assertTrue(screenshot_storage.exists(self.first.v4only_image.name))
+        self.assertTrue(os.path.exists(os.path.join(self.media_root,
+                                                    rendition_name(self.first.v4only_image.name, 'small'))))
+
+
+class DedupeMigrationTests(TemporaryMediaMixin, TestCase):
+    def write_old_file(self, name, data):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def create_old_measurement(self, name, data):
+        self.write_old_file(name, data)
+        measurement = create_finished_measurement()
+        Measurement.objects.filter(pk=measurement.pk).update(v4only_image=name)
+        return measurement
+
+    def test_moves_and_dedupes(self):
+        data = png_bytes()
+        first = self.create_old_measurement('capture/www.example.com/2017-01-01/12-00/v4only.png', data)
+        second = self.create_old_measurement('capture/www.example.com/2017-01-02/12-00/v4only.png', data)
+        self.write_old_file('renditions/small/capture/www.example.com/2017-01-01/12-00/v4only.jpg', b'jpeg')
+
+        dedupe_migration.dedupe_screenshots(apps, None)
+
+        for measurement in (first, second):
+            measurement.refresh_from_db()
+            self.assertEqual(measurement.v4only_image.name, expected_name(data))
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, expected_name(data))))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'capture')))
+        self.assertFalse(os.path.exists(os.path.join(
+            self.media_root, 'renditions/small/capture/www.example.com/2017-01-01/12-00/v4only.jpg')))
+
+    def test_can_run_again(self):
+        data = png_bytes()
+        measurement = self.create_old_measurement('capture/www.example.com/2017-01-01/12-00/v4only.png', data)
+        dedupe_migration.dedupe_screenshots(apps, None)
+
+        # Left behind by an interrupted run
+        self.write_old_file('capture/www.example.com/2017-01-01/12-00/v6only.png', data)
+        dedupe_migration.dedupe_screenshots(apps, None)
+
+        measurement.refresh_from_db()
+        self.assertEqual(measurement.v4only_image.name, expected_name(data))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'capture')))
+
+    def test_missing_file_keeps_its_name(self):
+        name = 'capture/www.example.com/2017-01-01/12-00/v4only.png'
+        measurement = self.create_old_measurement(name, png_bytes())
+        os.remove(os.path.join(self.media_root, name))
+
+        with self.assertLogs('v6score.migrations.0021_dedupe_screenshots', 'WARNING'):
+            dedupe_migration.dedupe_screenshots(apps, None)
+
+        measurement.refresh_from_db()
+        self.assertEqual(measurement.v4only_image.name, name)
+
+
+class PackfileStorageTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = PackfileStorage(location=self.media_root, pack_location=self.media_root + '/packs',
+                                       segment_size=1000)
+
+    def test_read_back(self):
+        data = png_bytes()
+        name = self.storage.save('screenshot.png', ContentFile(data))
+
+        self.assertTrue(self.storage.is_packed(name))
+        self.assertEqual(self.storage.size(name), len(data))
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), data)
+
+            # Can be read again, like a file on disk
+            f.seek(0)
+            self.assertEqual(f.read(10), data[:10])
+
+    def test_same_content_appended_once(self):
+        self.storage.save('v4only.png', ContentFile(png_bytes()))
+        size = os.path.getsize(self.storage.segment_path(1))
+        self.storage.save('v6only.png', ContentFile(png_bytes()))
+        self.assertEqual(os.path.getsize(self.storage.segment_path(1)), size)
+
+    def test_new_segment_when_full(self):
+        names = [self.storage.save('screenshot.png', ContentFile(png_bytes(color=(0, 0, shade))))
+                 for shade in range(0, 250, 10)]
+        self.assertGreater(len(self.storage.list_segments()), 1)
+
+        for name in names:
+            with self.storage.open(name) as f:
+                self.assertEqual(expected_name(f.read()), name)
+
+    def test_deleted(self):
+        name = self.storage.save('screenshot.png', ContentFile(png_bytes()))
+        self.storage.delete(name)
+
+        self.assertFalse(self.storage.exists(name))
+        with self.assertRaises(FileNotFoundError):
+            self.storage.open(name)
+
+    def test_conflict_keeps_the_transaction_usable(self):
+        data = png_bytes()
+        with transaction.atomic():
+            self.storage.store_blob(expected_name(data), ContentFile(data))
+            self.storage.store_blob(expected_name(data), ContentFile(data))
+            self.assertEqual(PackedBlob.objects.filter(name=expected_name(data)).count(), 1)
+
+    def test_loose_files_are_still_read(self):
+        data = png_bytes()
+        name = ContentAddressedStorage(location=self.media_root).save('screenshot.png', ContentFile(data))
+
+        self.assertFalse(self.storage.is_packed(name))
+        self.assertTrue(self.storage.exists(name))
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(list(self.storage.list_loose()), [name])
+
+    def test_urls(self):
+        name = self.storage.save('screenshot.png', ContentFile(png_bytes()))
+        self.assertEqual(self.storage.url(name), reverse('screenshot', args=(name,)))
+        self.assertEqual(self.storage.url('capture/www.example.com/v4only.png'),
+                         '/media/capture/www.example.com/v4only.png')
+
+
+class CompactScreenshotsTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.settings_override = self.settings(SCREENSHOT_PACK_SEGMENT_SIZE=5000)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_packs_loose_files(self):
+        data = png_bytes()
+        name = ContentAddressedStorage(location=self.media_root).save('screenshot.png', ContentFile(data))
+
+        call_command('compact_screenshots', verbosity=0)
+
+        self.assertTrue(screenshot_storage.is_packed(name))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, name)))
+        with screenshot_storage.open(name) as f:
+            self.assertEqual(f.read(), data)
+
+    def test_reclaims_deleted_space(self):
+        names = [screenshot_storage.save('screenshot.png', ContentFile(png_bytes(color=(0, 0, shade))))
+                 for shade in range(0, 250, 10)]
+        first_segment = PackedBlob.objects.get(name=names[0]).segment
+        self.assertLess(first_segment, screenshot_storage.current_segment())
+
+        # Most of the first segment becomes garbage
+        kept = PackedBlob.objects.filter(segment=first_segment).order_by('offset').first().name
+        for name in names:
+            if name != kept and PackedBlob.objects.filter(name=name, segment=first_segment).exists():
+                screenshot_storage.delete(name)
+
+        call_command('compact_screenshots', verbosity=0)
+
+        self.assertNotIn(first_segment, screenshot_storage.list_segments())
+        self.assertNotEqual(PackedBlob.objects.get(name=kept).segment, first_segment)
+        with screenshot_storage.open(kept) as f:
+            self.assertEqual(expected_name(f.read()), kept)
+
+
+class ShowScreenshotTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.data = png_bytes()
+        self.name = screenshot_storage.save('screenshot.png', ContentFile(self.data))
+
+    def test_served_from_pack(self):
+        response = self.client.get(reverse('screenshot', args=(self.name,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_conditional_request(self):
+        etag = self.client.get(reverse('screenshot', args=(self.name,)))['ETag']
+        response = self.client.get(reverse('screenshot', args=(self.name,)), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_unknown_screenshot(self):
+        response = self.client.get(reverse('screenshot', args=(expected_name(b'unknown'),)))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,87 @@
+import io
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.admin.sites import site
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils import timezone
+
+from v6score.models import Measurement
+from v6score.tests.base import create_finished_measurement, create_measurement
+
+
+class TimedTests(TestCase):
+    def test_timed(self):
+        measurement = Measurement()
+        with mock.patch('time.monotonic', side_effect=[10.0, 10.25, 20.0, 20.0004]):
+            with measurement.timed('dns'):
+                pass
+            with measurement.timed('dns'):
+                pass
+
+        # Added up, to the millisecond
+        self.assertEqual(measurement.timings, {'dns': 0.25})
+
+    def test_exception(self):
+        measurement = Measurement()
+        with self.assertRaises(OSError), measurement.timed('ping'):
+            raise OSError()
+
+        self.assertIn('ping', measurement.timings)
+
+    @mock.patch('v6score.models.get_addresses', return_value=[])
+    def test_saved_with_test(self, get_addresses):
+        measurement = create_measurement()
+        with self.assertLogs('v6score.models', 'ERROR'):
+            measurement.run_test()
+
+        timings = Measurement.objects.get().timings
+        self.assertEqual(set(timings), {'dns', 'db_save'})
+
+
+class AdminTimingsTests(TestCase):
+    def setUp(self):
+        self.admin = site._registry[Measurement]
+
+    def test_total(self):
+        measurement = Measurement(timings={'dns': 0.5, 'render_v4only': 4.0, 'render_nat64': 6.0, 'ssim': 1.0,
+                                           'extra': 0.25})
+        html = self.admin.admin_timings(measurement)
+
+        # The renders overlap, only the slowest counts
+        self.assertIn('<th>total</th><td style=\'text-align: right\'>7.750s</td>', html)
+
+        # Phases in the order they happen
+        positions = [html.index('<th>{}</th>'.format(phase)) for phase in ('dns', 'render_v4only', 'render_nat64',
+                                                                            'ssim', 'extra', 'total')]
+        self.assertEqual(positions, sorted(positions))
+
+    def test_no_timings(self):
+        self.assertEqual(self.admin.admin_timings(Measurement()), '-')
+
+
+class TimingReportTests(TestCase):
+    def report(self, **options):
+        output = io.StringIO()
+        call_command('timing_report', stdout=output, **options)
+        return output.getvalue()
+
+    def test_report(self):
+        for seconds in (1.0, 2.0, 3.0, 4.0, 5.0):
+            create_finished_measurement(timings={'dns': seconds, 'custom': 1.0})
+        create_finished_measurement(timings={'dns': 100.0}, finished=timezone.now() - timedelta(days=10))
+
+        lines = self.report(percentiles='0,50,100').splitlines()
+        self.assertEqual(lines[0].split(), ['phase', 'tests', 'p0', 'p50', 'p100'])
+        self.assertEqual(lines[1].split(), ['dns', '5', '1.000s', '3.000s', '5.000s'])
+        self.assertEqual(lines[2].split()[:2], ['custom', '5'])
+
+    def test_nothing_to_report(self):
+        self.assertIn('No timings', self.report())
+
+    def test_invalid_percentiles(self):
+        for percentiles in ('fifty', '50,101'):
+            with self.assertRaises(CommandError):
+                self.report(percentiles=percentiles)
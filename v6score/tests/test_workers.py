@@ -0,0 +1,116 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils import timezone
+
+from v6score.models import Measurement, Worker
+from v6score.tests.base import create_measurement
+
+
+class LeaseTests(TestCase):
+    def setUp(self):
+        self.worker = Worker.objects.create(hostname='worker1', pid=1)
+        create_measurement()
+        self.measurement = Measurement.objects.claim(self.worker)[0]
+
+    def expire_lease(self):
+        Measurement.objects.filter(pk=self.measurement.pk).update(lease_expires=timezone.now() - timedelta(seconds=1))
+
+    def test_heartbeat_renews_lease(self):
+        self.expire_lease()
+        self.worker.heartbeat()
+
+        self.measurement.refresh_from_db()
+        self.assertGreater(self.measurement.lease_expires, timezone.now())
+        self.assertEqual(Measurement.objects.requeue_expired(), 0)
+
+    @mock.patch('v6score.models.get_addresses', return_value=['192.0.2.1'])
+    def test_renewed_lease_survives_saving_results(self, get_addresses):
+        # The lease this measurement was claimed with has run out by the time it is saved, but the worker renewed it
+        self.measurement.lease_expires = timezone.now() - timedelta(seconds=1)
+        self.worker.heartbeat()
+        renewed = Measurement.objects.get(pk=self.measurement.pk).lease_expires
+
+        self.measurement.run_dns_tests()
+
+        saved = Measurement.objects.get(pk=self.measurement.pk)
+        self.assertEqual(saved.dns_results, ['192.0.2.1'])
+        self.assertEqual(saved.lease_expires, renewed)
+        self.assertEqual(saved.worker, self.worker)
+        self.assertEqual(Measurement.objects.requeue_expired(), 0)
+
+    def test_heartbeat_leaves_finished_tests_alone(self):
+        Measurement.objects.filter(pk=self.measurement.pk).update(finished=timezone.now(), lease_expires=None)
+        self.worker.heartbeat()
+
+        self.measurement.refresh_from_db()
+        self.assertIsNone(self.measurement.lease_expires)
+
+    def test_requeue_expired(self):
+        self.assertEqual(Measurement.objects.requeue_expired(), 0)
+
+        self.expire_lease()
+        with self.assertLogs('v6score.models', 'WARNING'):
+            self.assertEqual(Measurement.objects.requeue_expired(), 1)
+
+        self.measurement.refresh_from_db()
+        self.assertIsNone(self.measurement.started)
+        self.assertIsNone(self.measurement.worker)
+
+        # Someone else can run it now
+        other = Worker.objects.create(hostname='worker2', pid=2)
+        self.assertEqual(Measurement.objects.claim(other), [self.measurement])
+
+
+class WorkerTests(TestCase):
+    def setUp(self):
+        self.worker = Worker.objects.create(hostname='worker1', pid=1)
+
+    def test_alive(self):
+        self.assertTrue(self.worker.alive)
+
+        Worker.objects.filter(pk=self.worker.pk).update(last_heartbeat=timezone.now() - timedelta(hours=1))
+        self.worker.refresh_from_db()
+        self.assertFalse(self.worker.alive)
+
+        self.worker.heartbeat()
+        self.worker.refresh_from_db()
+        self.assertTrue(self.worker.alive)
+
+        self.worker.stop()
+        self.worker.refresh_from_db()
+        self.assertFalse(self.worker.alive)
+
+    def test_tests(self):
+        measurement = create_measurement()
+        self.worker.start_test(measurement)
+        self.assertEqual(Worker.objects.get().current_measurement, measurement)
+
+        self.worker.finish_test()
+        self.worker.finish_test()
+        worker = Worker.objects.get()
+        self.assertIsNone(worker.current_measurement)
+        self.assertEqual(worker.tests_finished, 2)
+
+    def test_tests_per_hour(self):
+        self.worker.started = timezone.now() - timedelta(hours=2)
+        self.worker.stopped = self.worker.started + timedelta(hours=1)
+        self.worker.tests_finished = 30
+        self.assertAlmostEqual(self.worker.tests_per_hour, 30.0)
+
+    def test_admin_alive_filter(self):
+        dead = Worker.objects.create(hostname='worker2', pid=2, last_heartbeat=timezone.now() - timedelta(hours=1))
+        stopped = Worker.objects.create(hostname='worker3', pid=3, stopped=timezone.now())
+
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        url = reverse('admin:v6score_worker_changelist')
+
+        response = self.client.get(url, {'alive': 'Y'})
+        self.assertEqual(list(response.context['cl'].queryset), [self.worker])
+
+        response = self.client.get(url, {'alive': 'N'})
+        self.assertEqual(set(response.context['cl'].queryset), {dead, stopped})
@@ -1,10 +1,21 @@
 from django.conf.urls import url
 
-from v6score import views
+from v6score import api, views
 
 urlpatterns = [
     url(r'^$', views.show_overview, name='overview'),
+    url(r'^export\.(csv|jsonl)$', views.export_measurements, name='export'),
     url(r'^measurement-(\d+)/$', views.show_measurement, name='measurement'),
+    url(r'^measurement-(\d+)/progress/$', views.show_measurement_progress, name='measurement_progress'),
+    url(r'^measurement-(\d+)/resources/$', views.show_measurement_resources, name='measurement_resources'),
     url(r'^measurement-(\d+)/raw/(v4only|v6only|nat64)/$', views.show_measurement_data, name='measurement_data'),
     url(r'^measurement-(\d+)/debug/(v4only|v6only|nat64)/$', views.show_measurement_debug, name='measurement_debug'),
+
+    url(r'^api/v1/measurements/$', api.api_measurements, name='api_measurements'),
+    url(r'^api/v1/measurements/(\d+)/$', api.api_measurement, name='api_measurement'),
+    url(r'^api/v1/measurements/(\d+)/results/$', api.api_measurement_results, name='api_measurement_results'),
+
+    url(r'^metrics/$', views.show_metrics, name='metrics'),
+
+    url(r'^screenshots/(cas/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+)$', views.show_screenshot, name='screenshot'),
 ]
@@ -175,3 +175,8 @@ def merge_resources(resources, new_resources, key):
         except KeyError:
             # No method or no URL: skip
             pass
+
+
+def resources_differ(resource, key, reference='v4only'):
+    # A resource that was only requested in one of the tests differs as well
+    return resource.get(key, {}).get('status_code') != resource.get(reference, {}).get('status_code')
@@ -1,13 +1,44 @@
-import json
+import hashlib
+import mimetypes
+import os
 
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import PermissionDenied, SuspiciousFileOperation
+from django.core.files.storage import default_storage
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
-from django.db.models.query_utils import Q
-from django.http.response import HttpResponse
+from django.db import connection
+from django.http.request import QueryDict
+from django.http.response import (FileResponse, Http404, HttpResponse, HttpResponseBadRequest, JsonResponse,
+                                  StreamingHttpResponse)
+from django.middleware.csrf import get_token
 from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.utils.safestring import mark_safe
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
+from django.views.static import serve
 
+from v6score.caching import (cache_forever, get_measurement_page, get_overview_fragment, get_overview_generation,
+                             overview_count_key, overview_fragment_key, set_measurement_page, set_overview_fragment)
+from v6score.export import EXPORT_FORMATS, export_lines
 from v6score.forms import URLForm
-from v6score.models import Measurement
-from v6score.utils import combine_resources
+from v6score.metrics import EXPOSITION_CONTENT_TYPE, queue_metrics
+from v6score.models import Measurement, ScreenshotAlias
+from v6score.progress import progress_events
+from v6score.renditions import rendition_name
+from v6score.projection import parse_fields, projection_sql
+from v6score.sendfile import media_access_allowed, sendfile_response
+from v6score.storage import screenshot_storage
+from v6score.utils import combine_resources, resources_differ
+
+RESOURCES_PER_PAGE = 50
+
+# Not every Python version knows this one
+mimetypes.add_type('image/webp', '.webp')
 
 
 def show_overview(request):
@@ -26,61 +57,46 @@ def show_overview(request):
     search_filter = request.GET.get('search', '').strip()
     test_filter = request.GET.get('test', '').strip()
     score_filter = request.GET.get('score', '').strip()
+    page = request.GET.get('page')
 
-    nat64_selected = (test_filter == 'nat64')
-    ipv6_selected = (test_filter == 'ipv6')
-    poor_selected = (score_filter == 'poor')
-    mediocre_selected = (score_filter == 'mediocre')
-    good_selected = (score_filter == 'good')
-
-    measurements = (Measurement.objects
-                    .filter(latest=True)
-                    .exclude(finished=None)
-                    .exclude(v6only_image_score=None, nat64_image_score=None)
-                    .order_by('-finished'))
-
-    if search_filter:
-        measurements = measurements.filter(url__contains=search_filter)
-
-    if nat64_selected:
-        if poor_selected:
-            measurements = measurements.filter(nat64_image_score__lt=0.8)
-        elif mediocre_selected:
-            measurements = measurements.filter(nat64_image_score__gte=0.8, nat64_image_score__lt=0.95)
-        elif good_selected:
-            measurements = measurements.filter(nat64_image_score__gte=0.95)
-        else:
-            measurements = measurements.exclude(nat64_image_score=None)
-    elif ipv6_selected:
-        if poor_selected:
-            measurements = measurements.filter(v6only_image_score__lt=0.8)
-        elif mediocre_selected:
-            measurements = measurements.filter(v6only_image_score__gte=0.8, v6only_image_score__lt=0.95)
-        elif good_selected:
-            measurements = measurements.filter(v6only_image_score__gte=0.95)
-        else:
-            measurements = measurements.exclude(v6only_image_score=None)
-    else:
-        if poor_selected:
-            measurements = measurements.filter(Q(nat64_image_score__lt=0.8) | Q(v6only_image_score__lt=0.8))
-        elif mediocre_selected:
-            measurements = measurements.filter(Q(nat64_image_score__gte=0.8, nat64_image_score__lt=0.95,
-                                                 v6only_image_score__gte=0.8) |
-                                               Q(v6only_image_score__gte=0.8, v6only_image_score__lt=0.95,
-                                                 nat64_image_score__gte=0.8))
-        elif good_selected:
-            measurements = measurements.filter(nat64_image_score__gte=0.95, v6only_image_score__gte=0.95)
+    # Only the parameters that influence the listing end up in links and in the cache key, the page links set their
+    # own page number
+    filter_query = QueryDict(mutable=True)
+    for key, value in (('search', search_filter), ('test', test_filter), ('score', score_filter)):
+        if value:
+            filter_query[key] = value
 
+    generation = get_overview_generation()
+    measurements = Measurement.objects.overview(search=search_filter, test=test_filter, score=score_filter)
     paginator = Paginator(measurements, per_page=50)
-    page = request.GET.get('page')
+
+    # Counting is expensive too, remember it along with the fragments
+    count_key = overview_count_key(generation, search=search_filter, test=test_filter, score=score_filter)
+    count = get_overview_fragment(count_key)
+    if count is None:
+        set_overview_fragment(count_key, paginator.count)
+    else:
+        paginator.count = count
+
+    # Resolve the page first, so every way of asking for the same page uses the same cached fragment
     try:
-        page_measurements = paginator.page(page)
+        page_number = paginator.validate_number(page)
     except PageNotAnInteger:
         # If page is not an integer, deliver first page.
-        page_measurements = paginator.page(1)
+        page_number = 1
     except EmptyPage:
         # If page is out of range (e.g. 9999), deliver last page of results.
-        page_measurements = paginator.page(paginator.num_pages)
+        page_number = paginator.num_pages
+
+    fragment_key = overview_fragment_key(generation, search=search_filter, test=test_filter, score=score_filter,
+                                         page=page_number)
+    results = get_overview_fragment(fragment_key)
+    if results is None:
+        results = render_to_string('v6score/overview_results.html', {
+            'filter_query': filter_query,
+            'measurements': paginator.page(page_number),
+        }, request)
+        set_overview_fragment(fragment_key, results)
 
     return render(request, 'v6score/overview.html', {
         'url_form': url_form,
@@ -90,40 +106,184 @@ def show_overview(request):
         'score': score_filter,
 
         'page': page,
-        'paginator': paginator,
+        'filter_query': filter_query,
 
-        'nat64_selected': nat64_selected,
-        'ipv6_selected': ipv6_selected,
-        'poor_selected': poor_selected,
-        'mediocre_selected': mediocre_selected,
-        'good_selected': good_selected,
+        'nat64_selected': test_filter == 'nat64',
+        'ipv6_selected': test_filter == 'ipv6',
+        'poor_selected': score_filter == 'poor',
+        'mediocre_selected': score_filter == 'mediocre',
+        'good_selected': score_filter == 'good',
 
-        'measurements': page_measurements,
+        'results': mark_safe(results),
     })
 
 
+# The export streams every matching measurement, it is meant for the people running the service
+@staff_member_required
+def export_measurements(request, export_format):
+    measurements = Measurement.objects.overview(search=request.GET.get('search', '').strip(),
+                                                test=request.GET.get('test', '').strip(),
+                                                score=request.GET.get('score', '').strip())
+
+    response = StreamingHttpResponse(export_lines(measurements, export_format),
+                                     content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = 'attachment; filename="nat64check.{}"'.format(export_format)
+    return response
+
+
 def show_measurement(request, measurement_id):
-    measurement = get_object_or_404(Measurement, pk=measurement_id)
-    resources = combine_resources(measurement.v4only_data, measurement.nat64_data, measurement.v6only_data)
-    return render(request, 'v6score/measurement.html', {
-        'measurement': measurement,
-        'resources': resources,
-        'url': measurement.url,
-    })
+    page = get_measurement_page(measurement_id)
+    if page is None:
+        measurement = get_object_or_404(Measurement, pk=measurement_id)
+
+        newer_measurement = None
+        if measurement.finished and not measurement.latest:
+            newer_measurement = (Measurement.objects
+                                 .filter(url=measurement.url, latest=True)
+                                 .exclude(pk=measurement.pk)
+                                 .first())
+
+        response = render(request, 'v6score/measurement.html', {
+            'measurement': measurement,
+            'newer_measurement': newer_measurement,
+            'url': measurement.url,
+            'csrf_cookie_name': settings.CSRF_COOKIE_NAME,
+
+            # The page is shared between visitors, don't put their messages in it
+            'messages': (),
+        })
+
+        if not measurement.finished:
+            # Still changing, the page reloads itself
+            return response
+
+        page = set_measurement_page(measurement, response.content)
 
+    last_modified = int(page['last_modified'].timestamp())
+    response = get_conditional_response(request, etag=page['etag'], last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(page['content'])
 
+    response['ETag'] = page['etag']
+    response['Last-Modified'] = http_date(last_modified)
+
+    if page['latest']:
+        # Will change once when a newer measurement finishes, let clients revalidate
+        patch_cache_control(response, public=True, max_age=settings.LATEST_MEASUREMENT_MAX_AGE)
+    else:
+        cache_forever(response)
+
+    # The retest form takes its CSRF token from the cookie, make sure there is one
+    if settings.CSRF_COOKIE_NAME not in request.COOKIES:
+        get_token(request)
+        patch_cache_control(response, private=True)
+
+    return response
+
+
+def show_measurement_progress(request, measurement_id):
+    """
+    Server-sent events with the progress of the measurement, so its page doesn't have to reload until it's done
+    """
+    if not Measurement.objects.filter(pk=measurement_id).exists():
+        raise Http404
+
+    response = StreamingHttpResponse(progress_events(int(measurement_id)), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+
+    # Tell nginx not to buffer the events
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def measurement_finished(request, measurement_id):
+    # Remember the result, it is needed for both the ETag and the Last-Modified header
+    if not hasattr(request, 'measurement_finished'):
+        request.measurement_finished = (Measurement.objects
+                                        .filter(pk=measurement_id)
+                                        .values_list('finished', flat=True)
+                                        .first())
+    return request.measurement_finished
+
+
+# noinspection PyUnusedLocal
+def measurement_etag(request, measurement_id, *args):
+    finished = measurement_finished(request, measurement_id)
+    if not finished:
+        return None
+
+    # The same measurement can be requested with different projections, filters etc
+    path_hash = hashlib.sha1(request.get_full_path().encode('utf-8')).hexdigest()[:12]
+    return '{}-{}-{}'.format(measurement_id, int(finished.timestamp()), path_hash)
+
+
+# noinspection PyUnusedLocal
+def measurement_last_modified(request, measurement_id, *args):
+    return measurement_finished(request, measurement_id)
+
+
+@gzip_page
+@condition(etag_func=measurement_etag, last_modified_func=measurement_last_modified)
 def show_measurement_data(request, measurement_id, dataset):
+    if dataset not in ('v4only', 'v6only', 'nat64'):
+        raise Http404
+
+    table = connection.ops.quote_name(Measurement._meta.db_table)
+    column = connection.ops.quote_name('{}_data'.format(dataset))
+    select, params = column, []
+
+    fields = request.GET.get('fields', '').strip()
+    if fields:
+        try:
+            select, params = projection_sql(column, parse_fields(fields))
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e), content_type='text/plain')
+
+    # Let PostgreSQL produce the JSON text, there is no need to decode and encode it again here
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT ({})::text FROM {} WHERE id = %s'.format(select, table),
+                       params + [measurement_id])
+        row = cursor.fetchone()
+
+    if row is None:
+        raise Http404
+
+    response = HttpResponse(row[0] or 'null', content_type='application/json')
+    if measurement_finished(request, measurement_id):
+        cache_forever(response)
+
+    return response
+
+
+@gzip_page
+@condition(etag_func=measurement_etag, last_modified_func=measurement_last_modified)
+def show_measurement_resources(request, measurement_id):
     measurement = get_object_or_404(Measurement, pk=measurement_id)
-    if dataset == 'v4only':
-        data = measurement.v4only_data
-    elif dataset == 'v6only':
-        data = measurement.v6only_data
-    elif dataset == 'nat64':
-        data = measurement.nat64_data
-    else:
-        data = None
+    resources = combine_resources(measurement.v4only_data, measurement.nat64_data, measurement.v6only_data)
 
-    return HttpResponse(json.dumps(data, indent=4), content_type='application/json')
+    # Only show resources where the result differs from IPv4-only
+    differs = request.GET.get('differs', '')
+    if differs in ('v6only', 'nat64'):
+        resources = [resource for resource in resources if resources_differ(resource, differs)]
+
+    paginator = Paginator(resources, per_page=RESOURCES_PER_PAGE)
+    try:
+        page_resources = paginator.page(request.GET.get('page'))
+    except PageNotAnInteger:
+        page_resources = paginator.page(1)
+    except EmptyPage:
+        page_resources = paginator.page(paginator.num_pages)
+
+    response = JsonResponse({
+        'count': paginator.count,
+        'page': page_resources.number,
+        'num_pages': paginator.num_pages,
+        'resources': page_resources.object_list,
+    })
+    if measurement.finished:
+        cache_forever(response)
+
+    return response
 
 
 def show_measurement_debug(request, measurement_id, dataset):
@@ -138,3 +298,100 @@ def show_measurement_debug(request, measurement_id, dataset):
         data = ''
 
     return HttpResponse(data, content_type='text/plain')
+
+
+def show_metrics(request):
+    """
+    The health of the queue and the workers, for Prometheus to scrape
+    """
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise PermissionDenied
+
+    response = HttpResponse(queue_metrics().exposition(), content_type=EXPOSITION_CONTENT_TYPE)
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def replaced_media_url(path):
+    """
+    Where a screenshot or rendition that was replaced by a re-encoded version went, if it was
+    """
+    alias = ScreenshotAlias.objects.filter(name=path).first()
+    if alias:
+        return screenshot_storage.url(alias.new_name)
+
+    # Renditions are named after the screenshot without its extension
+    for size in settings.SCREENSHOT_RENDITIONS:
+        prefix = 'renditions/{}/'.format(size)
+        if path.startswith(prefix) and path.endswith('.jpg'):
+            alias = ScreenshotAlias.objects.filter(name__startswith=path[len(prefix):-len('.jpg')] + '.').first()
+            if alias:
+                return default_storage.url(rendition_name(alias.new_name, size))
+
+    return None
+
+
+def replaced_media_redirect(path):
+    url = replaced_media_url(path)
+    if url is None:
+        raise Http404
+    return redirect(url, permanent=True)
+
+
+def show_screenshot(request, name):
+    """
+    Serve a screenshot straight from the memory mapped segment it is packed in. WSGI wants bytes, so every block is
+    still copied once, but the file is never read into memory as a whole. Screenshots that aren't packed yet are
+    handed to the web server when MEDIA_SENDFILE is set.
+    """
+    if not media_access_allowed(request, name):
+        raise PermissionDenied
+
+    # The name is the hash of the content, so it makes a perfect ETag
+    etag = '"{}"'.format(name.rsplit('/', 1)[-1])
+    response = get_conditional_response(request, etag=etag)
+    if response is None and settings.MEDIA_SENDFILE and not screenshot_storage.is_packed(name):
+        if not screenshot_storage.exists(name):
+            return replaced_media_redirect(name)
+        response = sendfile_response(name)
+
+    if response is None:
+        try:
+            screenshot = screenshot_storage.open(name)
+        except FileNotFoundError:
+            return replaced_media_redirect(name)
+
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        response = FileResponse(screenshot, content_type=content_type)
+        response['Content-Length'] = screenshot.size
+
+    response['ETag'] = etag
+    cache_forever(response, private=bool(settings.MEDIA_ACCESS_CHECK))
+    return response
+
+
+def serve_media(request, path):
+    """
+    Serve files from MEDIA_ROOT, through the front-end web server when MEDIA_SENDFILE is set. Media files never change
+    after they have been created, so they can be cached forever.
+    """
+    if not media_access_allowed(request, path):
+        raise PermissionDenied
+
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+
+    if os.path.basename(full_path).startswith('.'):
+        raise Http404
+    if not os.path.isfile(full_path):
+        return replaced_media_redirect(path)
+
+    if settings.MEDIA_SENDFILE:
+        response = sendfile_response(path)
+    else:
+        response = serve(request, path, document_root=settings.MEDIA_ROOT)
+
+    cache_forever(response, private=bool(settings.MEDIA_ACCESS_CHECK))
+    return response